@@ -1,75 +1,453 @@
 import requests
+import requests.adapters
 import logging
-import os
-from typing import Dict
-import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
 from telegram_hotels_bot import config
+from telegram_hotels_bot.api_requests import response_cache
+from telegram_hotels_bot.utils import metrics, refreshing_cache
 
-"""Файл с запросами к Hotel Api"""
-log_path = os.path.join('api_requests/', 'logg_requests.log')
+"""
+Файл с запросами к Hotel Api. Каждый запрос записывается в лог (уровень INFO) с полями endpoint,
+status, attempt и duration, ошибки попыток - с уровнем ERROR (см. utils/logs.py).
+"""
 
-logging.basicConfig(
-        filename=log_path,
-        level=logging.ERROR,
-        filemode='a',
-        format="%(asctime)s - %(levelname)s - %(message)s")
+LOCATIONS_SEARCH = 'locations/v3/search'
+PROPERTIES_LIST = 'properties/v2/list'
+PROPERTIES_DETAIL = 'properties/v2/detail'
+CURRENCY_CONVERT = 'currency_data/convert'
 
+CACHE_TTLS = {PROPERTIES_LIST: config.list_cache_ttl, PROPERTIES_DETAIL: config.detail_cache_ttl}
 
-def get_request(url: str, headers: Dict[str, str], querystring: Dict[str, str]) -> Dict:
-    """Отправляет запрос с тегом GET"""
-    result = None
+RATE_RETRY_AFTER_ERROR = 5 * 60
 
-    try:
-        response = requests.request("GET", url=url, headers=headers, params=querystring)
-        result = response.json()
-        if 'errors' in result.keys() or result is None:
-            raise ValueError
+responses = response_cache.ResponseCache(config.response_cache_size, config.response_cache_dir,
+                                         config.response_cache_disk_size)
 
-    except requests.Timeout as time_end:
-        logging.error(time_end)
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
 
-    except requests.RequestException as exc:
-        logging.error(exc)
 
-    except ValueError:
-        result = get_request(url, headers, querystring)
-        return result
+def create_session(headers: Dict[str, str]) -> requests.Session:
+    """Создает сессию с пулом постоянных соединений и заданными заголовками"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=config.http_pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(headers)
+    return session
+
+
+def get_session(base_url: str) -> requests.Session:
+    """
+    Возвращает общую для всех потоков сессию для хоста base_url. Заголовки с ключами API
+    задаются один раз при создании сессии.
+    """
+    session = _sessions.get(base_url)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(base_url)
+            if session is None:
+                session = create_session(api_headers(base_url))
+                _sessions[base_url] = session
+    return session
+
+
+def api_headers(base_url: str) -> Dict[str, str]:
+    """Возвращает заголовки с ключом API для хоста base_url"""
+    if base_url == config.currency_api_url:
+        return {"apikey": config.api_key_for_currency}
+    return {"X-RapidAPI-Key": config.rapidAPI_key, "X-RapidAPI-Host": config.hotels_api_host}
+
+
+def close_sessions() -> None:
+    """Закрывает все сессии (например, после изменения адресов или ключей API в config)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_timeout() -> Tuple[float, float]:
+    """Возвращает таймауты соединения и чтения ответа"""
+    return config.http_connect_timeout, config.http_read_timeout
+
+
+class RetryableError(Exception):
+    """Ошибка, после которой запрос можно повторить"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """
+    Класс RetryPolicy. Определяет количество попыток запроса и паузы между ними
+    (экспоненциальный рост с случайным разбросом).
+    Arguments:
+        self.max_attempts (int): максимальное количество попыток.
+        self.base_delay (float): пауза перед первым повтором в секундах.
+        self.max_delay (float): максимальная пауза в секундах.
+        self.max_retry_after (float): максимальная пауза, запрошенная сервером в заголовке Retry-After.
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, max_retry_after: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Возвращает паузу перед повтором номер attempt (начиная с 0)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Класс CircuitBreaker. Перестает пропускать запросы к эндпоинту после failure_threshold неудачных
+    запросов подряд. Через reset_timeout секунд пропускает один пробный запрос: если он успешен,
+    запросы снова пропускаются.
+    Arguments:
+        self._failure_threshold (int): количество неудачных запросов подряд, после которого запросы блокируются.
+        self._reset_timeout (float): время блокировки в секундах.
+        self._failures (int): текущее количество неудачных запросов подряд.
+        self._opened_at (Optional[float]): время начала блокировки.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Проверяет, можно ли отправить запрос"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+
+            if time.monotonic() - self._opened_at >= self._reset_timeout and not self._trial_running:
+                self._trial_running = True
+                return True
+
+            return False
+
+    def record_success(self) -> None:
+        """Отмечает успешный запрос"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """Отмечает неудачный запрос. Возвращает True, если после него запросы блокируются"""
+        with self._lock:
+            self._failures += 1
+            was_trial = self._trial_running
+            self._trial_running = False
+
+            if was_trial or (self._opened_at is None and self._failures >= self._failure_threshold):
+                self._opened_at = time.monotonic()
+                return True
+
+            return False
+
+
+class _Flight:
+    """Запрос, который выполняется сейчас: его результат или исключение и событие завершения"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Класс SingleFlight. Объединяет одновременные одинаковые запросы: пока запрос с ключом key
+    выполняется, другие вызовы с тем же ключом не отправляют свой запрос, а ждут и получают его результат.
+    Arguments:
+        self._flights (Dict[str, _Flight]): выполняющиеся запросы по ключам.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Выполняет function, если запрос с ключом key сейчас не выполняется, иначе ждет его результата.
+        Возвращает результат и флаг: True, если результат получен от другого вызова.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result, False
+
+
+retry_policy = RetryPolicy(max_attempts=config.retry_max_attempts, base_delay=config.retry_base_delay,
+                           max_delay=config.retry_max_delay, max_retry_after=config.retry_max_retry_after)
+
+in_flight = SingleFlight()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_request_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Возвращает CircuitBreaker эндпоинта"""
+    with _stats_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(config.breaker_failure_threshold, config.breaker_reset_timeout)
+            _breakers[endpoint] = breaker
+        return breaker
 
+
+def count_event(endpoint: str, event: str) -> None:
+    """Увеличивает счетчик события (requests, retries, failures, trips, rejected) эндпоинта"""
+    with _stats_lock:
+        endpoint_stats = _request_stats.setdefault(
+            endpoint, {'requests': 0, 'retries': 0, 'failures': 0, 'trips': 0, 'rejected': 0}
+        )
+        endpoint_stats[event] += 1
+
+
+def get_request_stats() -> Dict[str, Dict[str, int]]:
+    """Возвращает копию счетчиков запросов, повторов и срабатываний CircuitBreaker по эндпоинтам"""
+    with _stats_lock:
+        return {endpoint: dict(endpoint_stats) for endpoint, endpoint_stats in _request_stats.items()}
+
+
+def collect_request_stats() -> None:
+    """Переносит счетчики get_request_stats в метрику UPSTREAM_EVENTS перед выводом метрик"""
+    for endpoint, endpoint_stats in get_request_stats().items():
+        for event, count in endpoint_stats.items():
+            metrics.UPSTREAM_EVENTS.set(count, endpoint=endpoint, event=event)
+
+
+metrics.REGISTRY.on_collect(collect_request_stats)
+
+
+def parse_retry_after(headers: Dict[str, str]) -> Optional[float]:
+    """Возвращает паузу в секундах из заголовка Retry-After"""
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def send_request(method: str, base_url: str, endpoint: str, **kwargs) -> Optional[Dict]:
+    """
+    Отправляет запрос к эндпоинту с повторами по правилам retry_policy. Повторяет запрос при ошибках
+    соединения, ответах 429 и 5xx и ответах с ключом errors. Возвращает None, если ответ получить
+    не удалось или CircuitBreaker эндпоинта блокирует запросы. Время запроса вместе с повторами
+    записывается в метрики с итоговым статусом и количеством повторов.
+    """
+    started = time.perf_counter()
+    result, status, attempts = send_with_retries(method, base_url, endpoint, **kwargs)
+    metrics.observe_upstream(endpoint, status, max(attempts - 1, 0), time.perf_counter() - started)
+    logging.info(f'{endpoint}: {status}', extra=log_fields(endpoint, status, attempts, started))
     return result
 
 
-def post_request(url: str, payload: Dict[str, str], headers: Dict[str, str]) -> Dict:
-    """Отправляет запрос с тегом POST"""
-    result = None
+def log_fields(endpoint: str, status: str, attempt: int, started: float) -> Dict:
+    """Возвращает поля записи лога о запросе, начатом в started (time.perf_counter)"""
+    return {'endpoint': endpoint, 'status': status, 'attempt': attempt,
+            'duration': round(time.perf_counter() - started, 4)}
+
+
+def send_with_retries(method: str, base_url: str, endpoint: str, **kwargs) -> Tuple[Optional[Dict], str, int]:
+    """
+    Выполняет попытки запроса для send_request. Возвращает ответ (или None), статус последней
+    попытки (код ответа, errors, exception или rejected) и количество попыток.
+    """
+    breaker = get_breaker(endpoint)
+    if not breaker.allow():
+        count_event(endpoint, 'rejected')
+        logging.error(f'{endpoint}: circuit breaker is open, request rejected', extra={'endpoint': endpoint})
+        return None, 'rejected', 0
 
     try:
-        response = requests.request("POST", url=url, json=payload, headers=headers)
+        return _attempt_requests(breaker, method, base_url, endpoint, **kwargs)
 
-        result = response.json()
+    except BaseException:
+        # Неожиданное исключение не должно оставлять CircuitBreaker в состоянии пробного запроса
+        count_event(endpoint, 'failures')
+        if breaker.record_failure():
+            count_event(endpoint, 'trips')
+        raise
 
-    except requests.Timeout as time_end:
-        logging.error(time_end)
 
-    except requests.RequestException as exc:
-        logging.error(exc)
+def _attempt_requests(breaker: CircuitBreaker, method: str, base_url: str, endpoint: str,
+                      **kwargs) -> Tuple[Optional[Dict], str, int]:
+    """Выполняет попытки запроса, пропущенного breaker, для send_with_retries"""
+    url = f'{base_url}/{endpoint}'
+    session = get_session(base_url)
+    status = 'exception'
+
+    for attempt in range(retry_policy.max_attempts):
+        count_event(endpoint, 'requests')
+        retry_after = None
+        attempt_started = time.perf_counter()
+
+        try:
+            response = session.request(method, url, timeout=get_timeout(), **kwargs)
+            status = str(response.status_code)
+
+            if response.status_code == 429 or response.status_code >= 500:
+                raise RetryableError(f'status {response.status_code}', parse_retry_after(response.headers))
+
+            if response.status_code >= 400:
+                logging.error(f'{endpoint}: status {response.status_code}',
+                              extra=log_fields(endpoint, status, attempt + 1, attempt_started))
+                breaker.record_success()
+                return None, status, attempt + 1
+
+            result = response.json()
+            if result is None or 'errors' in result.keys():
+                status = 'errors'
+                raise RetryableError('errors in response')
+
+            breaker.record_success()
+            return result, status, attempt + 1
+
+        except RetryableError as exc:
+            retry_after = exc.retry_after
+            logging.error(f'{endpoint}: {exc} (attempt {attempt + 1})',
+                          extra=log_fields(endpoint, status, attempt + 1, attempt_started))
 
+        except (requests.RequestException, ValueError, AttributeError) as exc:
+            status = 'exception'
+            logging.error(f'{endpoint}: {exc} (attempt {attempt + 1})',
+                          extra=log_fields(endpoint, status, attempt + 1, attempt_started))
+
+        if attempt + 1 < retry_policy.max_attempts:
+            count_event(endpoint, 'retries')
+            time.sleep(retry_policy.delay(attempt, retry_after))
+
+    count_event(endpoint, 'failures')
+    if breaker.record_failure():
+        count_event(endpoint, 'trips')
+
+    return None, status, retry_policy.max_attempts
+
+
+def coalesce(key: str, endpoint: str, function: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    """
+    Выполняет запрос function через in_flight: одновременные запросы с тем же ключом (response_cache.make_key)
+    получают результат одного запроса. Отключается в config.request_coalescing.
+    """
+    if not config.request_coalescing:
+        return function()
+
+    result, is_shared = in_flight.do(key, function)
+    if is_shared:
+        metrics.UPSTREAM_COALESCED.inc(endpoint=endpoint)
     return result
 
 
-def get_converted_price(amount):
-    """Отправляет запрос для конвертации цены"""
-    url = f"https://api.apilayer.com/currency_data/convert?to=RUB&from=USD&amount={amount}"
+def get_request(endpoint: str, querystring: Dict[str, str]) -> Optional[Dict]:
+    """
+    Отправляет запрос с тегом GET к эндпоинту Hotels Api. Одновременные одинаковые запросы
+    объединяются (coalesce).
+    """
+    return coalesce(response_cache.make_key(endpoint, querystring), endpoint,
+                    lambda: send_request('GET', config.hotels_api_url, endpoint, params=querystring))
+
+
+def post_request(endpoint: str, payload: Dict[str, str]) -> Optional[Dict]:
+    """
+    Отправляет запрос с тегом POST к эндпоинту Hotels Api. Ответы списка отелей и данных отеля
+    сохраняются в response_cache и при повторном таком же запросе берутся из него.
+    Одновременные одинаковые запросы объединяются (coalesce).
+    """
+    key = response_cache.make_key(endpoint, payload)
+    ttl = CACHE_TTLS.get(endpoint)
+    if ttl is None:
+        return coalesce(key, endpoint, lambda: send_request('POST', config.hotels_api_url, endpoint, json=payload))
+
+    result = responses.get(key)
+    metrics.count_cache('responses', hit=result is not None)
+    if result is not None:
+        return result
+
+    def fetch() -> Optional[Dict]:
+        # ответ мог сохраниться, пока этот вызов ждал своей очереди
+        cached = responses.get(key)
+        if cached is not None:
+            return cached
+
+        fetched = send_request('POST', config.hotels_api_url, endpoint, json=payload)
+        if fetched is not None:
+            responses.set(key, fetched, ttl)
+        return fetched
+
+    return coalesce(key, endpoint, fetch)
+
 
-    payload = {}
+def fetch_usd_rub_rate() -> Optional[float]:
+    """Отправляет запрос для получения курса USD→RUB"""
+    querystring = {'to': 'RUB', 'from': 'USD', 'amount': 1}
+    result = send_request('GET', config.currency_api_url, CURRENCY_CONVERT, params=querystring)
 
-    headers = {
-        "apikey": config.api_key_for_currency
-    }
+    try:
+        return float(result.get('result'))
 
-    response = requests.request("GET", url, headers=headers, data=payload)
+    except (AttributeError, ValueError, TypeError) as exc:
+        logging.error(exc)
 
-    status_code = response.status_code
-    if status_code == 200:
-        result = json.loads(response.text)
-        return round(result.get('result'), 2)
     return None
+
+
+def make_rate_cache(path: str, refresh_interval: float) -> refreshing_cache.RefreshingFileCache:
+    """
+    Создает кэш курса USD→RUB: курс обновляется не чаще, чем раз в refresh_interval секунд, сохраняется
+    в файл path и остается в силе, если API конвертации недоступен. Ждать ответа API приходится,
+    только пока курс еще ни разу не был получен.
+    """
+    return refreshing_cache.RefreshingFileCache(path, 'rate', refresh_interval, fetch=fetch_usd_rub_rate, parse=float,
+                                                retry_after_error=RATE_RETRY_AFTER_ERROR, cache_name='currency_rate',
+                                                thread_name='currency-rate')
+
+
+_rate_cache = make_rate_cache(config.currency_rate_cache_path, config.currency_rate_refresh_interval)
+
+
+def get_converted_price(amount: float) -> Optional[float]:
+    """Конвертирует цену из долларов в рубли по сохраненному курсу"""
+    rate = _rate_cache.get()
+    if rate is None:
+        return None
+    return round(amount * rate, 2)
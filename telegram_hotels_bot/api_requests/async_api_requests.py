@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import aiohttp
+from telegram_hotels_bot import config
+from telegram_hotels_bot.api_requests import api_requests, response_cache
+from telegram_hotels_bot.utils import metrics
+
+"""
+Файл с асинхронными запросами к Hotel Api. Использует те же правила повторов, CircuitBreaker,
+счетчики и кэш ответов, что и синхронные запросы в api_requests.py.
+"""
+
+_sessions: Dict[str, aiohttp.ClientSession] = {}
+_semaphore: Optional[asyncio.Semaphore] = None
+_in_flight: Dict[str, asyncio.Task] = {}
+
+
+def get_session(base_url: str) -> aiohttp.ClientSession:
+    """Возвращает сессию с пулом постоянных соединений для хоста base_url"""
+    session = _sessions.get(base_url)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=config.http_pool_size)
+        timeout = aiohttp.ClientTimeout(sock_connect=config.http_connect_timeout,
+                                        sock_read=config.http_read_timeout)
+        session = aiohttp.ClientSession(headers=api_requests.api_headers(base_url),
+                                        connector=connector, timeout=timeout)
+        _sessions[base_url] = session
+    return session
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Возвращает семафор, ограничивающий количество одновременных запросов"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.async_http_concurrency)
+    return _semaphore
+
+
+async def close_sessions() -> None:
+    """Закрывает все сессии"""
+    for session in _sessions.values():
+        await session.close()
+    _sessions.clear()
+
+
+async def send_request(method: str, base_url: str, endpoint: str, **kwargs) -> Optional[Dict]:
+    """
+    Асинхронно отправляет запрос к эндпоинту с повторами по правилам api_requests.retry_policy.
+    Возвращает None, если ответ получить не удалось или CircuitBreaker эндпоинта блокирует запросы.
+    Время запроса вместе с повторами записывается в метрики, как в api_requests.send_request.
+    """
+    started = time.perf_counter()
+    result, status, attempts = await send_with_retries(method, base_url, endpoint, **kwargs)
+    metrics.observe_upstream(endpoint, status, max(attempts - 1, 0), time.perf_counter() - started)
+    logging.info(f'{endpoint}: {status}', extra=api_requests.log_fields(endpoint, status, attempts, started))
+    return result
+
+
+async def send_with_retries(method: str, base_url: str, endpoint: str,
+                            **kwargs) -> Tuple[Optional[Dict], str, int]:
+    """
+    Выполняет попытки запроса для send_request. Возвращает ответ (или None), статус последней
+    попытки и количество попыток.
+    """
+    breaker = api_requests.get_breaker(endpoint)
+    if not breaker.allow():
+        api_requests.count_event(endpoint, 'rejected')
+        logging.error(f'{endpoint}: circuit breaker is open, request rejected', extra={'endpoint': endpoint})
+        return None, 'rejected', 0
+
+    try:
+        return await _attempt_requests(breaker, method, base_url, endpoint, **kwargs)
+
+    except BaseException:
+        # Неожиданное исключение или отмена задачи не должны оставлять CircuitBreaker в состоянии пробного запроса
+        api_requests.count_event(endpoint, 'failures')
+        if breaker.record_failure():
+            api_requests.count_event(endpoint, 'trips')
+        raise
+
+
+async def _attempt_requests(breaker: api_requests.CircuitBreaker, method: str, base_url: str, endpoint: str,
+                            **kwargs) -> Tuple[Optional[Dict], str, int]:
+    """Выполняет попытки запроса, пропущенного breaker, для send_with_retries"""
+    url = f'{base_url}/{endpoint}'
+    session = get_session(base_url)
+    retry_policy = api_requests.retry_policy
+    status = 'exception'
+
+    for attempt in range(retry_policy.max_attempts):
+        api_requests.count_event(endpoint, 'requests')
+        retry_after = None
+        attempt_started = time.perf_counter()
+
+        try:
+            async with get_semaphore():
+                async with session.request(method, url, **kwargs) as response:
+                    status = str(response.status)
+                    if response.status == 429 or response.status >= 500:
+                        raise api_requests.RetryableError(f'status {response.status}',
+                                                          api_requests.parse_retry_after(response.headers))
+
+                    if response.status >= 400:
+                        logging.error(f'{endpoint}: status {response.status}',
+                                      extra=api_requests.log_fields(endpoint, status, attempt + 1, attempt_started))
+                        breaker.record_success()
+                        return None, status, attempt + 1
+
+                    result = await response.json(content_type=None)
+
+            if result is None or 'errors' in result.keys():
+                status = 'errors'
+                raise api_requests.RetryableError('errors in response')
+
+            breaker.record_success()
+            return result, status, attempt + 1
+
+        except api_requests.RetryableError as exc:
+            retry_after = exc.retry_after
+            logging.error(f'{endpoint}: {exc} (attempt {attempt + 1})',
+                          extra=api_requests.log_fields(endpoint, status, attempt + 1, attempt_started))
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError) as exc:
+            status = 'exception'
+            logging.error(f'{endpoint}: {exc!r} (attempt {attempt + 1})',
+                          extra=api_requests.log_fields(endpoint, status, attempt + 1, attempt_started))
+
+        if attempt + 1 < retry_policy.max_attempts:
+            api_requests.count_event(endpoint, 'retries')
+            await asyncio.sleep(retry_policy.delay(attempt, retry_after))
+
+    api_requests.count_event(endpoint, 'failures')
+    if breaker.record_failure():
+        api_requests.count_event(endpoint, 'trips')
+
+    return None, status, retry_policy.max_attempts
+
+
+async def coalesce(key: str, endpoint: str, request: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+    """
+    Асинхронная версия api_requests.coalesce. Запрос выполняется в отдельной задаче, которую ждут
+    все одновременные вызовы с тем же ключом, поэтому отмена одного из них не отменяет запрос для остальных.
+    """
+    if not config.request_coalescing:
+        return await request()
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(request())
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        metrics.UPSTREAM_COALESCED.inc(endpoint=endpoint)
+
+    return await asyncio.shield(task)
+
+
+async def get_request(endpoint: str, querystring: Dict[str, str]) -> Optional[Dict]:
+    """
+    Асинхронно отправляет запрос с тегом GET к эндпоинту Hotels Api. Одновременные одинаковые
+    запросы объединяются (coalesce).
+    """
+    return await coalesce(response_cache.make_key(endpoint, querystring), endpoint,
+                          lambda: send_request('GET', config.hotels_api_url, endpoint, params=querystring))
+
+
+async def post_request(endpoint: str, payload: Dict[str, str]) -> Optional[Dict]:
+    """
+    Асинхронно отправляет запрос с тегом POST к эндпоинту Hotels Api. Ответы списка отелей и данных
+    отеля берутся из общего с синхронными запросами кэша api_requests.responses.
+    Одновременные одинаковые запросы объединяются (coalesce).
+    """
+    key = response_cache.make_key(endpoint, payload)
+    ttl = api_requests.CACHE_TTLS.get(endpoint)
+    if ttl is None:
+        return await coalesce(key, endpoint,
+                              lambda: send_request('POST', config.hotels_api_url, endpoint, json=payload))
+
+    result = api_requests.responses.get(key)
+    metrics.count_cache('responses', hit=result is not None)
+    if result is not None:
+        return result
+
+    async def fetch() -> Optional[Dict]:
+        # ответ мог сохраниться, пока эта задача ждала своей очереди
+        cached = api_requests.responses.get(key)
+        if cached is not None:
+            return cached
+
+        fetched = await send_request('POST', config.hotels_api_url, endpoint, json=payload)
+        if fetched is not None:
+            api_requests.responses.set(key, fetched, ttl)
+        return fetched
+
+    return await coalesce(key, endpoint, fetch)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+from telegram_hotels_bot.utils import ttl_cache
+
+"""Файл с кэшем ответов Hotels Api, ключ которого вычисляется по содержимому запроса"""
+
+PRUNE_EVERY = 100
+TMP_MAX_AGE = 60
+
+
+def make_key(endpoint: str, payload: Dict[str, Any]) -> str:
+    """
+    Вычисляет ключ запроса: хэш эндпоинта и данных запроса, приведенных к каноническому виду
+    (ключи словарей отсортированы, без лишних пробелов).
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(f'{endpoint}\n{canonical}'.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Класс ResponseCache. Хранит ответы в памяти (LRU с ограничением количества записей) и,
+    если задана папка disk_path, дополнительно на диске. Время модификации файла записи на диске
+    равно времени ее устаревания, поэтому устаревшие записи удаляются (prune) без чтения файлов.
+    Arguments:
+        self._memory (TTLCache): записи в памяти.
+        self._disk_path (Optional[str]): папка для записей на диске.
+        self._disk_maxsize (Optional[int]): наибольшее количество записей на диске.
+        self._writes (int): количество записей на диск с последней очистки.
+    """
+
+    def __init__(self, maxsize: int, disk_path: Optional[str] = None, disk_maxsize: Optional[int] = None):
+        self._memory = ttl_cache.TTLCache(maxsize=maxsize, ttl=0)
+        self._disk_path = disk_path
+        self._disk_maxsize = disk_maxsize
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        if disk_path is not None:
+            os.makedirs(disk_path, exist_ok=True)
+            self.prune()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Возвращает сохраненный ответ или None, если его нет или он устарел"""
+        response = self._memory.get(key)
+        if response is not None or self._disk_path is None:
+            return response
+
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as cache_file:
+                entry = json.load(cache_file)
+            ttl_left = entry['expires_at'] - time.time()
+            response = entry['response']
+
+        except OSError:
+            return None
+
+        except (ValueError, KeyError, TypeError) as exc:
+            # запись другого формата или поврежденный файл считается отсутствующей записью
+            logging.error(f'response cache: bad entry {file_path}: {exc!r}')
+            _remove(file_path)
+            return None
+
+        if ttl_left <= 0:
+            return None
+
+        self._memory.set(key, response, ttl=ttl_left)
+        return response
+
+    def set(self, key: str, response: Dict, ttl: float) -> None:
+        """Сохраняет ответ на ttl секунд"""
+        self._memory.set(key, response, ttl=ttl)
+        if self._disk_path is None:
+            return
+
+        expires_at = time.time() + ttl
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._disk_path, prefix=f'{key}.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as cache_file:
+                    json.dump({'expires_at': expires_at, 'response': response}, cache_file, ensure_ascii=False)
+                os.utime(tmp_path, (expires_at, expires_at))
+                os.replace(tmp_path, self._file_path(key))
+
+            except BaseException:
+                _remove(tmp_path)
+                raise
+
+        except OSError as exc:
+            logging.error(exc)
+            return
+
+        with self._writes_lock:
+            self._writes += 1
+            need_prune = self._writes >= PRUNE_EVERY
+            if need_prune:
+                self._writes = 0
+
+        if need_prune:
+            self.prune()
+
+    def prune(self) -> None:
+        """
+        Удаляет с диска устаревшие записи и оставшиеся после сбоев временные файлы, а если записей
+        больше disk_maxsize, то и записи, которые устареют раньше остальных.
+        """
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self._disk_path) as dir_entries:
+                for dir_entry in dir_entries:
+                    try:
+                        expires_at = dir_entry.stat().st_mtime
+                    except OSError:
+                        continue
+
+                    if dir_entry.name.endswith('.tmp'):
+                        if now - expires_at > TMP_MAX_AGE:
+                            _remove(dir_entry.path)
+
+                    elif dir_entry.name.endswith('.json'):
+                        if expires_at <= now:
+                            _remove(dir_entry.path)
+                        else:
+                            entries.append((expires_at, dir_entry.path))
+
+        except OSError as exc:
+            logging.error(exc)
+            return
+
+        if self._disk_maxsize is not None and len(entries) > self._disk_maxsize:
+            entries.sort()
+            for _, path in entries[:len(entries) - self._disk_maxsize]:
+                _remove(path)
+
+    def clear(self) -> None:
+        """Удаляет записи из памяти"""
+        self._memory.clear()
+
+    def _file_path(self, key: str) -> str:
+        """Возвращает путь к файлу записи на диске"""
+        return os.path.join(self._disk_path, f'{key}.json')
+
+
+def _remove(path: str) -> None:
+    """Удаляет файл, если он еще существует"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logging.error(exc)
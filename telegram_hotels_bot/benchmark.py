@@ -0,0 +1,8 @@
+import config
+from telegram_hotels_bot.benchmarks import bench
+import sys
+
+
+"""Файл benchmark. Служит для запуска бенчмарка команд бота без доступа к сети (benchmarks/bench.py)"""
+if __name__ == '__main__':
+    sys.exit(bench.main())
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+from telegram_hotels_bot import config
+from telegram_hotels_bot.api_requests import api_requests
+from telegram_hotels_bot.benchmarks import fake_backend
+from telegram_hotels_bot.bot import commands, location_search
+from telegram_hotels_bot.user import user
+from telegram_hotels_bot.utils import logs
+
+"""
+Файл с бенчмарком команд бота без доступа к сети. Запросы к Hotels Api и Currency Data API
+отправляются на локальный FakeBackend, который отвечает записанными (или созданными synthetic_recordings)
+ответами с заданной задержкой и долей ошибок. Для каждого сценария (location_search, commands.price_list
+с low_price и high_price, commands.best_deal) бенчмарк выводит p50/p99 времени выполнения, количество
+запросов к API по эндпоинтам и пиковое потребление памяти процессом.
+
+Запуск из папки telegram_hotels_bot:
+    python benchmark.py --iterations 50 --latency 0.05 --error-rate 0.01
+"""
+
+SCENARIOS = ('location', 'low', 'high', 'best')
+
+DEFAULT_CITIES = ('Малага', 'Барселона', 'Рим', 'Париж', 'Прага')
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Возвращает перцентиль q (от 0 до 100) значений values (метод ближайшего ранга)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb() -> float:
+    """Возвращает пиковое потребление памяти процессом (RSS) в мегабайтах"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+class ScenarioResult:
+    """
+    Класс ScenarioResult. Результаты одного сценария бенчмарка.
+    Arguments:
+        self.name (str): название сценария.
+        self.latencies (List[float]): время выполнения каждой итерации в секундах.
+        self.failures (int): количество итераций, завершившихся ошибкой.
+        self.calls (Dict[str, int]): количество запросов к FakeBackend по эндпоинтам.
+        self.retries (int): количество повторов запросов в api_requests.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.failures = 0
+        self.calls: Dict[str, int] = {}
+        self.retries = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'scenario': self.name,
+            'runs': len(self.latencies),
+            'failures': self.failures,
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 2),
+            'upstream_calls': self.calls,
+            'retries': self.retries,
+        }
+
+
+def make_search(destination: 'user.Destination', max_items: int, photos_amnt: int) -> 'user.Search':
+    """Создает поиск с параметрами, которые пользователь вводит в боте"""
+    check_in = date.today() + timedelta(days=30)
+    new_search = user.Search(destination=destination, check_in=check_in, check_out=check_in + timedelta(days=3),
+                             people=[{'adults': 2}], max_items=max_items, photos_amnt=photos_amnt,
+                             price_range={'min': 50, 'max': 400},
+                             distance_range={'min_distance': 0.0, 'max_distance': 10.0})
+    new_search.search_id_auto_setter()
+    return new_search
+
+
+def resolve_destinations(cities: List[str]) -> List['user.Destination']:
+    """Находит города через location_search (первый найденный вариант каждого города)"""
+    destinations = []
+    for city in cities:
+        found_destinations = location_search.location_search(city)
+        if isinstance(found_destinations, str) or not found_destinations:
+            raise RuntimeError(f'no recorded location for {city}')
+        (full_name, info), = found_destinations[0].items()
+        destinations.append(user.intern_destination(full_name, info))
+    return destinations
+
+
+def scenario_steps(cities: List[str], destinations: List['user.Destination'],
+                   max_items: int, photos_amnt: int) -> Dict[str, Callable[[int], bool]]:
+    """
+    Возвращает функции сценариев. Функция выполняет итерацию номер index и возвращает False,
+    если команда вернула ошибку.
+    """
+
+    def location(index: int) -> bool:
+        found_destinations = location_search.location_search(cities[index % len(cities)])
+        return not isinstance(found_destinations, str) and len(found_destinations) > 0
+
+    def finish(result) -> bool:
+        if isinstance(result, str) or result is None:
+            return False
+        result.render_summary()
+        return True
+
+    def low(index: int) -> bool:
+        cur_search = make_search(destinations[index % len(destinations)], max_items, photos_amnt)
+        return finish(commands.price_list(cur_search, low_price=True))
+
+    def high(index: int) -> bool:
+        cur_search = make_search(destinations[index % len(destinations)], max_items, photos_amnt)
+        return finish(commands.price_list(cur_search, high_price=True))
+
+    def best(index: int) -> bool:
+        cur_search = make_search(destinations[index % len(destinations)], max_items, photos_amnt)
+        return finish(commands.best_deal(cur_search))
+
+    return {'location': location, 'low': low, 'high': high, 'best': best}
+
+
+def clear_caches() -> None:
+    """Удаляет сохраненные ответы API и результаты поиска городов"""
+    api_requests.responses.clear()
+    location_search.clear_cache()
+
+
+def use_rate_cache(state_dir: str) -> None:
+    """Сохраняет курс валют в папку state_dir, а не в файл курса запущенного бота"""
+    api_requests._rate_cache = api_requests.make_rate_cache(os.path.join(state_dir, 'currency_rate.json'),
+                                                            config.currency_rate_refresh_interval)
+
+
+def total_retries() -> int:
+    """Возвращает общее количество повторов запросов в api_requests"""
+    return sum(endpoint_stats['retries'] for endpoint_stats in api_requests.get_request_stats().values())
+
+
+def run_scenario(name: str, step: Callable[[int], bool], backend: 'fake_backend.FakeBackend',
+                 iterations: int, concurrency: int, cold: bool) -> ScenarioResult:
+    """
+    Выполняет iterations итераций сценария, не больше concurrency одновременно.
+    Если cold, то перед каждой итерацией кэши очищаются.
+    """
+    result = ScenarioResult(name)
+    calls_before = backend.calls()
+    retries_before = total_retries()
+
+    def timed(index: int) -> Optional[float]:
+        if cold:
+            clear_caches()
+        started = time.perf_counter()
+        try:
+            is_ok = step(index)
+        except Exception as exc:
+            print(f'{name}: {exc!r}', file=sys.stderr)
+            is_ok = False
+        elapsed = time.perf_counter() - started
+        return elapsed if is_ok else -elapsed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed in executor.map(timed, range(iterations)):
+            result.latencies.append(abs(elapsed))
+            if elapsed < 0:
+                result.failures += 1
+
+    calls_after = backend.calls()
+    result.calls = {endpoint: calls_after.get(endpoint, 0) - calls_before.get(endpoint, 0)
+                    for endpoint in fake_backend.ENDPOINTS
+                    if calls_after.get(endpoint, 0) - calls_before.get(endpoint, 0) > 0}
+    result.retries = total_retries() - retries_before
+    return result
+
+
+def format_report(results: List[ScenarioResult]) -> str:
+    """Формирует таблицу с результатами сценариев"""
+    lines = ['{:<10} {:>5} {:>6} {:>10} {:>10} {:>8}  {}'.format(
+        'scenario', 'runs', 'failed', 'p50, ms', 'p99, ms', 'retries', 'upstream calls')]
+
+    for i_result in results:
+        row = i_result.to_dict()
+        calls = ', '.join(f'{endpoint}={count}' for endpoint, count in row['upstream_calls'].items()) or '-'
+        lines.append('{:<10} {:>5} {:>6} {:>10.1f} {:>10.1f} {:>8}  {}'.format(
+            row['scenario'], row['runs'], row['failures'], row['p50_ms'], row['p99_ms'], row['retries'], calls))
+
+    lines.append(f'peak RSS: {peak_rss_mb():.1f} MB')
+    return '\n'.join(lines)
+
+
+def parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Offline benchmark of the bot commands against a fake Hotels Api')
+    parser.add_argument('--recordings', help='JSON file with recorded API responses (default: synthetic data)')
+    parser.add_argument('--save-recordings', help='write the synthetic recordings to this file and exit')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma separated scenarios to run ({", ".join(SCENARIOS)})')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1, help='iterations running at the same time')
+    parser.add_argument('--cold', action='store_true', help='clear response and city caches before each iteration')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean upstream latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='latency spread as a fraction of --latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of failed upstream requests')
+    parser.add_argument('--hotels', type=int, default=600, help='hotels per city in synthetic recordings')
+    parser.add_argument('--max-items', type=int, default=5)
+    parser.add_argument('--photos', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f'unknown scenarios: {", ".join(unknown)}', file=sys.stderr)
+        return 2
+
+    if args.recordings:
+        recordings = fake_backend.load_recordings(args.recordings)
+        cities = list(recordings[api_requests.LOCATIONS_SEARCH])
+    else:
+        cities = list(DEFAULT_CITIES)
+        recordings = fake_backend.synthetic_recordings(cities, args.hotels, seed=args.seed)
+
+    if args.save_recordings:
+        fake_backend.save_recordings(recordings, args.save_recordings)
+        return 0
+
+    backend = fake_backend.FakeBackend(recordings, latency=args.latency, jitter=args.jitter,
+                                       error_rate=args.error_rate, error_status=args.error_status, seed=args.seed)
+    backend.start()
+    backend.use()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        use_rate_cache(tmp_dir)
+        logs.setup_logging(os.path.join(tmp_dir, 'bench.log'))
+        try:
+            destinations = resolve_destinations(cities)
+            steps = scenario_steps(cities, destinations, args.max_items, args.photos)
+            results = [run_scenario(name, steps[name], backend, args.iterations, args.concurrency, args.cold)
+                       for name in scenarios]
+
+        finally:
+            backend.stop()
+            api_requests.close_sessions()
+            logs.stop_logging()
+
+    if args.json:
+        print(json.dumps({'results': [i_result.to_dict() for i_result in results],
+                          'peak_rss_mb': round(peak_rss_mb(), 1)}, ensure_ascii=False, indent=1))
+    else:
+        print(format_report(results))
+
+    return 0
@@ -0,0 +1,290 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from telegram_hotels_bot import config
+from telegram_hotels_bot.api_requests import api_requests
+from telegram_hotels_bot.bot import location_search
+
+"""
+Файл с локальным HTTP-сервером, который заменяет Hotels Api (hotels4.p.rapidapi.com) и Currency Data API
+(api.apilayer.com) в бенчмарках. Сервер отвечает записанными ответами API с заданной задержкой и
+долей ошибок и считает запросы к каждому эндпоинту.
+
+Записи хранятся в JSON-файле (см. load_recordings) с ответами API в исходном виде:
+    {
+        "locations/v3/search": {"<название города>": <ответ>, ...},
+        "properties/v2/list": {"<regionId>": <ответ со всеми отелями города>, ...},
+        "properties/v2/detail": {"<propertyId>": <ответ>, ...},
+        "currency_data/convert": <ответ>
+    }
+Из ответа списка отелей сервер сам отбирает отели по фильтру цены, сортирует их (sort) и вырезает
+запрошенную страницу (resultsStartingIndex, resultsSize), поэтому для города достаточно одного ответа
+со всеми отелями.
+"""
+
+HOTELS_PREFIX = '/hotels4'
+CURRENCY_PREFIX = '/apilayer'
+
+PROPERTIES_SORTS = {
+    'PRICE_LOW_TO_HIGH': (lambda i_data: i_data['price']['lead']['amount'], False),
+    'PRICE_HIGH_TO_LOW': (lambda i_data: i_data['price']['lead']['amount'], True),
+    'DISTANCE': (lambda i_data: i_data['destinationInfo']['distanceFromDestination']['value'], False),
+}
+
+ENDPOINTS = (api_requests.LOCATIONS_SEARCH, api_requests.PROPERTIES_LIST, api_requests.PROPERTIES_DETAIL,
+             api_requests.CURRENCY_CONVERT)
+
+
+def load_recordings(path: str) -> Dict[str, Any]:
+    """Загружает записанные ответы API из JSON-файла"""
+    with open(path, 'r', encoding='utf-8') as recordings_file:
+        recordings = json.load(recordings_file)
+
+    missing = [endpoint for endpoint in ENDPOINTS if endpoint not in recordings]
+    if missing:
+        raise ValueError(f'no recorded responses for {", ".join(missing)}')
+
+    return recordings
+
+
+def save_recordings(recordings: Dict[str, Any], path: str) -> None:
+    """Сохраняет записанные ответы API в JSON-файл"""
+    with open(path, 'w', encoding='utf-8') as recordings_file:
+        json.dump(recordings, recordings_file, ensure_ascii=False, indent=1)
+
+
+def synthetic_recordings(cities: List[str], hotels_per_city: int, photos_per_hotel: int = 10,
+                         seed: int = 0) -> Dict[str, Any]:
+    """
+    Создает ответы API в формате записей для городов cities: по hotels_per_city отелей в каждом городе
+    со случайными ценами и расстояниями до центра. Используется, когда записей реального трафика нет.
+    """
+    rnd = random.Random(seed)
+    recordings: Dict[str, Any] = {endpoint: {} for endpoint in ENDPOINTS}
+    recordings[api_requests.CURRENCY_CONVERT] = {'success': True, 'result': 75.0}
+
+    for city_index, city in enumerate(cities):
+        region_id = str(1000 + city_index)
+        recordings[api_requests.LOCATIONS_SEARCH][city] = {'sr': [{
+            'type': 'CITY',
+            'gaiaId': region_id,
+            'regionNames': {'fullName': f'{city}, Страна'},
+            'coordinates': {'lat': str(round(rnd.uniform(-60, 60), 6)), 'long': str(round(rnd.uniform(-180, 180), 6))},
+        }]}
+
+        properties = []
+        for hotel_index in range(hotels_per_city):
+            hotel_id = f'{region_id}{hotel_index:05d}'
+            properties.append({
+                'id': hotel_id,
+                'name': f'{city} отель {hotel_index}',
+                'price': {'lead': {'amount': round(rnd.uniform(20, 800), 2), 'currencyInfo': {'code': 'USD'}}},
+                'destinationInfo': {'distanceFromDestination': {'value': round(rnd.uniform(0.1, 25), 2),
+                                                                'unit': 'KILOMETER'}},
+            })
+            recordings[api_requests.PROPERTIES_DETAIL][hotel_id] = {'data': {'propertyInfo': {
+                'summary': {'location': {'address': {'addressLine': f'{city}, улица {hotel_index}'}}},
+                'propertyGallery': {'images': [{'image': {'url': f'https://images.example/{hotel_id}/{k_photo}.jpg'}}
+                                               for k_photo in range(photos_per_hotel)]},
+            }}}
+
+        recordings[api_requests.PROPERTIES_LIST][region_id] = {'data': {'propertySearch': {
+            'properties': properties, 'summary': {'matchedPropertiesSize': len(properties)}
+        }}}
+
+    return recordings
+
+
+class FakeBackendRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов к FakeBackend"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self._respond(url.path, query)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            self._send(400, {'errors': [{'message': 'bad json'}]})
+            return
+        self._respond(urlsplit(self.path).path, payload)
+
+    def _respond(self, path: str, request: Dict[str, Any]) -> None:
+        backend: 'FakeBackend' = self.server.backend
+        status, body, headers = backend.handle(path, request)
+        self._send(status, body, headers)
+
+    def _send(self, status: int, body: Optional[Dict], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        """Отключает запись каждого запроса в stderr"""
+
+
+class FakeBackend:
+    """
+    Класс FakeBackend. Локальный HTTP-сервер, отвечающий записанными ответами Hotels Api и Currency Data API.
+    Arguments:
+        self._recordings (Dict[str, Any]): записанные ответы API (см. load_recordings).
+        self.latency (float): средняя задержка ответа в секундах.
+        self.jitter (float): разброс задержки (доля от latency).
+        self.error_rate (float): доля запросов, на которые сервер отвечает ошибкой error_status.
+        self.error_status (int): код ответа с ошибкой (429 отправляется с заголовком Retry-After).
+        self._calls (Dict[str, int]): количество запросов к каждому эндпоинту.
+        self._errors (Dict[str, int]): количество ответов с ошибкой для каждого эндпоинта.
+    """
+
+    def __init__(self, recordings: Dict[str, Any], latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, host: str = '127.0.0.1', port: int = 0,
+                 seed: int = 0):
+        self._recordings = recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._calls: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), FakeBackendRequestHandler)
+        self._server.daemon_threads = True
+        self._server.backend = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Геттер для адреса сервера"""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> None:
+        """Запускает сервер в отдельном потоке"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-backend', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает сервер"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def use(self) -> None:
+        """
+        Направляет запросы api_requests на этот сервер (адреса API в config) и закрывает
+        сессии, созданные для прежних адресов.
+        """
+        config.hotels_api_url = f'{self.url}{HOTELS_PREFIX}'
+        config.currency_api_url = f'{self.url}{CURRENCY_PREFIX}'
+        api_requests.close_sessions()
+
+    def calls(self) -> Dict[str, int]:
+        """Возвращает копию счетчиков запросов по эндпоинтам"""
+        with self._lock:
+            return dict(self._calls)
+
+    def errors(self) -> Dict[str, int]:
+        """Возвращает копию счетчиков ответов с ошибкой по эндпоинтам"""
+        with self._lock:
+            return dict(self._errors)
+
+    def handle(self, path: str, request: Dict[str, Any]) -> Tuple[int, Optional[Dict], Dict[str, str]]:
+        """Возвращает код, тело и заголовки ответа на запрос к пути path"""
+        endpoint = self._endpoint(path)
+        if endpoint is None:
+            return 404, {'message': 'not found'}, {}
+
+        with self._lock:
+            self._calls[endpoint] = self._calls.get(endpoint, 0) + 1
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if failed:
+            headers = {'Retry-After': '1'} if self.error_status == 429 else {}
+            return self.error_status, {'message': 'injected error'}, headers
+
+        body = self._replay(endpoint, request)
+        if body is None:
+            return 200, {'errors': [{'message': 'no recorded response'}]}, {}
+        return 200, body, {}
+
+    @staticmethod
+    def _endpoint(path: str) -> Optional[str]:
+        """Возвращает эндпоинт API по пути запроса"""
+        for prefix in (HOTELS_PREFIX, CURRENCY_PREFIX):
+            if path.startswith(f'{prefix}/'):
+                endpoint = path[len(prefix) + 1:]
+                if endpoint in ENDPOINTS:
+                    return endpoint
+        return None
+
+    def _replay(self, endpoint: str, request: Dict[str, Any]) -> Optional[Dict]:
+        """Возвращает записанный ответ на запрос"""
+        recorded = self._recordings[endpoint]
+
+        if endpoint == api_requests.LOCATIONS_SEARCH:
+            query = location_search.normalize_query(request.get('q', ''))
+            for city, response in recorded.items():
+                if location_search.normalize_query(city) == query:
+                    return response
+            return {'sr': []}
+
+        if endpoint == api_requests.PROPERTIES_LIST:
+            region_id = str((request.get('destination') or {}).get('regionId'))
+            response = recorded.get(region_id)
+            if response is None:
+                return None
+            return self._properties_page(response, request)
+
+        if endpoint == api_requests.PROPERTIES_DETAIL:
+            return recorded.get(str(request.get('propertyId')))
+
+        return recorded
+
+    @staticmethod
+    def _properties_page(response: Dict, request: Dict[str, Any]) -> Dict:
+        """
+        Вырезает из ответа списка отелей страницу, запрошенную в request, с учетом фильтра цены
+        и порядка сортировки (PROPERTIES_SORTS)
+        """
+        properties = response['data']['propertySearch']['properties']
+
+        price_filter = (request.get('filters') or {}).get('price')
+        if price_filter:
+            min_price = price_filter.get('min', float('-inf'))
+            max_price = price_filter.get('max', float('inf'))
+            properties = [i_data for i_data in properties
+                          if min_price <= i_data['price']['lead']['amount'] <= max_price]
+
+        if request.get('sort') in PROPERTIES_SORTS:
+            sort_key, reverse = PROPERTIES_SORTS[request['sort']]
+            properties = sorted(properties, key=sort_key, reverse=reverse)
+
+        start = int(request.get('resultsStartingIndex', 0))
+        size = int(request.get('resultsSize', len(properties)))
+
+        return {'data': {'propertySearch': {
+            'properties': properties[start:start + size],
+            'summary': {'matchedPropertiesSize': len(properties)},
+        }}}
@@ -0,0 +1,552 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import telebot
+from telebot import apihelper
+from telegram_hotels_bot import config
+from telegram_hotels_bot.benchmarks import bench, fake_backend
+from telegram_hotels_bot.user import user_store
+from telegram_hotels_bot.utils import logs
+
+"""
+Файл с нагрузочным тестом MyBot. Виртуальные пользователи проходят весь сценарий поиска
+(приветствие → город → календарь → номера → проживающие → количество отелей → фото → команда),
+отправляя синтетические обновления Message и CallbackQuery в зарегистрированные обработчики бота
+(bot.process_new_updates). Запросы бота к телеграмму перехватываются FakeTelegram
+(apihelper.CUSTOM_REQUEST_SENDER), а запросы к Hotels Api отправляются на FakeBackend.
+
+Пользователь нажимает только кнопки из последних полученных от бота клавиатур и ждет ответа на каждый шаг.
+В конце тест сверяет сохраненный поиск каждого пользователя с введенными им данными и полученными отелями:
+расхождения (данные другого чата, потерянные шаги) считаются повреждением состояния.
+
+Запуск из папки telegram_hotels_bot:
+    python load_test.py --users 2000 --concurrency 500
+"""
+
+COMMANDS = ('low', 'high', 'best')
+
+TYPES_OF_SEARCH = {'low': 'Поиск дешевых отелей', 'high': 'Поиск дорогих отелей', 'best': 'Настраиваемый поиск'}
+
+ERROR_TEXTS = ('Данные поиска устарели', 'Что-то пошло не так', 'Превышен лимит брони', 'Неверный формат',
+               'не может быть меньше')
+
+HOTEL_CAPTION = re.compile(r'^\d+\. ')
+
+BEST_DEAL_INPUT = {'price_range': {'min': 50, 'max': 400}, 'distance_range': {'min_distance': 0.0,
+                                                                                'max_distance': 10.0}}
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'HotelsBot', 'username': 'hotels_bot'}
+
+
+class FakeResponse:
+    """Ответ телеграмма для apihelper (используются только status_code, text и json)"""
+
+    status_code = 200
+
+    def __init__(self, result: Any):
+        self._body = {'ok': True, 'result': result}
+        self.text = json.dumps(self._body, ensure_ascii=False)
+
+    def json(self) -> Dict:
+        return self._body
+
+
+class BotEvent:
+    """
+    Класс BotEvent. Сообщение бота, полученное FakeTelegram (отправка или изменение сообщения).
+    Arguments:
+        self.method (str): метод Bot API.
+        self.message (Dict): сообщение в формате Bot API.
+        self.text (str): текст сообщения или подпись к фото.
+        self.buttons (List[Tuple[str, str]]): текст и callback_data кнопок Inline клавиатуры.
+    """
+
+    __slots__ = ('method', 'message', 'text', 'buttons')
+
+    def __init__(self, method: str, message: Dict, text: str, buttons: List[Tuple[str, str]]):
+        self.method = method
+        self.message = message
+        self.text = text
+        self.buttons = buttons
+
+
+class FakeTelegram:
+    """
+    Класс FakeTelegram. Заменяет Bot API: запоминает сообщения, которые бот отправляет в каждый чат,
+    и отвечает так, как ответил бы телеграмм.
+    Arguments:
+        self.latency (float): задержка ответа в секундах.
+        self._events (Dict[int, List[BotEvent]]): сообщения бота по чатам.
+        self._calls (Dict[str, int]): количество вызовов каждого метода Bot API.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._events: Dict[int, List[BotEvent]] = {}
+        self._calls: Dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def install(self) -> None:
+        """Направляет все запросы pyTelegramBotAPI в этот объект"""
+        apihelper.CUSTOM_REQUEST_SENDER = self
+
+    @staticmethod
+    def uninstall() -> None:
+        apihelper.CUSTOM_REQUEST_SENDER = None
+
+    def calls(self) -> Dict[str, int]:
+        """Возвращает копию счетчиков вызовов методов Bot API"""
+        with self._cond:
+            return dict(self._calls)
+
+    def __call__(self, method: str, url: str, params: Optional[Dict] = None, **kwargs) -> FakeResponse:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        api_method = url.rsplit('/', 1)[-1]
+        params = params or {}
+        with self._cond:
+            self._calls[api_method] = self._calls.get(api_method, 0) + 1
+            result = self._handle(api_method, params)
+            self._cond.notify_all()
+        return FakeResponse(result)
+
+    def _handle(self, api_method: str, params: Dict) -> Any:
+        """Запоминает сообщение бота и возвращает результат метода Bot API"""
+        if 'chat_id' not in params:
+            return True
+        chat_id = int(params['chat_id'])
+
+        if api_method == 'sendMediaGroup':
+            messages = [self._message(chat_id, caption=i_media.get('caption'))
+                        for i_media in json.loads(params['media'])]
+            self._add_event(chat_id, BotEvent(api_method, messages[0], messages[0].get('caption') or '', []))
+            return messages
+
+        if api_method in ('sendMessage', 'editMessageText'):
+            message_id = int(params['message_id']) if 'message_id' in params else None
+            message = self._message(chat_id, text=params.get('text'), reply_markup=params.get('reply_markup'),
+                                    message_id=message_id)
+            buttons = [(i_button['text'], i_button['callback_data'])
+                       for i_row in (message.get('reply_markup') or {}).get('inline_keyboard', [])
+                       for i_button in i_row if 'callback_data' in i_button]
+            self._add_event(chat_id, BotEvent(api_method, message, message.get('text') or '', buttons))
+            return message
+
+        return True
+
+    def _message(self, chat_id: int, text: Optional[str] = None, caption: Optional[str] = None,
+                 reply_markup: Optional[str] = None, message_id: Optional[int] = None) -> Dict:
+        """Создает сообщение бота в формате Bot API"""
+        message = {'message_id': message_id or next(self._message_ids), 'date': int(time.time()),
+                   'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER}
+        if text is not None:
+            message['text'] = text
+        if caption is not None:
+            message['caption'] = caption
+        if reply_markup:
+            message['reply_markup'] = json.loads(reply_markup) if isinstance(reply_markup, str) else reply_markup
+        return message
+
+    def _add_event(self, chat_id: int, event: BotEvent) -> None:
+        self._events.setdefault(chat_id, []).append(event)
+
+    def wait_event(self, chat_id: int, index: int, deadline: float) -> Optional[BotEvent]:
+        """Ждет сообщение бота номер index в чате chat_id до времени deadline (time.monotonic)"""
+        with self._cond:
+            while True:
+                chat_events = self._events.get(chat_id, [])
+                if index < len(chat_events):
+                    return chat_events[index]
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return None
+                self._cond.wait(timeout)
+
+
+class StepFailed(Exception):
+    """Шаг сценария не получил ожидаемого ответа бота"""
+
+    def __init__(self, kind: str, detail: str):
+        super().__init__(detail)
+        self.kind = kind
+        self.detail = detail
+
+
+def has_button(prefix: str) -> Callable[[BotEvent], bool]:
+    return lambda event: any(data.startswith(prefix) for _, data in event.buttons)
+
+
+def has_text(fragment: str) -> Callable[[BotEvent], bool]:
+    return lambda event: fragment in event.text
+
+
+class VirtualUser:
+    """
+    Класс VirtualUser. Пользователь телеграмма, который проходит сценарий поиска в отдельном чате.
+    Arguments:
+        self.chat_id (int): идентификационный номер пользователя и чата.
+        self.city (str): город поиска.
+        self.command (str): команда поиска (low, high или best).
+        self.latencies (Dict[str, float]): время ответа бота на каждый шаг в секундах.
+        self.detections (List[Tuple[str, str, str]]): ошибки (вид, шаг, описание).
+        self.expected (Dict[str, Any]): данные, которые должны сохраниться в поиске пользователя.
+        self.captions (List[str]): подписи к отелям из результатов поиска.
+    """
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, index: int, chat_id: int, city: str, command: str, bot: 'MyBot',
+                 telegram: FakeTelegram, timeout: float):
+        self.index = index
+        self.chat_id = chat_id
+        self.city = city
+        self.command = command
+        self._bot = bot
+        self._telegram = telegram
+        self._timeout = timeout
+        self._cursor = 0
+        self._from = {'id': chat_id, 'is_bot': False, 'first_name': f'User{index}', 'username': f'user{index}'}
+        self.latencies: Dict[str, float] = {}
+        self.detections: List[Tuple[str, str, str]] = []
+        self.expected: Dict[str, Any] = {}
+        self.captions: List[str] = []
+        self.updates = 0
+        self.completed = False
+
+    def send_text(self, text: str) -> None:
+        """Отправляет боту текстовое сообщение"""
+        self._process({'message': {'message_id': next(self._update_ids), 'date': int(time.time()),
+                                   'chat': {'id': self.chat_id, 'type': 'private'}, 'from': self._from,
+                                   'text': text}})
+
+    def press(self, event: BotEvent, data: str) -> None:
+        """Нажимает кнопку с callback_data data в сообщении бота event"""
+        if all(data != button_data for _, button_data in event.buttons):
+            raise StepFailed('unexpected', f'no button {data!r}')
+        self._process({'callback_query': {'id': str(next(self._update_ids)), 'from': self._from,
+                                          'chat_instance': str(self.chat_id), 'data': data,
+                                          'message': event.message}})
+
+    def _process(self, update: Dict) -> None:
+        update['update_id'] = next(self._update_ids)
+        self.updates += 1
+        self._bot.bot.process_new_updates([telebot.types.Update.de_json(update)])
+
+    def wait_for(self, predicate: Callable[[BotEvent], bool]) -> BotEvent:
+        """
+        Ждет сообщение бота, для которого predicate возвращает True. Пропущенные сообщения
+        с подписями к отелям запоминаются, а сообщения об ошибках прерывают сценарий.
+        """
+        deadline = time.monotonic() + self._timeout
+        while True:
+            event = self._telegram.wait_event(self.chat_id, self._cursor, deadline)
+            if event is None:
+                raise StepFailed('timeout', f'no reply in {self._timeout} s')
+            self._cursor += 1
+
+            if HOTEL_CAPTION.match(event.text):
+                self.captions.append(event.text)
+            if predicate(event):
+                return event
+            if any(error_text in event.text for error_text in ERROR_TEXTS):
+                raise StepFailed('error_reply', event.text.splitlines()[0])
+
+    def step(self, name: str, action: Callable[[], None], predicate: Callable[[BotEvent], bool]) -> BotEvent:
+        """Выполняет шаг сценария и запоминает, сколько бот на него отвечал"""
+        started = time.perf_counter()
+        action()
+        event = self.wait_for(predicate)
+        self.latencies[name] = time.perf_counter() - started
+        return event
+
+    def pick_date(self, event: BotEvent, calendar_id: int, name: str,
+                  next_predicate: Callable[[BotEvent], bool]) -> Tuple[BotEvent, date]:
+        """Выбирает в календаре год, месяц и день и ждет следующего вопроса бота"""
+        started = time.perf_counter()
+        prefix = f'cbcal_{calendar_id}_s_'
+
+        for _ in range(3):
+            selectable = [data for _, data in event.buttons if data.startswith(prefix)]
+            if not selectable:
+                raise StepFailed('unexpected', 'no selectable dates in the calendar')
+
+            data = selectable[self.index % len(selectable)]
+            self.press(event, data)
+
+            if data.startswith(f'{prefix}d_'):
+                year, month, day = map(int, data.split('_')[4:7])
+                event = self.wait_for(next_predicate)
+                self.latencies[name] = time.perf_counter() - started
+                return event, date(year, month, day)
+
+            event = self.wait_for(has_button(prefix))
+
+        raise StepFailed('unexpected', 'the calendar never offered a day')
+
+    def run(self) -> None:
+        """Проходит сценарий поиска. Ошибки шагов записываются в self.detections"""
+        step = 'start'
+        try:
+            event = self.step(step, lambda: self.send_text('/start'), has_button('get_city'))
+
+            step = 'ask_city'
+            event = self.step(step, lambda: self.press(event, 'get_city'), has_text('Введите интересующий вас'))
+
+            step = 'city'
+            event = self.step(step, lambda: self.send_text(self.city), has_button('#city'))
+            self.expected['destination_name'], city_data = event.buttons[0]
+
+            step = 'calendar'
+            event = self.step(step, lambda: self.press(event, city_data), has_button('cbcal_1_'))
+
+            step = 'check_in'
+            event, self.expected['check_in'] = self.pick_date(event, 1, step, has_button('cbcal_2_'))
+
+            step = 'check_out'
+            event, self.expected['check_out'] = self.pick_date(event, 2, step, has_button('#rooms'))
+
+            step = 'rooms'
+            event = self.step(step, lambda: self.press(event, '#rooms1'), has_button('#room=0@adults='))
+
+            adults = 1 + self.index % 4
+            step = 'adults'
+            event = self.step(step, lambda: self.press(event, f'#room=0@adults={adults}#'),
+                              has_button('#room=0@children='))
+
+            if self.index % 3 == 0:
+                age = self.index % 18
+                step = 'children'
+                event = self.step(step, lambda: self.press(event, '#room=0@children=1#'), has_button('#age='))
+                step = 'children_age'
+                event = self.step(step, lambda: self.press(
+                    event, f'#age={age}#cur_child=1#total_children=1#cur_room=0'), has_button('#hotels_amnt'))
+                self.expected['people'] = [{'adults': adults, 'children': [{'age': age}]}]
+            else:
+                step = 'children'
+                event = self.step(step, lambda: self.press(event, '#room=0@children=0#'),
+                                  has_button('#hotels_amnt'))
+                self.expected['people'] = [{'adults': adults}]
+
+            self.expected['max_items'] = 1 + self.index % 5
+            step = 'hotels_amnt'
+            event = self.step(step, lambda: self.press(event, f'#hotels_amnt#{self.expected["max_items"]}'),
+                              has_button('#photos_amnt'))
+
+            self.expected['photos_amnt'] = self.index % 6
+            step = 'photos_amnt'
+            event = self.step(step, lambda: self.press(event, f'#photos_amnt#{self.expected["photos_amnt"]}'),
+                              has_button('low_price'))
+
+            self.expected['type_of_search'] = TYPES_OF_SEARCH[self.command]
+            step = self.command
+            if self.command == 'best':
+                self.step(step, lambda: self.press(event, 'best_deal'), has_text('минимальную цену'))
+                price_range = BEST_DEAL_INPUT['price_range']
+                distance_range = BEST_DEAL_INPUT['distance_range']
+                step = 'price_min'
+                self.step(step, lambda: self.send_text(str(price_range['min'])), has_text('максимальную цену'))
+                step = 'price_max'
+                self.step(step, lambda: self.send_text(str(price_range['max'])), has_text('минимальное расстояние'))
+                step = 'distance_min'
+                self.step(step, lambda: self.send_text(str(distance_range['min_distance'])),
+                          has_text('максимальное расстояние'))
+                step = 'distance_max'
+                self.step(step, lambda: self.send_text(str(distance_range['max_distance'])), has_button('again_'))
+                self.expected.update(BEST_DEAL_INPUT)
+            else:
+                self.step(step, lambda: self.press(event, f'{self.command}_price'), has_button('again_'))
+
+            self.completed = True
+
+        except StepFailed as exc:
+            self.detections.append((exc.kind, step, exc.detail))
+
+        except Exception as exc:
+            self.detections.append(('exception', step, repr(exc)))
+
+    def verify(self) -> None:
+        """
+        Сверяет сохраненный поиск пользователя с введенными данными и отелями, отправленными в чат.
+        Расхождения записываются в self.detections как повреждение состояния (corruption).
+        """
+        if not self.completed:
+            return
+
+        cur_user = user_store.find_user(self.chat_id)
+        if cur_user is None or len(cur_user.searches) == 0:
+            self.detections.append(('corruption', 'store', 'the search was not saved'))
+            return
+
+        cur_search = cur_user.searches[-1]
+        for field, expected in self.expected.items():
+            actual = getattr(cur_search, field)
+            if actual != expected:
+                self.detections.append(('corruption', field, f'expected {expected!r}, saved {actual!r}'))
+
+        if len(self.captions) != len(cur_search.results):
+            self.detections.append(('corruption', 'results', f'{len(self.captions)} hotels sent, '
+                                                             f'{len(cur_search.results)} saved'))
+            return
+
+        # отели отправляются по мере загрузки, поэтому подписи сверяются в порядке номеров в них
+        ranked = sorted(self.captions, key=lambda caption: int(caption.split('.', 1)[0]))
+        for caption, i_hotel in zip(ranked, cur_search.results):
+            if not caption.split('. ', 1)[1].startswith(i_hotel.name):
+                self.detections.append(('corruption', 'results', f'hotel sent as {caption[:60]!r}, '
+                                                                 f'saved as {i_hotel.name!r}'))
+
+
+def format_report(users: List[VirtualUser], elapsed: float, telegram: FakeTelegram,
+                  backend: 'fake_backend.FakeBackend', bot: 'MyBot') -> Dict[str, Any]:
+    """Собирает результаты нагрузочного теста"""
+    step_latencies: Dict[str, List[float]] = {}
+    for i_user in users:
+        for step, latency in i_user.latencies.items():
+            step_latencies.setdefault(step, []).append(latency)
+
+    detections: Dict[str, int] = {}
+    samples = []
+    for i_user in users:
+        for kind, step, detail in i_user.detections:
+            detections[f'{kind}:{step}'] = detections.get(f'{kind}:{step}', 0) + 1
+            if len(samples) < 10:
+                samples.append(f'chat {i_user.chat_id}: {kind} at {step}: {detail}')
+
+    completed = sum(1 for i_user in users if i_user.completed)
+    return {
+        'users': len(users),
+        'completed': completed,
+        'elapsed_s': round(elapsed, 2),
+        'flows_per_s': round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        'updates_per_s': round(sum(i_user.updates for i_user in users) / elapsed, 2) if elapsed > 0 else 0.0,
+        'steps': {step: {'count': len(latencies),
+                         'p50_ms': round(bench.percentile(latencies, 50) * 1000, 1),
+                         'p99_ms': round(bench.percentile(latencies, 99) * 1000, 1)}
+                  for step, latencies in step_latencies.items()},
+        'state_corruption': sum(count for key, count in detections.items() if key.startswith('corruption:')),
+        'detections': detections,
+        'detection_samples': samples,
+        'telegram_calls': telegram.calls(),
+        'upstream_calls': backend.calls(),
+        'max_update_queue': bot.bot.dispatcher.max_queue_depth,
+        'peak_rss_mb': round(bench.peak_rss_mb(), 1),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f'users: {report["users"]}, completed: {report["completed"]}, elapsed: {report["elapsed_s"]} s')
+    print(f'throughput: {report["flows_per_s"]} flows/s, {report["updates_per_s"]} updates/s')
+    print(f'state corruption detections: {report["state_corruption"]}')
+    print('{:<14} {:>7} {:>10} {:>10}'.format('step', 'count', 'p50, ms', 'p99, ms'))
+    for step, stats in report['steps'].items():
+        print('{:<14} {:>7} {:>10.1f} {:>10.1f}'.format(step, stats['count'], stats['p50_ms'], stats['p99_ms']))
+    if report['detections']:
+        print('detections: ' + ', '.join(f'{key}={count}' for key, count in sorted(report['detections'].items())))
+        for sample in report['detection_samples']:
+            print(f'  {sample}')
+    print(f'telegram calls: {report["telegram_calls"]}')
+    print(f'upstream calls: {report["upstream_calls"]}')
+    print(f'max update queue: {report["max_update_queue"]}, peak RSS: {report["peak_rss_mb"]} MB')
+
+
+def parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load test of MyBot with simulated Telegram users')
+    parser.add_argument('--users', type=int, default=200, help='number of simulated users')
+    parser.add_argument('--concurrency', type=int, default=100, help='users talking to the bot at the same time')
+    parser.add_argument('--commands', default=','.join(COMMANDS),
+                        help=f'comma separated search commands the users choose from ({", ".join(COMMANDS)})')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for each bot reply')
+    parser.add_argument('--recordings', help='JSON file with recorded API responses (default: synthetic data)')
+    parser.add_argument('--hotels', type=int, default=600, help='hotels per city in synthetic recordings')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean upstream latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream requests that fail')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='Bot API latency, seconds')
+    parser.add_argument('--unlimited-send', action='store_true',
+                        help="disable the bot's Telegram rate limits (measure the bot, not the limits)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    user_commands = [name.strip() for name in args.commands.split(',') if name.strip()]
+    unknown = [name for name in user_commands if name not in COMMANDS]
+    if unknown:
+        print(f'unknown commands: {", ".join(unknown)}', file=sys.stderr)
+        return 2
+
+    if args.recordings:
+        recordings = fake_backend.load_recordings(args.recordings)
+        cities = list(recordings['locations/v3/search'])
+    else:
+        cities = list(bench.DEFAULT_CITIES)
+        recordings = fake_backend.synthetic_recordings(cities, args.hotels, seed=args.seed)
+
+    # города-примеры и приветствия не обновляются из сети во время теста
+    config.cities_refresh_interval = float('inf')
+    config.greetings_refresh_interval = float('inf')
+    if args.unlimited_send:
+        for name in ('send_global_rate', 'send_global_burst', 'send_chat_rate', 'send_chat_burst',
+                     'send_group_rate', 'send_group_burst'):
+            setattr(config, name, 1e9)
+    config.TOKEN = config.TOKEN or '0:load-test'
+
+    backend = fake_backend.FakeBackend(recordings, latency=args.latency, jitter=0.2, error_rate=args.error_rate,
+                                       seed=args.seed)
+    backend.start()
+    backend.use()
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    telegram.install()
+
+    from telegram_hotels_bot.bot import my_bot
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench.use_rate_cache(tmp_dir)
+        logs.setup_logging(os.path.join(tmp_dir, 'load_test.log'))
+        store = user_store.SQLiteUserStore(os.path.join(tmp_dir, 'load_test.sqlite3'))
+        user_store.set_store(store)
+        bot = my_bot.MyBot()
+
+        users = [VirtualUser(index, chat_id=100000 + index, city=cities[index % len(cities)],
+                             command=user_commands[index % len(user_commands)], bot=bot, telegram=telegram,
+                             timeout=args.timeout)
+                 for index in range(args.users)]
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(VirtualUser.run, users))
+            elapsed = time.perf_counter() - started
+
+            bot.bot.dispatcher.stop()
+            bot.sender.stop()
+            for i_user in users:
+                i_user.verify()
+
+        finally:
+            telegram.uninstall()
+            backend.stop()
+            store.close()
+            logs.stop_logging()
+
+        report = format_report(users, elapsed, telegram, backend, bot)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+    else:
+        print_report(report)
+
+    return 0 if report['state_corruption'] == 0 else 1
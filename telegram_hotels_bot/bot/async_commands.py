@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
+from telegram_hotels_bot import config
+from telegram_hotels_bot.api_requests import api_requests, async_api_requests
+from telegram_hotels_bot.bot import commands, hotel_selection, location_search as sync_location_search
+
+"""
+Файл с асинхронными версиями команд из commands.py и location_search.py для AsyncMyBot.
+Данные запросов и разбор ответов общие с синхронными командами, отличаются только сами запросы:
+они выполняются через async_api_requests, а запросы данных отелей - одновременно (asyncio.gather).
+"""
+
+
+async def location_search(city_name: str) -> Union[List[Dict], str]:
+    """Асинхронная версия location_search.location_search"""
+    query = sync_location_search.normalize_query(city_name)
+
+    found_destinations = sync_location_search.find_known_destinations(query)
+    if found_destinations is not None:
+        return found_destinations
+
+    querystring = {"q": city_name, "locale": "ru_RU"}
+
+    data = await async_api_requests.get_request(api_requests.LOCATIONS_SEARCH, querystring=querystring)
+
+    found_destinations = sync_location_search.parse_destinations(data)
+    if not isinstance(found_destinations, str):
+        sync_location_search.remember_destinations(query, found_destinations)
+
+    return found_destinations
+
+
+async def price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optional[Union['Search', str]]:
+    """Асинхронная версия commands.price_list"""
+    cur_search = await find_price_list(cur_search, low_price=low_price, high_price=high_price)
+
+    if isinstance(cur_search, str):
+        return cur_search
+
+    return await get_address_and_photos(cur_search)
+
+
+async def find_price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optional[Union['Search', str]]:
+    """Асинхронная версия commands.find_price_list"""
+    if low_price:
+        max_items = cur_search.max_items
+
+    else:
+        max_items = commands.PAGE_SIZE
+
+    data = await get_properties_list_data(cur_search, result_index=0, max_items=max_items)
+
+    if data is None or 'errors' in data.keys():
+        return 'Что-то пошло не так. Пожалуйста, повторите запрос'
+
+    cur_search.results = []
+
+    if high_price:
+        properties = await fetch_most_expensive(data, cur_search)
+        if isinstance(properties, str):
+            return properties
+
+    else:
+        properties = commands.page_properties(data)
+        if properties is None:
+            return 'Что-то пошло не так. Попробуйте повторить запрос'
+
+        cheapest = hotel_selection.TopHotels(cur_search.max_items, ranking=hotel_selection.by_price)
+        cheapest.add(properties)
+        properties = cheapest.result()
+
+    cur_search.results = commands.hotels_from_properties(properties)
+
+    return cur_search
+
+
+async def get_properties_list_data(cur_search: 'Search', result_index: int, max_items: int) -> Optional[Dict]:
+    """Отправляет запрос списка отелей"""
+    payload = commands.properties_list_payload(
+        destination=cur_search.destination_info, check_in=cur_search.check_in, check_out=cur_search.check_out,
+        people=cur_search.people, result_index=result_index, max_items=max_items
+    )
+
+    return await async_api_requests.post_request(api_requests.PROPERTIES_LIST, payload=payload)
+
+
+async def fetch_most_expensive(data: Dict, cur_search: 'Search') -> Union[List[Dict], str]:
+    """
+    Асинхронная версия commands.fetch_most_expensive. Остальные страницы списка отелей загружаются
+    одновременно, но не более config.list_page_workers страниц за раз.
+    """
+    most_expensive = hotel_selection.TopHotels(cur_search.max_items, ranking=hotel_selection.by_price_desc)
+
+    properties = commands.page_properties(data)
+    if properties is None:
+        return 'Что-то пошло не так. Попробуйте повторить запрос'
+
+    property_search = data['data']['propertySearch']
+    most_expensive.add(properties)
+
+    if len(properties) == commands.PAGE_SIZE:
+        total = (property_search.get('summary') or {}).get('matchedPropertiesSize')
+
+        if total is None:
+            result_index = commands.PAGE_SIZE
+            while len(properties) == commands.PAGE_SIZE:
+                properties = await get_properties_page(cur_search, result_index)
+                if properties is None:
+                    return 'Что-то пошло не так. Попробуйте повторить запрос'
+                most_expensive.add(properties)
+                result_index += commands.PAGE_SIZE
+
+        else:
+            semaphore = asyncio.Semaphore(config.list_page_workers)
+
+            async def load_page(result_index: int) -> Optional[List[Dict]]:
+                async with semaphore:
+                    try:
+                        return await get_properties_page(cur_search, result_index)
+
+                    except Exception as exc:
+                        logging.error(exc)
+                        return None
+
+            pages = await asyncio.gather(*(load_page(result_index)
+                                           for result_index in range(commands.PAGE_SIZE, total, commands.PAGE_SIZE)))
+
+            for properties in pages:
+                if properties is None:
+                    return 'Что-то пошло не так. Попробуйте повторить запрос'
+                most_expensive.add(properties)
+
+    return most_expensive.result()
+
+
+async def get_properties_page(cur_search: 'Search', result_index: int) -> Optional[List[Dict]]:
+    """
+    Загружает одну страницу списка отелей, начиная с result_index.
+    Возвращает None, если страницу загрузить не удалось.
+    """
+    data = await get_properties_list_data(cur_search, result_index=result_index, max_items=commands.PAGE_SIZE)
+
+    return commands.page_properties(data)
+
+
+async def get_address_and_photos(cur_search: 'Search') -> Union['Search', str]:
+    """
+    Асинхронная версия commands.get_address_and_photos. Запросы данных всех отелей
+    выполняются одновременно (asyncio.gather).
+    """
+    hotels = cur_search.results
+    photos_amnt = cur_search.photos_amnt
+    loaded = await asyncio.gather(*(get_hotel_details(i_hotel, photos_amnt) for i_hotel in hotels))
+
+    cur_search.results = [i_hotel for i_hotel, is_loaded in zip(hotels, loaded) if is_loaded]
+
+    if len(hotels) > 0 and len(cur_search.results) == 0:
+        return 'Что-то пошло не так. Попробуйте повторить запрос'
+
+    return cur_search
+
+
+async def stream_address_and_photos(cur_search: 'Search') -> AsyncIterator[Tuple[int, 'Hotel']]:
+    """
+    Асинхронная версия commands.stream_address_and_photos. Запросы данных всех отелей выполняются
+    одновременно, а отели возвращаются с местом в результатах поиска по мере загрузки их данных.
+    """
+    hotels = cur_search.results
+    photos_amnt = cur_search.photos_amnt
+    tasks = {asyncio.ensure_future(get_hotel_details(i_hotel, photos_amnt)): index
+             for index, i_hotel in enumerate(hotels)}
+
+    loaded = set()
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for i_task in sorted(done, key=tasks.get):
+                index = tasks[i_task]
+                if i_task.result():
+                    loaded.add(index)
+                    yield index, hotels[index]
+
+    finally:
+        for i_task in tasks:
+            i_task.cancel()
+
+    cur_search.results = [i_hotel for index, i_hotel in enumerate(hotels) if index in loaded]
+
+
+async def get_hotel_details(i_hotel: 'Hotel', photos_amnt: int) -> bool:
+    """
+    Загружает адрес и фото одного отеля. Возвращает False, если данные отеля загрузить не удалось.
+    """
+    try:
+        data = await async_api_requests.post_request(api_requests.PROPERTIES_DETAIL,
+                                                     payload=commands.detail_payload(i_hotel.hotel_id))
+
+    except Exception as exc:
+        logging.error(exc)
+        return False
+
+    return commands.save_hotel_details(i_hotel, data, photos_amnt)
+
+
+async def best_deal(cur_search: 'Search') -> Union['Search', str]:
+    """Асинхронная версия commands.best_deal"""
+    cur_search = await find_best_deal(cur_search)
+    if isinstance(cur_search, str):
+        return cur_search
+
+    return await get_address_and_photos(cur_search)
+
+
+async def find_best_deal(cur_search: 'Search') -> Union['Search', str]:
+    """Асинхронная версия commands.find_best_deal"""
+    data = await async_api_requests.post_request(api_requests.PROPERTIES_LIST,
+                                                 payload=commands.best_deal_payload(cur_search))
+
+    try:
+        data = data.get('data').get('propertySearch').get('properties')
+
+    except AttributeError:
+        return 'Что-то пошло не так, попробуйте начать поиск с начала'
+
+    cur_search.results = commands.select_best_deal(data, cur_search)
+
+    return cur_search
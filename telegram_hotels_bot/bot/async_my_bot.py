@@ -0,0 +1,259 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+from telegram_hotels_bot.utils import logs, metrics, ttl_cache
+from telegram_hotels_bot.bot import async_commands, sender
+from telegram_hotels_bot.bot.search_steps import SearchSteps, Reply, NO_RESULTS_TEXT, ERROR_TEXT, hotel_caption, \
+    hotel_media_group
+from telegram_hotels_bot.api_requests import async_api_requests
+from telegram_hotels_bot.api_requests.api_requests import get_converted_price
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Union
+from telegram_hotels_bot import config
+
+
+class ChatLocks:
+    """
+    Класс ChatLocks. Блокировки asyncio.Lock чатов, с которыми обработчики обновлений одного чата
+    выполняются по очереди (как в ChatDispatcher у MyBot). Обновления разных чатов обрабатываются одновременно.
+
+    Arguments:
+        self._locks (Dict[int, asyncio.Lock]): блокировки чатов, обновления которых сейчас обрабатываются.
+        self._waiters (Dict[int, int]): количество обновлений каждого чата, которые обрабатываются
+        или ждут блокировку (когда их не осталось, блокировка удаляется).
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, chat_id: int) -> AsyncIterator[None]:
+        """Дожидается блокировки чата chat_id и держит ее внутри блока async with"""
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._waiters[chat_id] = self._waiters.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                yield
+
+        finally:
+            self._waiters[chat_id] -= 1
+            if self._waiters[chat_id] == 0:
+                self._waiters.pop(chat_id)
+                self._locks.pop(chat_id)
+
+
+def serialize_chats(bot: AsyncTeleBot, chat_locks: ChatLocks) -> None:
+    """
+    Оборачивает обработчики сообщений и коллбэков бота, чтобы обработчики обновлений одного чата
+    выполнялись по очереди под блокировкой чата из chat_locks.
+    """
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            function = handler['function']
+
+            @functools.wraps(function)
+            async def wrapper(update_content, *args, _function=function, **kwargs):
+                chat_id = logs.chat_id_of(update_content)
+                if chat_id is None:
+                    return await _function(update_content, *args, **kwargs)
+
+                async with chat_locks.hold(chat_id):
+                    return await _function(update_content, *args, **kwargs)
+
+            handler['function'] = wrapper
+
+
+class AsyncMyBot(SearchSteps):
+    """
+    Класс AsyncMyBot. Асинхронный вариант MyBot на базе AsyncTeleBot: все обновления обрабатываются
+    в одном потоке в цикле событий asyncio, а запросы к Hotels Api не блокируют обработку других чатов.
+    Шаги диалога общие с MyBot (SearchSteps): синхронные шаги, которые обращаются к user_store,
+    выполняются в отдельном потоке (asyncio.to_thread), а сообщения отправляются с учетом лимитов
+    телеграмма (sender.send_async).
+
+    Arguments:
+        self.bot (AsyncTeleBot): асинхронный бот с токеном.
+        self.chat_locks (ChatLocks): блокировки, с которыми обновления одного чата обрабатываются по очереди.
+        self.next_steps (TTLCache): обработчики следующего текстового сообщения каждого чата
+        (замена register_next_step_handler, которого нет у AsyncTeleBot).
+        self.limits (RateLimits): лимиты отправки сообщений в телеграмм.
+    """
+
+    def __init__(self):
+
+        token = config.TOKEN
+
+        super().__init__()
+        self.bot = AsyncTeleBot(f'{token}', parse_mode=None)
+        self.chat_locks = ChatLocks()
+        self.next_steps = ttl_cache.TTLCache(maxsize=config.chat_state_max_chats, ttl=config.chat_state_ttl)
+        self.limits = sender.RateLimits()
+
+        @self.bot.message_handler(func=lambda message: self.next_steps.get(message.chat.id) is not None)
+        async def process_next_step(message: telebot.types.Message) -> None:
+            """
+            Передает сообщение обработчику, который ждет ответа пользователя на вопрос бота.
+            """
+            next_step = self.next_steps.pop(message.chat.id)
+            if next_step is not None:
+                await next_step(message)
+
+        self.register_steps()
+        logs.bind_handlers(self.bot)
+        metrics.instrument_handlers(self.bot)
+        serialize_chats(self.bot, self.chat_locks)
+
+    def start(self) -> None:
+        """
+        Запускает MetricsServer и цикл событий asyncio с функцией run. Режим webhook для асинхронного
+        бота не поддерживается.
+        """
+        metrics.start_server()
+        asyncio.run(self.run())
+
+    async def run(self) -> None:
+        """
+        Запускает polling в цикле while, чтобы избежать падения бота. При остановке закрывает HTTP-сессии.
+        """
+        try:
+            while True:
+                try:
+                    await self.bot.polling(non_stop=True)
+                except Exception as exc:
+                    logging.error(exc)
+                    print('restarting the bot in 3 seconds')
+                    await asyncio.sleep(3)
+
+        finally:
+            await async_api_requests.close_sessions()
+            await self.bot.close_session()
+
+    def register_next_step(self, chat_id: int, next_step: Callable[[telebot.types.Message], Awaitable[None]]) -> None:
+        """Запоминает обработчик следующего текстового сообщения чата"""
+        self.next_steps.set(chat_id, metrics.timed_handler(next_step.__name__, next_step))
+
+    def step_handler(self, step_name: str) -> Callable[[Union[telebot.types.Message, telebot.types.CallbackQuery]],
+                                                       Awaitable[None]]:
+        """
+        Возвращает обработчик, который выполняет шаг step_name и отправляет его сообщения (функция reply).
+        Синхронный шаг выполняется в отдельном потоке, чтобы обращения к user_store не блокировали цикл событий.
+        """
+        step = getattr(self, step_name)
+
+        @functools.wraps(step)
+        async def handler(update: Union[telebot.types.Message, telebot.types.CallbackQuery]) -> None:
+            if asyncio.iscoroutinefunction(step):
+                replies = await step(update)
+            else:
+                replies = await asyncio.to_thread(step, update)
+            await self.reply(logs.chat_id_of(update), replies)
+
+        return handler
+
+    async def reply(self, chat_id: int, replies: List[Reply]) -> None:
+        """
+        Отправляет сообщения шага по порядку с учетом лимитов телеграмма и запоминает шаг,
+        который обработает ответ пользователя на вопрос (next_step).
+        """
+        for i_reply in replies:
+            if i_reply.edit_message_id is not None:
+                await sender.send_async(self.limits, chat_id, self.bot.edit_message_text, i_reply.text, chat_id,
+                                        i_reply.edit_message_id, reply_markup=i_reply.reply_markup)
+                continue
+
+            # шаг запоминается до отправки вопроса: фильтр process_next_step проверяется без блокировки чата,
+            # поэтому ответ пользователя не должен прийти раньше, чем шаг, который его обработает
+            if i_reply.next_step is not None:
+                self.register_next_step(chat_id, self.step_handler(i_reply.next_step))
+            await sender.send_async(self.limits, chat_id, self.bot.send_message, chat_id, i_reply.text,
+                                    reply_markup=i_reply.reply_markup,
+                                    reply_to_message_id=i_reply.reply_to_message_id)
+
+    async def get_city(self, message: telebot.types.Message) -> List[Reply]:
+        """
+        Ищет города по сообщению пользователя (async_commands.location_search) и предлагает выбрать
+        город из найденных (show_cities).
+        """
+        return self.show_cities(message.chat.id, await async_commands.location_search(message.text))
+
+    async def show_list_price(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэки команд low_price и high_price, находит отели (async_commands.find_price_list)
+        и отправляет каждый отель, как только загружены его данные.
+        """
+        replies, cur_user, cur_search = await asyncio.to_thread(self.start_price_search, callback)
+        await self.reply(callback.message.chat.id, replies)
+
+        with logs.bind(search_id=cur_search.search_id):
+            if callback.data.endswith('low_price'):
+                updated_search = await async_commands.find_price_list(cur_search, low_price=True)
+
+            else:
+                updated_search = await async_commands.find_price_list(cur_search, high_price=True)
+
+            if not isinstance(updated_search, str):
+                updated_search = await self.send_price_results(callback.message.chat.id, updated_search)
+
+        return await asyncio.to_thread(self.finish_price_search, callback, cur_user, updated_search)
+
+    async def proces_max_distance(self, message: telebot.types.Message) -> List[Reply]:
+        """Проверяет максимальное расстояние (check_max_distance) и запускает настраиваемый поиск"""
+        replies, ready = self.check_max_distance(message)
+        if not ready:
+            return replies
+
+        await self.reply(message.chat.id, replies)
+        return await self.save_distance(message.chat.id)
+
+    async def save_distance(self, user_id: int) -> List[Reply]:
+        """
+        Сохраняет диапазон расстояний, находит отели для настраиваемого поиска
+        (async_commands.find_best_deal) и отправляет их функцией send_price_results.
+        """
+        cur_user, cur_search = await asyncio.to_thread(self.start_best_deal_search, user_id)
+
+        with logs.bind(search_id=cur_search.search_id):
+            updated_search = await async_commands.find_best_deal(cur_search)
+            if not isinstance(updated_search, str):
+                updated_search = await self.send_price_results(user_id, updated_search)
+
+        return await asyncio.to_thread(self.finish_best_deal_search, cur_user, updated_search)
+
+    async def send_price_results(self, chat_id: int, cur_search: 'Search') -> Union['Search', str]:
+        """
+        Загружает адреса и фото отелей и отправляет каждый отель, как только загружены его данные,
+        так быстро, как позволяют лимиты телеграмма. Курс валют может загружаться по сети,
+        поэтому цена конвертируется в отдельном потоке.
+        Возвращает поиск с загруженными отелями или текст ошибки, если не загружен ни один отель.
+        """
+        if len(cur_search.results) == 0:
+            await self.reply(chat_id, [Reply(NO_RESULTS_TEXT)])
+
+        else:
+
+            async for j_index, i_hotel in async_commands.stream_address_and_photos(cur_search):
+                converted_price = await asyncio.to_thread(get_converted_price, amount=i_hotel.price_per_night)
+                caption_text = hotel_caption(j_index, i_hotel, converted_price)
+
+                photos = i_hotel.photos_url
+
+                if len(photos) > 0:
+
+                    media_group = hotel_media_group(photos, caption_text)
+                    await sender.send_async(self.limits, chat_id, self.bot.send_media_group, chat_id, media_group,
+                                            cost=len(media_group))
+
+                else:
+                    await self.reply(chat_id, [Reply(caption_text)])
+
+            if len(cur_search.results) == 0:
+                return ERROR_TEXT
+
+        await self.reply(chat_id, self.ask_commands(again=True))
+
+        await asyncio.to_thread(cur_search.render_summary)
+
+        return cur_search
@@ -1,17 +1,36 @@
-from telegram_hotels_bot.user import user
+from telegram_hotels_bot.user import user, user_store
 from datetime import datetime, timedelta
 from telegram_hotels_bot.api_requests import api_requests
-from typing import List, Dict, Optional, Union
+from telegram_hotels_bot.bot import hotel_selection
+from typing import Iterator, List, Dict, Optional, Tuple, Union
 from telegram_hotels_bot import config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from telegram_hotels_bot.utils import logs
+import logging
 
 
+PAGE_SIZE = 200
 
+_detail_executor = ThreadPoolExecutor(max_workers=config.detail_workers, thread_name_prefix='hotel-details')
+_page_executor = ThreadPoolExecutor(max_workers=config.list_page_workers, thread_name_prefix='list-pages')
 
 
-def price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optional[Union[List['Hotel'], str]]:
+def price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optional[Union['Search', str]]:
+    """
+    Находит отели (find_price_list) и загружает их адреса и фото (get_address_and_photos).
+    """
+    cur_search = find_price_list(cur_search, low_price=low_price, high_price=high_price)
+
+    if isinstance(cur_search, str):
+        return cur_search
+
+    return get_address_and_photos(cur_search)
+
+
+def find_price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optional[Union['Search', str]]:
     """
     Создает параметры для запросов в Hotel Api, в результате которых получается список отелей
-    Также сохраняет тип поиска.
+    (без адресов и фото).
     """
 
     destination = cur_search.destination_info
@@ -24,7 +43,7 @@ def price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optio
         max_items = cur_search.max_items
 
     else:
-        max_items = 200
+        max_items = PAGE_SIZE
 
     try:
         data = get_properties_list_data(
@@ -44,18 +63,19 @@ def price_list(cur_search: 'Search', low_price=False, high_price=False) -> Optio
     elif high_price:
         cur_search = save_name_id_price(data, cur_search, high_price=True)
 
-    if isinstance(cur_search, str):
-        return cur_search
-
-    cur_search = get_address_and_photos(cur_search)
-
     return cur_search
 
 
 def get_properties_list_data(destination, check_in, check_out, people, result_index, max_items, high=False, low=False):
-    """Создает данные для запроса списка отелей"""
-    url = "https://hotels4.p.rapidapi.com/properties/v2/list"
+    """Отправляет запрос списка отелей"""
+    payload = properties_list_payload(destination, check_in, check_out, people, result_index, max_items)
+
+    data = api_requests.post_request(api_requests.PROPERTIES_LIST, payload=payload)
+    return data
+
 
+def properties_list_payload(destination, check_in, check_out, people, result_index, max_items) -> Dict:
+    """Создает данные для запроса списка отелей"""
     payload = {
         "currency": "USD",
 
@@ -63,14 +83,14 @@ def get_properties_list_data(destination, check_in, check_out, people, result_in
 
         "destination": destination,
         "checkInDate": {
-            "day": check_in['day'],
-            "month": check_in['month'],
-            "year": check_in['year']
+            "day": check_in.day,
+            "month": check_in.month,
+            "year": check_in.year
         },
         "checkOutDate": {
-            "day": check_out['day'],
-            "month": check_out['month'],
-            "year": check_out['year']
+            "day": check_out.day,
+            "month": check_out.month,
+            "year": check_out.year
         },
         "rooms": people,
 
@@ -82,113 +102,220 @@ def get_properties_list_data(destination, check_in, check_out, people, result_in
         }
 
     }
-    headers = {
-        "content-type": "application/json",
-        "X-RapidAPI-Key": config.rapidAPI_key,
-        "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
-    }
 
-    data = api_requests.post_request(url=url, payload=payload, headers=headers)
-    return data
+    return payload
 
 
-def save_name_id_price(data: Dict, cur_search: 'Search', low_price=False, high_price=False) -> 'Search':
-    """Обновляет данные текущего поиска, добавляя в него цену и идентификационный номер отеля"""
+def save_name_id_price(data: Dict, cur_search: 'Search', low_price=False, high_price=False) -> Union['Search', str]:
+    """
+    Обновляет данные текущего поиска, добавляя в него max_items самых дешевых (low_price)
+    или самых дорогих (high_price) отелей с ценой и идентификационным номером
+    """
     cur_search.results = []
-    destination = cur_search.destination_info
-    check_in = cur_search.check_in
-    check_out = cur_search.check_out
-    people = cur_search.people
-    max_items = cur_search.max_items
-    data = data.get('data').get('propertySearch').get('properties')
 
     if high_price:
-        result_index = 0
-        data_amnt = len(data)
-        while data_amnt == 200:
-            result_index += 199
-            data = get_properties_list_data(
-                destination=destination, check_in=check_in, check_out=check_out,
-                people=people, result_index=result_index, max_items=200
-            )
-
-            count = 0
-            while data is None or 'errors' in data.keys():
-                data = get_properties_list_data(
-                    destination=destination, check_in=check_in, check_out=check_out,
-                    people=people, result_index=result_index, max_items=200
-                )
-                count += 1
-                if count > 5:
-                    return 'Что-то пошло не так. Попробуйте повторить запрос'
+        data = fetch_most_expensive(data, cur_search)
+        if isinstance(data, str):
+            return data
+
+    else:
+        properties = page_properties(data)
+        if properties is None:
+            return 'Что-то пошло не так. Попробуйте повторить запрос'
+
+        cheapest = hotel_selection.TopHotels(cur_search.max_items, ranking=hotel_selection.by_price)
+        cheapest.add(properties)
+        data = cheapest.result()
+
+    cur_search.results = hotels_from_properties(data)
+
+    return cur_search
+
+
+def hotels_from_properties(properties: List[Dict]) -> List['Hotel']:
+    """Создает объекты класса Hotel из отобранных отелей ответа Hotels Api"""
+    hotels = []
+    for i_data in properties:
+        price = round(hotel_selection.property_price(i_data), 2)
+        distance_from_destination = hotel_selection.property_distance(i_data)
+
+        new_hotel = user.Hotel(name=i_data['name'], hotel_id=i_data['id'],
+                               price_per_night=price, distance_from_destination=distance_from_destination)
+        hotels.append(new_hotel)
+
+    return hotels
+
+
+def fetch_most_expensive(data: Dict, cur_search: 'Search') -> Union[List[Dict], str]:
+    """
+    Находит самые дорогие отели среди всех результатов поиска. По первой странице определяет
+    общее количество отелей, остальные страницы загружает параллельно. Во время обработки страниц
+    хранит только max_items самых дорогих отелей (в куче) и пропускает повторяющиеся отели.
+    Возвращает данные отелей, отсортированные от самого дорогого к самому дешевому.
+    """
+    most_expensive = hotel_selection.TopHotels(cur_search.max_items, ranking=hotel_selection.by_price_desc)
 
-            data = data.get('data').get('propertySearch').get('properties')
-            data_amnt = len(data)
+    properties = page_properties(data)
+    if properties is None:
+        return 'Что-то пошло не так. Попробуйте повторить запрос'
 
-        data = data[::-1]
+    property_search = data['data']['propertySearch']
+    most_expensive.add(properties)
 
-    for i_index, i_data in enumerate(data):
+    if len(properties) == PAGE_SIZE:
+        total = (property_search.get('summary') or {}).get('matchedPropertiesSize')
 
-        if i_index + 1 > max_items:
-            break
+        if total is None:
+            result_index = PAGE_SIZE
+            while len(properties) == PAGE_SIZE:
+                properties = get_properties_page(cur_search, result_index)
+                if properties is None:
+                    return 'Что-то пошло не так. Попробуйте повторить запрос'
+                most_expensive.add(properties)
+                result_index += PAGE_SIZE
 
         else:
-            hotel_name = i_data['name']
-            hotel_id = i_data['id']
+            futures = [_page_executor.submit(logs.in_context(get_properties_page), cur_search, result_index)
+                       for result_index in range(PAGE_SIZE, total, PAGE_SIZE)]
 
-            price = round(float(i_data['price']['lead']['amount']), 2)
+            for i_future in as_completed(futures):
+                try:
+                    properties = i_future.result()
 
-            distance_from_destination = float(i_data['destinationInfo']['distanceFromDestination']['value'])
+                except Exception as exc:
+                    logging.error(exc)
+                    properties = None
 
-            new_hotel = user.Hotel(name=hotel_name, hotel_id=hotel_id,
-                                   price_per_night=price, distance_from_destination=distance_from_destination)
-            cur_search.results.append(new_hotel)
+                if properties is None:
+                    for j_future in futures:
+                        j_future.cancel()
+                    return 'Что-то пошло не так. Попробуйте повторить запрос'
+                most_expensive.add(properties)
 
-    return cur_search
+    return most_expensive.result()
 
 
-def get_address_and_photos(cur_search: 'Search') -> 'Search':
-    """Обновляет данные текущего поиска, добавляя в него адреса и фото отелей"""
-    for i_hotel in cur_search.results:
-        url = "https://hotels4.p.rapidapi.com/properties/v2/detail"
+def get_properties_page(cur_search: 'Search', result_index: int) -> Optional[List[Dict]]:
+    """
+    Загружает одну страницу списка отелей, начиная с result_index.
+    Возвращает None, если страницу загрузить не удалось.
+    """
+    data = get_properties_list_data(
+        destination=cur_search.destination_info, check_in=cur_search.check_in, check_out=cur_search.check_out,
+        people=cur_search.people, result_index=result_index, max_items=PAGE_SIZE
+    )
 
-        payload = {
-            "currency": "USD",
-            "locale": "ru_RU",
-            "propertyId": i_hotel.hotel_id
-        }
+    return page_properties(data)
 
-        headers = {
-            "content-type": "application/json",
-            "X-RapidAPI-Key": config.rapidAPI_key,
-            "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
-        }
 
-        data = api_requests.post_request(url=url, payload=payload, headers=headers)
-        count = 0
-        while data is None or 'errors' in data.keys():
-            data = api_requests.post_request(url=url, payload=payload, headers=headers)
-            count += 1
-            if count > 5:
-                return 'Что-то пошло не так. Попробуйте повторить запрос'
+def page_properties(data: Optional[Dict]) -> Optional[List[Dict]]:
+    """
+    Возвращает список отелей из ответа на запрос списка отелей. Возвращает None, если ответа нет
+    или в нем нет списка отелей (например, ответ с errors или с data: null).
+    """
+    if data is None:
+        return None
 
-        address_dict = data['data']['propertyInfo']['summary']['location']['address']
-        address_line = address_dict['addressLine']
-        i_hotel.address = address_line
-        data = enumerate(data['data']['propertyInfo']['propertyGallery']['images'])
-        i_hotel.photos_url = []
+    try:
+        properties = data.get('data').get('propertySearch').get('properties')
 
-        for i_index, i_data in data:
-            if (cur_search.photos_amnt < 1) or (i_index + 1 > cur_search.photos_amnt):
-                break
+    except (AttributeError, TypeError):
+        return None
 
-            image_dict = i_data['image']
+    return properties if isinstance(properties, list) else None
+
+
+def get_address_and_photos(cur_search: 'Search') -> Union['Search', str]:
+    """
+    Обновляет данные текущего поиска, добавляя в него адреса и фото отелей.
+    Запросы для всех отелей выполняются параллельно. Отели, данные которых не удалось загрузить,
+    убираются из результатов поиска.
+    """
+    hotels = cur_search.results
+    photos_amnt = cur_search.photos_amnt
+    futures = [_detail_executor.submit(logs.in_context(get_hotel_details), i_hotel, photos_amnt) for i_hotel in hotels]
+    loaded = [i_future.result() for i_future in futures]
 
-            i_hotel.photos_url.append(image_dict['url'])
+    cur_search.results = [i_hotel for i_hotel, is_loaded in zip(hotels, loaded) if is_loaded]
+
+    if len(hotels) > 0 and len(cur_search.results) == 0:
+        return 'Что-то пошло не так. Попробуйте повторить запрос'
 
     return cur_search
 
 
+def stream_address_and_photos(cur_search: 'Search') -> Iterator[Tuple[int, 'Hotel']]:
+    """
+    Загружает адреса и фото отелей текущего поиска параллельно и возвращает отели по одному вместе
+    с их местом в результатах поиска (с нуля), как только загружены данные отеля. Отели возвращаются
+    в порядке загрузки, а не в порядке результатов, чтобы медленный ответ по одному отелю не задерживал
+    отправку остальных. Отели, данные которых не удалось загрузить, пропускаются. Когда все отели
+    возвращены, в результатах поиска остаются только загруженные отели (в прежнем порядке).
+    """
+    hotels = cur_search.results
+    photos_amnt = cur_search.photos_amnt
+    futures = {_detail_executor.submit(logs.in_context(get_hotel_details), i_hotel, photos_amnt): index
+               for index, i_hotel in enumerate(hotels)}
+
+    loaded = set()
+    for i_future in as_completed(futures):
+        index = futures[i_future]
+        if i_future.result():
+            loaded.add(index)
+            yield index, hotels[index]
+
+    cur_search.results = [i_hotel for index, i_hotel in enumerate(hotels) if index in loaded]
+
+
+def get_hotel_details(i_hotel: 'Hotel', photos_amnt: int) -> bool:
+    """
+    Загружает адрес и фото одного отеля. Возвращает False, если данные отеля загрузить не удалось.
+    """
+    try:
+        data = api_requests.post_request(api_requests.PROPERTIES_DETAIL, payload=detail_payload(i_hotel.hotel_id))
+
+    except Exception as exc:
+        logging.error(exc)
+        return False
+
+    return save_hotel_details(i_hotel, data, photos_amnt)
+
+
+def detail_payload(hotel_id: str) -> Dict:
+    """Создает данные для запроса адреса и фото отеля"""
+    payload = {
+        "currency": "USD",
+        "locale": "ru_RU",
+        "propertyId": hotel_id
+    }
+
+    return payload
+
+
+def save_hotel_details(i_hotel: 'Hotel', data: Optional[Dict], photos_amnt: int) -> bool:
+    """
+    Сохраняет в отель адрес и ссылки на фото из ответа Hotels Api.
+    Возвращает False, если в ответе нет нужных данных.
+    """
+    if data is None:
+        return False
+
+    try:
+        address_dict = data['data']['propertyInfo']['summary']['location']['address']
+        images = data['data']['propertyInfo']['propertyGallery']['images']
+        address = address_dict['addressLine']
+        photos_url = [i_data['image']['url'] for i_data in images[:max(photos_amnt, 0)]]
+
+    except Exception as exc:
+        logging.error(exc)
+        return False
+
+    i_hotel.address = address
+    i_hotel.photos_url = photos_url
+
+    return True
+
+
 def days(check_in: str, check_out: str) -> int:
     """
     Считает общее кол-во дней пребывания
@@ -201,20 +328,12 @@ def days(check_in: str, check_out: str) -> int:
 
 def give_history(user_id: int) -> str:
     """
-    Формирует сообщение с результатами последних пяти поисков
+    Формирует сообщение с результатами последних поисков (не больше config.history_size).
     """
-    cur_user = user.find_user(user_id)
-    if len(cur_user.searches) > 0:
-        for i_search in cur_user.searches:
-            if len(i_search.results) < 1:
-                cur_user.searches.remove(i_search)
-
-        cur_user.searches = cur_user.searches[:5]
-
-
-        message_text = '\n'.join([f'{search}' for search in cur_user.searches])
-
-        user.save_users(cur_user)
+    cur_user = user_store.find_user(user_id)
+    history = cur_user.history
+    if len(history) > 0:
+        message_text = '\n'.join([search.summary for search in history])
 
         return message_text
 
@@ -223,41 +342,62 @@ def give_history(user_id: int) -> str:
 
 def best_deal(cur_search):
     """
-    Сохраняет данные из запроса для настраиваемого поиска
+    Находит отели для настраиваемого поиска (find_best_deal) и загружает их адреса и фото.
+    """
+    cur_search = find_best_deal(cur_search)
+    if isinstance(cur_search, str):
+        return cur_search
+
+    return get_address_and_photos(cur_search)
+
+
+def find_best_deal(cur_search):
+    """
+    Сохраняет данные из запроса для настраиваемого поиска (без адресов и фото)
     """
     data = get_best_deal_data(cur_search)
     if isinstance(data, str):
         return data
 
-    max_price = cur_search.price_range['max']
-    min_price = cur_search.price_range['min']
-    max_distance = cur_search.distance_range['max_distance']
-    min_distance = cur_search.distance_range['min_distance']
+    cur_search.results = select_best_deal(data, cur_search)
 
-    name_id_price_distance = []
-
-    for i_data in data:
-        hotel_name = i_data['name']
-        hotel_id = i_data['id']
-        price = float(i_data['price']['lead']['amount'])
-        distance = float(i_data['destinationInfo']['distanceFromDestination']['value'])
-        new_hotel = {'name': hotel_name, 'id': hotel_id,
-                     'price': price, 'distance': distance}
-        name_id_price_distance.append(new_hotel)
+    return cur_search
 
-    filter_price = list(filter(lambda hotel: min_price < hotel['price'] < max_price, name_id_price_distance))
-    filtered_list = list(filter(lambda hotel: min_distance < hotel['distance'] < max_distance, filter_price))
 
-    cur_search.results = [user.Hotel(name=i_hotel['name'], hotel_id=i_hotel['id'],
-                                     price_per_night=i_hotel['price'], distance_from_destination=i_hotel['distance'])
-                          for i_index, i_hotel in enumerate(filtered_list) if (i_index + 1) < cur_search.max_items]
+def select_best_deal(data: List[Dict], cur_search: 'Search') -> List['Hotel']:
+    """
+    Отбирает max_items лучших (по ранжированию config.best_deal_ranking) отелей, подходящих
+    под диапазоны цены и расстояния текущего поиска
+    """
+    price_range = cur_search.price_range
+    distance_range = cur_search.distance_range
 
-    cur_search = get_address_and_photos(cur_search)
+    best = hotel_selection.TopHotels(
+        cur_search.max_items, ranking=hotel_selection.best_deal_ranking(cur_search),
+        predicate=hotel_selection.in_ranges(price_range['min'], price_range['max'],
+                                            distance_range['min_distance'], distance_range['max_distance'])
+    )
+    best.add(data)
 
-    return cur_search
+    return hotels_from_properties(best.result())
 
 
 def get_best_deal_data(cur_search):
+    """
+    Отправляет запрос для настраиваемого поиска
+    """
+    data = api_requests.post_request(api_requests.PROPERTIES_LIST, payload=best_deal_payload(cur_search))
+
+    try:
+        data = data.get('data').get('propertySearch').get('properties')
+
+    except AttributeError:
+        data = 'Что-то пошло не так, попробуйте начать поиск с начала'
+
+    return data
+
+
+def best_deal_payload(cur_search) -> Dict:
     """
     Формирует данные для запроса для настраиваемого поиска
     """
@@ -267,8 +407,6 @@ def get_best_deal_data(cur_search):
     people = cur_search.people
     price_range = cur_search.price_range
 
-    url = "https://hotels4.p.rapidapi.com/properties/v2/list"
-
     payload = {
         "currency": "USD",
 
@@ -276,14 +414,14 @@ def get_best_deal_data(cur_search):
 
         "destination": destination_info,
         "checkInDate": {
-            "day": check_in['day'],
-            "month": check_in['month'],
-            "year": check_in['year']
+            "day": check_in.day,
+            "month": check_in.month,
+            "year": check_in.year
         },
         "checkOutDate": {
-            "day": check_out['day'],
-            "month": check_out['month'],
-            "year": check_out['year']
+            "day": check_out.day,
+            "month": check_out.month,
+            "year": check_out.year
         },
         "rooms": people,
 
@@ -297,22 +435,6 @@ def get_best_deal_data(cur_search):
         }
 
     }
-    headers = {
-        "content-type": "application/json",
-        "X-RapidAPI-Key": config.rapidAPI_key,
-        "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
-    }
 
-    data = api_requests.post_request(url=url, headers=headers, payload=payload)
+    return payload
 
-    try:
-        data = data.get('data').get('propertySearch').get('properties')
-
-    except AttributeError:
-        data = api_requests.post_request(url=url, headers=headers, payload=payload)
-
-        data = data.get('data', 0)
-        if data is None:
-            data = 'Что-то пошло не так, попробуйте начать поиск с начала'
-
-    return data
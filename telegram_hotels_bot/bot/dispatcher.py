@@ -0,0 +1,167 @@
+import logging
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, List
+import telebot
+from telebot import TeleBot
+from telegram_hotels_bot.utils import logs, metrics
+
+"""
+Файл с классами для обработки обновлений телеграмма несколькими потоками. Обновления одного чата
+обрабатываются строго по очереди, обновления разных чатов - параллельно.
+"""
+
+_STOP = object()
+
+CHAT_UPDATE_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query',
+                      'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                      'my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def chat_key(update: telebot.types.Update) -> Hashable:
+    """Возвращает идентификационный номер чата (или пользователя), к которому относится обновление"""
+    for field in CHAT_UPDATE_FIELDS:
+        content = getattr(update, field, None)
+        if content is None:
+            continue
+
+        chat = getattr(content, 'chat', None) or getattr(getattr(content, 'message', None), 'chat', None)
+        if chat is not None:
+            return chat.id
+
+        from_user = getattr(content, 'from_user', None)
+        if from_user is not None:
+            return from_user.id
+
+    return update.update_id
+
+
+class ChatDispatcher:
+    """
+    Класс ChatDispatcher. Распределяет обновления между потоками-обработчиками. У каждого чата своя очередь
+    обновлений; пока обновление чата обрабатывается, следующие обновления этого чата ждут.
+    Arguments:
+        self._handle (Callable): функция обработки одного обновления.
+        self._workers (int): количество потоков-обработчиков.
+        self._pending (Dict[Hashable, Deque]): очереди обновлений по чатам.
+        self._ready (queue.Queue): чаты, обновления которых можно обрабатывать.
+        self._depth (int): количество обновлений, ожидающих обработки.
+        self._max_depth (int): наибольшее количество ожидающих обновлений за время работы.
+    """
+
+    def __init__(self, handle: Callable[[telebot.types.Update], None], workers: int):
+        self._handle = handle
+        self._workers = workers
+        self._pending: Dict[Hashable, Deque[telebot.types.Update]] = {}
+        self._ready: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._depth = 0
+        self._max_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Геттер для количества обновлений, ожидающих обработки"""
+        return self._depth
+
+    @property
+    def max_queue_depth(self) -> int:
+        """Геттер для наибольшего количества ожидающих обновлений"""
+        return self._max_depth
+
+    @property
+    def active_chats(self) -> int:
+        """Геттер для количества чатов, у которых есть необработанные обновления"""
+        return len(self._pending)
+
+    def start(self) -> None:
+        """Запускает потоки-обработчики (если они еще не запущены)"""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self._workers):
+                thread = threading.Thread(target=self._work, name=f'update-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Дожидается обработки всех обновлений и останавливает потоки-обработчики"""
+        with self._idle:
+            while self._depth > 0:
+                self._idle.wait()
+
+        for _ in self._threads:
+            self._ready.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, update: telebot.types.Update) -> None:
+        """Ставит обновление в очередь его чата"""
+        key = chat_key(update)
+        with self._lock:
+            self._depth += 1
+            self._max_depth = max(self._max_depth, self._depth)
+            chat_updates = self._pending.get(key)
+            if chat_updates is None:
+                self._pending[key] = deque([update])
+                self._ready.put(key)
+            else:
+                chat_updates.append(update)
+
+    def _work(self) -> None:
+        """Обрабатывает обновления чатов из очереди _ready"""
+        while True:
+            key = self._ready.get()
+            if key is _STOP:
+                return
+
+            with self._lock:
+                update = self._pending[key].popleft()
+
+            try:
+                self._handle(update)
+            except Exception as exc:
+                logging.error(exc)
+
+            with self._lock:
+                self._depth -= 1
+                if self._pending[key]:
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+                if self._depth == 0:
+                    self._idle.notify_all()
+
+
+class DispatchingTeleBot(TeleBot):
+    """
+    Класс DispatchingTeleBot. TeleBot, который передает полученные обновления в ChatDispatcher
+    вместо того, чтобы обрабатывать их в потоке получения обновлений.
+    Arguments:
+        self.dispatcher (ChatDispatcher): распределитель обновлений по потокам.
+    """
+
+    def __init__(self, token: str, workers: int, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.dispatcher = ChatDispatcher(self._process_update, workers)
+
+    def process_new_updates(self, updates: List[telebot.types.Update]) -> None:
+        """Ставит обновления в очередь на обработку"""
+        self.dispatcher.start()
+        for update in updates:
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(update)
+
+    def register_next_step_handler(self, message: telebot.types.Message, callback: Callable, *args, **kwargs) -> None:
+        """Регистрирует обработчик следующего сообщения чата. Время его работы записывается в метрики"""
+        super().register_next_step_handler(message, metrics.timed_handler(callback.__name__, callback),
+                                           *args, **kwargs)
+
+    def _process_update(self, update: telebot.types.Update) -> None:
+        """Обрабатывает одно обновление зарегистрированными обработчиками (записи логов получают chat_id)"""
+        with logs.bind(chat_id=chat_key(update)):
+            super().process_new_updates([update])
@@ -2,17 +2,20 @@ import re
 import requests
 import bs4
 import telebot
-import os
 import string
-import pickle
-from telegram_hotels_bot.user import user
+from typing import Iterable, List, Pattern
+from telegram_hotels_bot import config
+from telegram_hotels_bot.user import user, user_store
+from telegram_hotels_bot.utils import refreshing_cache
 
 
 """
 Файл с функциями для проверки сообщения на приветствие, формирование нового сообщения для отправки
-и сохранения данных о пользователе в файле history.pickle.
+и сохранения данных о пользователе в хранилище пользователей.
 """
 
+BUNDLED_SYNONYMS = ('привет', 'здорово')
+
 
 def greetings(message: telebot.types.Message) -> bool:
     """Проверяет сообщение, если находит в нем приветствие"""
@@ -30,49 +33,67 @@ def greetings(message: telebot.types.Message) -> bool:
     return False
 
 
-def check_synonyms(greeting_word: str) -> bool:
-    """Проверяет, есть ли приветственное сообщение в списке синонимов к слову привет из wiktionary"""
+def fetch_synonyms() -> List[str]:
+    """Загружает список синонимов к слову привет из wiktionary"""
     url = 'https://ru.wiktionary.org/wiki/%D0%BF%D1%80%D0%B8%D0%B2%D0%B5%D1%82'
-    my_req = requests.get(url)
+    my_req = requests.get(url, timeout=10)
     soup = bs4.BeautifulSoup(my_req.text, 'lxml')
 
     synonyms = [item.text for item in soup.find(class_='mw-parser-output').find_all('ol')[1].find_all('a')
                 if not item.text.endswith('.')]
 
-    synonyms += ['привет', 'здорово']
+    if not synonyms:
+        raise ValueError('Список синонимов из wiktionary пуст')
 
-    for i_synonym in synonyms:
+    return synonyms
 
-        pattern = rf'{i_synonym}'
-        if re.search(pattern, greeting_word):
-            return True
 
-    return False
+def build_pattern(synonyms: Iterable[str]) -> Pattern:
+    """
+    Собирает из синонимов и встроенного списка BUNDLED_SYNONYMS одно регулярное выражение (сначала более
+    длинные варианты). Самих слов привет и здорово нет среди синонимов в wiktionary, поэтому встроенный
+    список добавляется всегда, а пустой список синонимов не превращается в выражение, совпадающее с любым
+    сообщением.
+    """
+    words = {synonym.lower() for synonym in (*synonyms, *BUNDLED_SYNONYMS) if synonym}
+    return re.compile('|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+
+_synonyms = refreshing_cache.RefreshingFileCache(config.greetings_cache_path, 'synonyms',
+                                                 config.greetings_refresh_interval, fetch=fetch_synonyms,
+                                                 parse=build_pattern, default=list(BUNDLED_SYNONYMS),
+                                                 thread_name='greetings')
+
+
+def get_pattern() -> Pattern:
+    """
+    Возвращает регулярное выражение с синонимами. При первом вызове берет синонимы из файла кэша
+    (или встроенного списка), а если они устарели, то обновляет их в фоновом потоке, не задерживая
+    обработку сообщения.
+    """
+    return _synonyms.get()
+
+
+def check_synonyms(greeting_word: str) -> bool:
+    """Проверяет, есть ли приветственное сообщение в списке синонимов к слову привет из wiktionary"""
+    return get_pattern().search(greeting_word) is not None
 
 
 def say_hi_and_remember(message: telebot.types.Message) -> str:
     """
-    Смотрит историю пользователей, проверяя, есть ли там данные о текущем пользователе.
+    Ищет текущего пользователя в хранилище пользователей, при отсутствии сохраняет его.
     Формирует сообщение для ответного приветствия.
     """
-    path = os.path.abspath(os.path.join(os.path.curdir, 'history.pickle'))
-    history = open(path, 'rb')
-    all_users = pickle.load(history)
-    history.close()
-    if (len(all_users.keys()) < 1) or (message.from_user.id not in all_users):
+    store = user_store.get_store()
+    cur_user = store.get_user(message.from_user.id)
+
+    if cur_user is None:
         user_id = message.from_user.id
         firstname = message.from_user.first_name
         lastname = message.from_user.last_name
         username = message.from_user.username
         new_user = user.User(user_id=user_id, firstname=firstname, lastname=lastname, username=username)
-        all_users[new_user.user_id] = new_user
-
-        with open('history.pickle', 'wb') as history:
-            pickle.dump(all_users, history)
+        store.save_user(new_user)
         return f'Здравствуйте, {new_user.firstname}!'
 
-    else:
-
-        for user_id, i_user in all_users.items():
-            if user_id == message.from_user.id:
-                return f'Рады вас снова видеть, {i_user.firstname}!'
+    return f'Рады вас снова видеть, {cur_user.firstname}!'
@@ -0,0 +1,123 @@
+import heapq
+import itertools
+from typing import Callable, Dict, List, Optional
+from telegram_hotels_bot import config
+
+"""
+Файл с отбором лучших отелей из ответа Hotels Api. Отели проверяются фильтром и ранжируются за один проход
+по данным ответа, а в куче хранятся только max_items лучших отелей. Для отелей, не прошедших фильтр,
+ничего не создается.
+"""
+
+Ranking = Callable[[Dict], float]
+Predicate = Callable[[Dict], bool]
+
+
+def property_price(i_data: Dict) -> float:
+    """Возвращает цену отеля за ночь из данных ответа Hotels Api"""
+    return float(i_data['price']['lead']['amount'])
+
+
+def property_distance(i_data: Dict) -> float:
+    """Возвращает расстояние от отеля до центра из данных ответа Hotels Api"""
+    return float(i_data['destinationInfo']['distanceFromDestination']['value'])
+
+
+def by_price(i_data: Dict) -> float:
+    """Ранжирование от самого дешевого отеля к самому дорогому"""
+    return property_price(i_data)
+
+
+def by_price_desc(i_data: Dict) -> float:
+    """Ранжирование от самого дорогого отеля к самому дешевому"""
+    return -property_price(i_data)
+
+
+def by_distance(i_data: Dict) -> float:
+    """Ранжирование от самого близкого к центру отеля к самому далекому"""
+    return property_distance(i_data)
+
+
+def weighted_score(max_price: float, max_distance: float) -> Ranking:
+    """
+    Создает ранжирование по взвешенной сумме цены и расстояния, нормированных на верхние границы
+    диапазонов поиска (веса задаются в config.ranking_price_weight и config.ranking_distance_weight).
+    """
+    price_weight = config.ranking_price_weight / max_price if max_price > 0 else 0.0
+    distance_weight = config.ranking_distance_weight / max_distance if max_distance > 0 else 0.0
+
+    def score(i_data: Dict) -> float:
+        return price_weight * property_price(i_data) + distance_weight * property_distance(i_data)
+
+    return score
+
+
+def in_ranges(min_price: float, max_price: float, min_distance: float, max_distance: float) -> Predicate:
+    """Создает фильтр отелей, цена и расстояние до центра которых строго внутри диапазонов"""
+
+    def check(i_data: Dict) -> bool:
+        return (min_price < property_price(i_data) < max_price
+                and min_distance < property_distance(i_data) < max_distance)
+
+    return check
+
+
+def best_deal_ranking(cur_search: 'Search') -> Ranking:
+    """
+    Возвращает ранжирование настраиваемого поиска, выбранное в config.best_deal_ranking:
+    'distance' - по расстоянию до центра, 'price' - по цене, 'score' - по взвешенной сумме цены и расстояния.
+    """
+    if config.best_deal_ranking == 'price':
+        return by_price
+    if config.best_deal_ranking == 'score':
+        return weighted_score(cur_search.price_range['max'], cur_search.distance_range['max_distance'])
+    return by_distance
+
+
+class TopHotels:
+    """
+    Класс TopHotels. Хранит в куче max_items лучших (с наименьшим значением ranking) отелей из добавленных
+    данных, прошедших фильтр predicate, и пропускает отели, которые уже были добавлены.
+    Arguments:
+        self._max_items (int): количество хранимых отелей.
+        self._ranking (Ranking): функция ранжирования; чем меньше значение, тем лучше отель.
+        self._predicate (Optional[Predicate]): фильтр отелей (None - подходят все отели).
+        self._heap (List[Tuple]): куча из значения ранжирования со знаком минус, порядкового номера
+        и данных отеля (в вершине кучи - худший из хранимых отелей).
+        self._seen_ids (Set[str]): идентификационные номера добавленных отелей.
+    """
+
+    def __init__(self, max_items: int, ranking: Ranking, predicate: Optional[Predicate] = None):
+        self._max_items = max_items
+        self._ranking = ranking
+        self._predicate = predicate
+        self._heap = []
+        self._seen_ids = set()
+        self._counter = itertools.count()
+
+    def add(self, properties: List[Dict]) -> None:
+        """Добавляет отели из данных ответа, оставляя в куче только лучшие"""
+        if self._max_items < 1:
+            return
+
+        for i_data in properties:
+            if self._predicate is not None and not self._predicate(i_data):
+                continue
+
+            hotel_id = i_data['id']
+            if hotel_id in self._seen_ids:
+                continue
+
+            rank = -self._ranking(i_data)
+            if len(self._heap) < self._max_items:
+                heapq.heappush(self._heap, (rank, next(self._counter), i_data))
+            elif rank > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (rank, next(self._counter), i_data))
+            else:
+                continue
+
+            self._seen_ids.add(hotel_id)
+
+    def result(self) -> List[Dict]:
+        """Возвращает данные отелей от лучшего к худшему (при равенстве - в порядке добавления)"""
+        return [i_data for _, _, i_data in sorted(self._heap, key=lambda item: (-item[0], item[1]))]
@@ -1,20 +1,98 @@
+import threading
+from typing import Dict, List, Optional, Union
 from telegram_hotels_bot.api_requests import api_requests
+from telegram_hotels_bot.utils import metrics, ttl_cache
 from telegram_hotels_bot import config
 
 
+class CityNameIndex:
+    """
+    Класс CityNameIndex. Хранит найденные ранее города по нормализованному названию (без региона и страны),
+    чтобы находить их по точному названию без запроса к Hotels Api. Записи устаревают через ttl секунд,
+    как и сохраненные результаты поиска.
+    Arguments:
+        self._destinations (TTLCache): данные городов по названию.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._destinations = ttl_cache.TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def add(self, found_destinations: List[Dict]) -> None:
+        """Добавляет в индекс города из результата location_search"""
+        with self._lock:
+            for destination_info in found_destinations:
+                for full_name in destination_info:
+                    name = normalize_query(full_name.split(',')[0])
+                    destinations = self._destinations.get(name, [])
+                    if destination_info not in destinations:
+                        self._destinations.set(name, destinations + [destination_info])
+
+    def find(self, query: str) -> Optional[List[Dict]]:
+        """Возвращает города, нормализованное название которых совпадает с query"""
+        return self._destinations.get(query)
+
+
+_found_cities = ttl_cache.TTLCache(maxsize=config.city_cache_size, ttl=config.city_cache_ttl)
+_city_index = CityNameIndex(maxsize=config.city_name_index_size, ttl=config.city_cache_ttl)
+
+
+def normalize_query(city_name: str) -> str:
+    """Приводит название города к нижнему регистру, заменяет ё на е и убирает лишние пробелы"""
+    return ' '.join(city_name.casefold().replace('ё', 'е').split())
+
+
 def location_search(city_name):
+    """
+    Находит города по названию. Результаты запросов к Hotels Api сохраняются, поэтому повторный
+    поиск того же города (и поиск по названию уже найденного города) выполняется без запроса.
+    """
+    query = normalize_query(city_name)
 
-    url = "https://hotels4.p.rapidapi.com/locations/v3/search"
+    found_destinations = find_known_destinations(query)
+    if found_destinations is not None:
+        return found_destinations
 
     querystring = {"q": city_name, "locale": "ru_RU"}
 
-    headers = {
-        "X-RapidAPI-Key": config.rapidAPI_key,
-        "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
-    }
+    data = api_requests.get_request(api_requests.LOCATIONS_SEARCH, querystring=querystring)
+
+    found_destinations = parse_destinations(data)
+    if not isinstance(found_destinations, str):
+        remember_destinations(query, found_destinations)
+
+    return found_destinations
+
+
+def find_known_destinations(query: str) -> Optional[List[Dict]]:
+    """
+    Ищет результат поиска по нормализованному названию города среди сохраненных результатов
+    и записывает попадание или промах в метрики кэша cities. Используется синхронным и асинхронным поиском.
+    """
+    found_destinations = _found_cities.get(query)
+    if found_destinations is None and config.city_name_index:
+        found_destinations = _city_index.find(query)
+
+    metrics.count_cache('cities', hit=found_destinations is not None)
+    return found_destinations
+
+
+def remember_destinations(query: str, found_destinations: List[Dict]) -> None:
+    """Сохраняет результат поиска города"""
+    _found_cities.set(query, found_destinations)
+    if config.city_name_index:
+        _city_index.add(found_destinations)
 
-    data = api_requests.get_request(url=url, querystring=querystring, headers=headers)
 
+def clear_cache() -> None:
+    """Удаляет сохраненные результаты поиска городов"""
+    global _city_index
+    _found_cities.clear()
+    _city_index = CityNameIndex(maxsize=config.city_name_index_size, ttl=config.city_cache_ttl)
+
+
+def parse_destinations(data: Optional[Dict]) -> Union[List[Dict], str]:
+    """Формирует список найденных городов из ответа Hotels Api"""
     if (data is None) or ('errors' in data.keys()):
         return 'Что-то пошло не так. Попробуйте повторить запрос'
 
@@ -34,7 +112,3 @@ def location_search(city_name):
             found_destinations.append(destination_info)
 
     return found_destinations
-
-
-
-
@@ -1,5 +1,6 @@
 import telebot
 from telebot import types
+from typing import Dict, Iterable, List, Optional, Tuple
 from telegram_hotels_bot.user import user
 
 """
@@ -79,3 +80,114 @@ def again_option_choice_keyboard():
     history_btn = types.InlineKeyboardButton('Показать историю поиска', callback_data='/history')
     keyboard.add(low_price_btn, high_price_btn, best_deal_btn, new_data_btn, history_btn)
     return keyboard
+
+
+def find_hotels_kb() -> telebot.types.InlineKeyboardMarkup:
+    """
+    Создает Inline клавиатуру с кнопкой 'Найти отели'.
+    """
+    keyboard = types.InlineKeyboardMarkup(row_width=1)
+    button = types.InlineKeyboardButton('Найти отели', callback_data='get_city')
+    keyboard.add(button)
+    return keyboard
+
+
+def history_kb(searches_id: Iterable[str]) -> telebot.types.InlineKeyboardMarkup:
+    """
+    Создает Inline клавиатуру с номерами поисков из истории и кнопкой нового поиска.
+    """
+    keyboard = types.InlineKeyboardMarkup(row_width=5)
+    id_buttons = (types.InlineKeyboardButton(text=f'{search_id}', callback_data=f'#search{search_id}')
+                  for search_id in searches_id)
+    keyboard.add(*id_buttons)
+    keyboard.add(types.InlineKeyboardButton(text='Начать другой поиск', callback_data='new_data'))
+    return keyboard
+
+
+def cities_kb(result_list: List[Dict]) -> Tuple[Dict[str, str], telebot.types.InlineKeyboardMarkup]:
+    """
+    Создает Inline клавиатуру с найденными городами и кнопкой 'Другой город'.
+    Возвращает словарь из названий городов и их коллбэков вместе с клавиатурой.
+    """
+    keyboard = types.InlineKeyboardMarkup(row_width=1)
+    button_names = [name for i_result in result_list for name, info in i_result.items()] + ['Другой город']
+    button_calls = ['#city' + str(call_num) for call_num in range(len(button_names))]
+    names_calls_dict = dict(zip(button_names, button_calls))
+    buttons = (types.InlineKeyboardButton(text=btn_name, callback_data=btn_call)
+               for btn_name, btn_call in names_calls_dict.items())
+    keyboard.add(*buttons)
+    return names_calls_dict, keyboard
+
+
+def people_kb(rooms: List[Dict]) -> Optional[Tuple[str, telebot.types.InlineKeyboardMarkup]]:
+    """
+    Создает Inline клавиатуру для ввода количества взрослых или детей в первом номере, для которого
+    они еще не указаны, и текст вопроса. Возвращает None, если для всех номеров все указано.
+    Вызывает ValueError, если превышен лимит брони (20 человек).
+    """
+    for i_index, i_room in enumerate(rooms):
+
+        all_adults = sum(map(lambda room_dict: room_dict.get('adults', 0), rooms))
+        all_children = sum(map(lambda room_dict: len(room_dict.get('children', [])), rooms))
+        all_people = all_adults + all_children
+        max_people = 20 - all_people
+        if max_people < 1:
+            raise ValueError('people limit exceeded')
+
+        if 'adults' in i_room:
+            if 'children' in i_room:
+                continue
+
+            if max_people > 6:
+                max_children = 6
+            else:
+                max_children = 6 - max_people
+            if max_children > 1:
+                children_width = max_children // 2
+            else:
+                children_width = 1
+            children_keyboard = types.InlineKeyboardMarkup(row_width=children_width)
+            children_buttons = (types.InlineKeyboardButton(
+                text=str(child),
+                callback_data=f'#room={i_index}@children={child}#')
+                for child in range(1, max_children + 1))
+
+            no_children = types.InlineKeyboardButton(text='Без детей',
+                                                     callback_data=f'#room={i_index}@children=0#')
+
+            children_keyboard.add(no_children, *children_buttons)
+            return f'Введите кол-во детей в номере {i_index + 1}', children_keyboard
+
+        if max_people > 14:
+            max_adults = 14
+
+        else:
+            max_adults = 14 - max_people
+
+        if max_adults > 1:
+            adults_width = max_adults // 2
+
+        else:
+            adults_width = 1
+        adults_keyboard = types.InlineKeyboardMarkup(row_width=adults_width)
+        adult_buttons = (types.InlineKeyboardButton(text=str(adult + 1),
+                                                    callback_data=f'#room={i_index}@adults={adult + 1}#')
+                         for adult in range(max_adults))
+        adults_keyboard.add(*adult_buttons)
+        return f'Введите кол-во взрослых в номере {i_index + 1}', adults_keyboard
+
+    return None
+
+
+def children_age_kb(children_amnt: int, cur_child: int, cur_room: int) -> telebot.types.InlineKeyboardMarkup:
+    """
+    Создает Inline клавиатуру для выбора возраста ребенка.
+    """
+    keyboard = types.InlineKeyboardMarkup(row_width=6)
+    buttons = (types.InlineKeyboardButton(text=f'{age}',
+                                          callback_data=f'#age={age}#cur_child={cur_child}'
+                                                        f'#total_children={children_amnt}#cur_room={cur_room}')
+               for age in range(18)
+               )
+    keyboard.add(*buttons)
+    return keyboard
@@ -0,0 +1,773 @@
+import re
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+import telebot
+from telebot import types
+from babel.dates import format_date
+from telegram_bot_calendar import DetailedTelegramCalendar
+from telegram_hotels_bot import config
+from telegram_hotels_bot.bot import main_keyboard, greetings, commands
+from telegram_hotels_bot.user import user, user_store
+from telegram_hotels_bot.utils import cities_offer, ttl_cache
+
+"""
+Файл с шагами диалога, общими для синхронного (MyBot) и асинхронного (AsyncMyBot) ботов. Шаг получает
+сообщение или коллбэк, сохраняет введенные данные и возвращает сообщения для отправки в чат (Reply),
+а отправляет их бот: MyBot через очередь RateLimitedSender, AsyncMyBot через sender.send_async.
+"""
+
+TSTEP = {'y': 'год', 'm': 'месяц', 'd': 'день'}
+
+HELP_TEXT = 'Для начала работы с ботом, выберите в боковом меню слева комманду start\n' \
+            'Если вы хотите начать новый поиск, нажмите кнопку Найти отели\n' \
+            'После этого вам будет предложено ввести данные необходимые для начала поиска.' \
+            'Следуйте предложенным командам.\n' \
+            'После вы можете выбрать один из вариантов поиска:\n' \
+            'Найти самые дешевые отели: поиск самых дешевых отелей по заданным параметрам\n' \
+            'Найти самые дорогие отели: поиск самых дешевых отелей по заданным параметрам\n' \
+            'Настраиваемый поиск: поиск на основе дополнительных данных (диапазон цены и ' \
+            'удаленности отеля от центра)\n' \
+            'Если вы хотите посмотреть историю поисков, нажмите кнопку Показать историю поиска\n' \
+            ''
+
+NO_RESULTS_TEXT = 'К сожалению, у вашего запроса не было результатов'
+
+ERROR_TEXT = 'Что-то пошло не так. Попробуйте повторить запрос'
+
+
+def calendar_max_date() -> date:
+    """Возвращает последнюю дату, которую можно выбрать в календаре (config.calendar_max_days дней от сегодня)"""
+    return date.today() + timedelta(days=config.calendar_max_days)
+
+
+def check_in_max_date() -> date:
+    """Возвращает последнюю дату заезда: на день раньше calendar_max_date, чтобы осталась дата выезда"""
+    return calendar_max_date() - timedelta(days=1)
+
+
+def hotel_caption(j_index: int, i_hotel: 'Hotel', converted_price: Optional[float]) -> str:
+    """
+    Формирует подпись к отелю из результатов поиска.
+    :param j_index: порядковый номер отеля в результатах (с нуля).
+    :param i_hotel: отель.
+    :param converted_price: цена за ночь в рублях или None, если курс получить не удалось.
+    """
+    name = f'{j_index + 1}. {i_hotel.name}'
+    address = i_hotel.address
+
+    if converted_price is None:
+
+        price = f'${i_hotel.price_per_night} за ночь\n'
+
+    else:
+
+        price = f'{converted_price} руб. за ночь\n'
+
+    distance = 'Расстояние до центра: {hotel_distance} км'.format(
+        hotel_distance=i_hotel.distance_from_destination)
+    return '\n'.join([name, address, distance, price])
+
+
+def hotel_media_group(photos: List[str], caption_text: str) -> List[types.InputMediaPhoto]:
+    """Формирует группу фото отеля с подписью у первого фото"""
+    media_group = []
+
+    for k_index, k_photo in enumerate(photos):
+
+        if k_index == 0:
+            prepared_photo = types.InputMediaPhoto(media=k_photo, caption=caption_text)
+
+        else:
+            prepared_photo = types.InputMediaPhoto(media=k_photo)
+
+        media_group.append(prepared_photo)
+
+    return media_group
+
+
+class Reply(NamedTuple):
+    """
+    Сообщение, которое шаг диалога отправляет в чат.
+    Arguments:
+        text (str): текст сообщения.
+        reply_markup (Optional[InlineKeyboardMarkup]): клавиатура сообщения.
+        edit_message_id (Optional[int]): если задан, то вместо отправки нового сообщения изменяется
+        сообщение с этим номером (например, календарь или клавиатура выбора количества людей).
+        reply_to_message_id (Optional[int]): номер сообщения, ответом на которое будет сообщение.
+        next_step (Optional[str]): название шага, который обработает следующее текстовое сообщение
+        пользователя (ответ на это сообщение).
+    """
+    text: str
+    reply_markup: Optional[types.InlineKeyboardMarkup] = None
+    edit_message_id: Optional[int] = None
+    reply_to_message_id: Optional[int] = None
+    next_step: Optional[str] = None
+
+
+class SearchSteps(ABC):
+    """
+    Класс SearchSteps. Шаги диалога, общие для синхронного (MyBot) и асинхронного (AsyncMyBot) ботов.
+    Каждый шаг получает сообщение или коллбэк и возвращает список Reply. Шаги, которые обращаются
+    к Hotels Api (get_city, show_list_price, proces_max_distance), бот определяет сам: синхронные
+    в MyBot или асинхронные в AsyncMyBot.
+
+    Бот регистрирует шаги из MESSAGE_STEPS и CALLBACK_STEPS функцией register_steps, а обработчик
+    шага создает его метод step_handler.
+
+    Arguments:
+        self.cache (TTLCache): состояние диалога каждого чата (ключ - идентификационный номер чата),
+        в котором данные временно хранятся перед их записью в класс User.
+    """
+
+    MESSAGE_STEPS = (
+        ('give_help', {'commands': ['help']}),
+        ('say_hello', {'commands': ['start']}),
+        ('say_hello', {'func': greetings.greetings}),
+    )
+
+    CALLBACK_STEPS = (
+        ('go_back', lambda callback: callback.data == 'back' or callback.data == 'new_data'),
+        ('show_history', lambda callback: callback.data == '/history'),
+        ('new_search', lambda callback: callback.data == 'get_city'),
+        ('confirm_city_and_go_check_in', lambda callback: callback.data.startswith('#city')),
+        ('save_check_in_and_go_check_out', DetailedTelegramCalendar.func(calendar_id=1)),
+        ('save_check_out_and_go_rooms', DetailedTelegramCalendar.func(calendar_id=2)),
+        ('generate_rooms', lambda callback: callback.data.startswith('#rooms')),
+        ('process_people', lambda callback: callback.data.startswith('#room=')),
+        ('save_children_age', lambda callback: callback.data.startswith('#age')),
+        ('save_hotels_amnt', lambda callback: callback.data.startswith('#hotels_amnt')),
+        ('save_photos_amnt_and_ask_commands', lambda callback: callback.data.startswith('#photos_amnt')),
+        ('show_list_price', lambda callback: callback.data.endswith('_price')),
+        ('start_best_deal', lambda callback: callback.data.endswith('best_deal')),
+        ('new_search_old_data', lambda callback: callback.data.startswith('#search')),
+    )
+
+    def __init__(self):
+        self.cache = ttl_cache.TTLCache(maxsize=config.chat_state_max_chats,
+                                        ttl=config.chat_state_ttl, sliding=True)
+
+    @abstractmethod
+    def step_handler(self, step_name: str) -> Callable:
+        """Возвращает обработчик обновления, который выполняет шаг step_name и отправляет его сообщения"""
+
+    def register_steps(self) -> None:
+        """Регистрирует в боте self.bot обработчики шагов из MESSAGE_STEPS и CALLBACK_STEPS"""
+        for step_name, filters in self.MESSAGE_STEPS:
+            self.bot.register_message_handler(self.step_handler(step_name), **filters)
+
+        for step_name, func in self.CALLBACK_STEPS:
+            self.bot.register_callback_query_handler(self.step_handler(step_name), func=func)
+
+    @classmethod
+    def clear_last_search(cls, callback: telebot.types.CallbackQuery):
+        """
+        Удаляет последний поиск у текущего пользователя.
+        """
+        cur_user = user_store.find_user(callback.message.chat.id)
+        cur_user.clean_searches()
+        user_store.save_user(cur_user)
+
+    def give_help(self, message: telebot.types.Message) -> List[Reply]:
+        """
+        Рассказывает о функциях бота
+        """
+        return [Reply(HELP_TEXT)]
+
+    def say_hello(self, message: telebot.types.Message) -> List[Reply]:
+        """
+        Ловит приветственное сообщение от пользователя, находит или сохраняет пользователя в хранилище
+        (say_hi_and_remember в файле greetings), отвечает на приветствие и отправляет начальное меню.
+        """
+        hello = greetings.say_hi_and_remember(message)
+        return [Reply(hello, reply_to_message_id=message.message_id)] + self.initial_keyboard()
+
+    def go_back(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэки back и new_data. Если коллбэк back, то запускает функцию
+        clear_last_search, которая удаляет последний поиск.
+        Как в случае back, так и new_data, открывает первое меню.
+        """
+        if callback.data == 'back':
+            self.clear_last_search(callback)
+        return self.initial_keyboard()
+
+    def show_history(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с командой history (Показать историю поиска), запускает функцию give_history
+        в файле commands, чтобы сформировать сообщение с историей поиска, и если она не пустая
+        отправляет Inline клавиатуру с номерами поисков, предлагая повторить его с другой командой, но
+        теми же данными.
+        """
+        replies = [Reply(commands.give_history(callback.message.chat.id))]
+        cur_user = user_store.find_user(callback.message.chat.id)
+
+        if len(cur_user.history) > 0:
+            keyboard = main_keyboard.history_kb(search.search_id for search in cur_user.history)
+            message_text = 'Выберите номер поиска, чтобы осуществить новый поиск с теми же параметрами, ' \
+                           'или начните другой поиск'
+            replies.append(Reply(message_text, keyboard))
+
+        else:
+            replies.append(Reply('Нажмите на кнопку для продолжения работы', main_keyboard.find_hotels_kb()))
+
+        return replies
+
+    def new_search(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк get_city, заложенный в кнопку 'Найти отели' в начальном меню,
+        и начинает сбор данных для запросов к Hotels Api с вопроса о городе.
+        """
+        return self.ask_city()
+
+    def initial_keyboard(self) -> List[Reply]:
+        """
+        Отправляет в чат клавиатуру из функции initial_keyboard в файле main_keyboard, предлагая
+        пользователю выбрать одну из команд для работы.
+        """
+        return [Reply('Для начала работы выберите одну из следующих команд', main_keyboard.initial_keyboard())]
+
+    def state_expired(self) -> List[Reply]:
+        """
+        Сообщает пользователю, что данные текущего шага поиска устарели (состояние чата удалено
+        из cache), и предлагает начать поиск заново.
+        """
+        return [Reply('Данные поиска устарели. Пожалуйста, начните поиск заново', main_keyboard.initial_keyboard())]
+
+    def ask_city(self) -> List[Reply]:
+        """
+        Спрашивает у пользователя город, в котором будет производиться поиск.
+        Полученное от пользователя сообщение обрабатывается в шаге get_city.
+        Город предложенный в примере получается из функции random_city в файле cities_offer.
+        """
+        random_city = cities_offer.random_city()
+        return [Reply(f'Введите интересующий вас город (пример: {random_city})', next_step='get_city')]
+
+    def show_cities(self, chat_id: int, result_list: Union[List[Dict], str]) -> List[Reply]:
+        """
+        Сохраняет в состояние чата результат поиска городов по сообщению пользователя (шаг get_city).
+
+        Если тип результата str, значит это сообщение 'Что-то пошло не так. Попробуйте повторить запрос',
+        которое отправляется пользователю, после чего город спрашивается снова.
+
+        В противном случае создается клавиатура с кнопками с полученными из запроса названиями городов, чтобы
+        пользователь подтвердил выбор города.
+        """
+        if isinstance(result_list, str):
+            self.cache.pop(chat_id)
+            return [Reply(result_list)] + self.ask_city()
+
+        names_calls_dict, keyboard = main_keyboard.cities_kb(result_list)
+        self.cache.set(chat_id, [result_list, names_calls_dict])
+        text = 'Выберите город из списка. Если нужного вам города нет, нажмите кнопку "Другой город"'
+        return [Reply(text, keyboard)]
+
+    def confirm_city_and_go_check_in(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с хештегом #city и номером, соответствующему индексу списка городов и их данных,
+        сохраненных в состоянии чата. Последний элемент списка - 'Другой город', и если число
+        после #city совпадает с индексом последнего элемента, то город спрашивается снова.
+        Иначе данные города передаются для сохранения в функцию save_city и запрашивается дата заезда.
+        """
+        chat_id = callback.message.chat.id
+        state = self.cache.get(chat_id)
+
+        if state is None:
+            return self.state_expired()
+
+        if int(callback.data[5:]) == len(state[1]) - 1:
+            return self.ask_city()
+
+        self.save_city(callback.data, chat_id)
+        return self.ask_date(chat_id, check_in=True)
+
+    def save_check_in_and_go_check_out(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбек календаря DetailedTelegramCalendar с датой заезда в отель, сохраняет
+        ее в состояние чата и спрашивает дату окончания пребывания в отеле.
+        """
+        chat_id = callback.message.chat.id
+        result, key, step = DetailedTelegramCalendar(min_date=date.today(),
+                                                     max_date=check_in_max_date(),
+                                                     locale='ru', calendar_id=1
+                                                     ).process(callback.data)
+        if not result and key:
+            return [Reply(f"Начало проживания в отеле: выберите {TSTEP[step]}", key,
+                          edit_message_id=callback.message.message_id)]
+
+        if result:
+            text_date = format_date(result, format='full', locale='ru')
+            self.cache.set(chat_id, [result])
+            return [Reply(f"Дата заезда в отель: {text_date}", edit_message_id=callback.message.message_id)] \
+                + self.ask_date(chat_id, check_out=True)
+
+        return []
+
+    def save_check_out_and_go_rooms(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбек календаря DetailedTelegramCalendar с датой последнего дня в отеле, сохраняет
+        ее в состояние чата и запускает функцию save_date для сохранения дат в класс Search.
+        После спрашивает количество номеров.
+        """
+        chat_id = callback.message.chat.id
+        state = self.cache.get(chat_id)
+        if state is None:
+            return self.state_expired()
+
+        result, key, step = DetailedTelegramCalendar(min_date=state[0] + timedelta(days=1),
+                                                     max_date=calendar_max_date(),
+                                                     locale='ru', calendar_id=2
+                                                     ).process(callback.data)
+        if not result and key:
+            return [Reply(f"Окончание проживания в отеле: выберите {TSTEP[step]}", key,
+                          edit_message_id=callback.message.message_id)]
+
+        if result:
+            text_date = format_date(result, format='full', locale='ru')
+            state.append(result)
+            self.save_date(chat_id=chat_id)
+            return [Reply(f"Последний день в отеле: {text_date}", edit_message_id=callback.message.message_id)] \
+                + self.ask_rooms()
+
+        return []
+
+    def ask_date(self, chat_id: int, check_in: bool = False, check_out: bool = False) -> List[Reply]:
+        """
+        Открывает календарь DetailedTelegramCalendar, в котором пользователь выбирает даты
+        заселения в отель и дату последнего дня пребывания в отеле.
+        :param chat_id: идентификационный номер чата, в состоянии которого сохранена дата заезда.
+        :param check_in: флаг. Если True, то функция спрашивает дату заезда в отель.
+        :param check_out: флаг. Если True, то функция спрашивает дату выезда из отеля.
+        """
+        if check_in:
+
+            calendar, step = DetailedTelegramCalendar(min_date=date.today(),
+                                                      max_date=check_in_max_date(),
+                                                      locale='ru', calendar_id=1
+                                                      ).build()
+            return [Reply(f"Начало проживания в отеле: выберите {TSTEP[step]}", calendar)]
+
+        if check_out:
+            check_in_date = self.cache.get(chat_id)[0]
+            calendar, step = DetailedTelegramCalendar(min_date=check_in_date + timedelta(days=1),
+                                                      max_date=calendar_max_date(),
+                                                      locale='ru', calendar_id=2
+                                                      ).build()
+            return [Reply(f"Окончание проживания в отеле: выберите {TSTEP[step]}", calendar)]
+
+        return []
+
+    def ask_rooms(self) -> List[Reply]:
+        """
+        Спрашивает у пользователя количество бронируемых номеров (клавиатура создается в функции
+        rooms_kb в файле main_keyboard).
+        """
+        return [Reply('Выберите количество номеров, которое вы бы хотели забронировать', main_keyboard.rooms_kb())]
+
+    def generate_rooms(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с количеством бронируемых номеров, сохраняет в состояние чата
+        список из того же количества словарей и спрашивает, сколько людей будет жить в каждом номере.
+        """
+        rooms_num = int(re.search(r's(\d+)\b', callback.data)[1])
+        self.cache.set(callback.message.chat.id, [{} for _ in range(rooms_num)])
+        return self.get_people(callback)
+
+    def process_people(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с количеством проживающих в номере
+        и соответствующем тэгом (adults/children).
+        """
+        rooms = self.cache.get(callback.message.chat.id)
+        if rooms is None:
+            return self.state_expired()
+
+        people_info = callback.data
+        room_number = int(re.search(r'=(\d+)@', people_info)[1])
+        tag = re.search(r'@([a-z]+)=', people_info)[1]
+
+        people_amnt = int(re.search(r'=(\d+)#', people_info)[1])
+
+        if tag == 'children':
+            if people_amnt > 0:
+                return self.get_children(children_amnt=people_amnt, cur_room=room_number,
+                                         callback=callback, cur_child=1)
+
+            rooms[room_number][tag] = []
+        else:
+            rooms[room_number][tag] = people_amnt
+
+        return self.get_people(callback)
+
+    def save_children_age(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с возрастом ребенка.
+        """
+        rooms = self.cache.get(callback.message.chat.id)
+        if rooms is None:
+            return self.state_expired()
+
+        age_cur_child = int(re.search(r'age=(\d+)', callback.data)[1])
+        cur_room = int(re.search(r'cur_room=(\d+)', callback.data)[1])
+        cur_child = int(re.search(r'cur_child=(\d+)', callback.data)[1])
+        total_children = int(re.search(r'total_children=(\d+)', callback.data)[1])
+
+        if rooms[cur_room].get('children', 0) == 0:
+            rooms[cur_room]['children'] = []
+        rooms[cur_room]['children'].insert(cur_child, {'age': age_cur_child})
+
+        if cur_child == total_children:
+
+            return self.get_people(callback)
+
+        return self.get_children(cur_child=cur_child + 1, cur_room=cur_room,
+                                 children_amnt=total_children, callback=callback)
+
+    def get_people(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Спрашивает количество взрослых или детей в первом номере, для которого они еще не указаны
+        (клавиатура создается в функции people_kb в файле main_keyboard).
+        Если превышен лимит брони, то сообщает об этом и снова спрашивает количество номеров.
+        Когда данные всех номеров указаны, сохраняет информацию о проживающих в классе Search
+        и спрашивает количество отелей.
+        """
+        chat_id = callback.message.chat.id
+        rooms = self.cache.get(chat_id)
+        try:
+            question = main_keyboard.people_kb(rooms)
+
+        except ValueError:
+            self.cache.pop(chat_id)
+            return [Reply('Превышен лимит брони. Попробуйте ввод людей сначала.')] + self.ask_rooms()
+
+        if question is None:
+            self.store_people(chat_id)
+            return self.ask_hotels_amnt()
+
+        text, keyboard = question
+        return [Reply(text, keyboard, edit_message_id=callback.message.message_id)]
+
+    def get_children(self, children_amnt: int, cur_child: int, cur_room: int,
+                     callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """Спрашивает возраст ребенка"""
+        keyboard = main_keyboard.children_age_kb(children_amnt=children_amnt, cur_child=cur_child, cur_room=cur_room)
+        return [Reply(f'Введите возраст {cur_child}-ого ребенка', keyboard,
+                      edit_message_id=callback.message.message_id)]
+
+    def ask_hotels_amnt(self) -> List[Reply]:
+        """
+        Отправляет в чат клавиатуру из функции hotels_kb в файле main_keyboard,
+        чтобы пользователь указал количество загружаемых отелей.
+        """
+        return [Reply('Введите количество отелей, которые вы хотите посмотреть', main_keyboard.hotels_kb())]
+
+    def save_hotels_amnt(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с количеством отелей, сохраняет его в класс Search и спрашивает
+        количество фотографий.
+        """
+        hotels_amnt = re.search(r'hotels_amnt#(\d+)', callback.data)[1]
+        cur_user = user_store.find_user(callback.message.chat.id)
+        cur_search = cur_user.searches.pop()
+        cur_search.max_items = int(hotels_amnt)
+        cur_user.add_search(cur_search)
+        user_store.save_user(cur_user)
+        return self.ask_photos()
+
+    def ask_photos(self) -> List[Reply]:
+        """
+        Отправляет в чат клавиатуру из функции photos_kb в файле main_keyboard, чтобы пользователь
+        указал количество загружаемых фотографий отелей.
+        """
+        return [Reply('Укажите количество загружаемых фото отелей', main_keyboard.photos_kb())]
+
+    def save_photos_amnt_and_ask_commands(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит количество фотографий, которые будут загружаться в чат, и предлагает выбрать команду.
+        """
+        photos_amnt = re.search(r'photos_amnt#(\d+)', callback.data)[1]
+        cur_user = user_store.find_user(callback.message.chat.id)
+        cur_search = cur_user.searches.pop()
+        cur_search.photos_amnt = int(photos_amnt)
+        cur_user.add_search(cur_search)
+        user_store.save_user(cur_user)
+        return self.ask_commands()
+
+    def ask_commands(self, again: bool = False) -> List[Reply]:
+        """
+        Предлагает выбрать команду клавиатурой из функции option_choice_keyboard в файле main_keyboard.
+        :param again: флаг, меняющий клавиатуру, если True. Новая клавиатура будет иметь другие
+        коллбэки.
+        """
+        keyboard = main_keyboard.option_choice_keyboard()
+        if again:
+            keyboard = main_keyboard.again_option_choice_keyboard()
+        return [Reply('Выберите одну из следующих команд', keyboard)]
+
+    def start_price_search(self, callback: telebot.types.CallbackQuery) -> Tuple[List[Reply], 'User', 'Search']:
+        """
+        Начинает команды low_price и high_price (шаг show_list_price): находит пользователя и поиск
+        (для коллбэка again - новый поиск с параметрами предыдущего) и возвращает сообщения о том,
+        что начался поиск, пользователя и поиск.
+        """
+        replies = [Reply('Уже ищу! (Поиск может занять до 2 минут, но я постараюсь быстрее)'), Reply('⏳')]
+
+        cur_user = user_store.find_user(callback.message.chat.id)
+        if callback.data.startswith('again'):
+            cur_search = cur_user.searches[-1]
+            cur_search = cur_search.update_search()
+        else:
+            cur_search = cur_user.searches.pop()
+
+        if callback.data.endswith('low_price'):
+            cur_search.type_of_search = 'Поиск дешевых отелей'
+        else:
+            cur_search.type_of_search = 'Поиск дорогих отелей'
+
+        return replies, cur_user, cur_search
+
+    def finish_price_search(self, callback: telebot.types.CallbackQuery, cur_user: 'User',
+                            updated_search: Union['Search', str]) -> List[Reply]:
+        """
+        Сохраняет поиск команд low_price и high_price, если он удался. Иначе возвращает текст ошибки
+        с клавиатурой команд.
+        """
+        if isinstance(updated_search, str):
+            if callback.data.startswith('again'):
+                keyboard = main_keyboard.again_option_choice_keyboard()
+            else:
+                keyboard = main_keyboard.option_choice_keyboard()
+            return [Reply(updated_search, keyboard)]
+
+        cur_user.add_search(updated_search)
+        user_store.save_user(cur_user)
+        return []
+
+    def start_best_deal(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Начинает команду bestdeal ("Настраиваемый поиск"). Если пойманный коллбэк начинается с
+        again, то создает новый поиск с параметрами предыдущего. После спрашивает минимальную цену.
+        """
+        cur_user = user_store.find_user(callback.message.chat.id)
+        if callback.data.startswith('again'):
+            cur_search = cur_user.searches[-1]
+            cur_search = cur_search.update_search()
+        else:
+            cur_search = cur_user.searches.pop()
+
+        cur_search.type_of_search = 'Настраиваемый поиск'
+
+        cur_user.add_search(cur_search)
+        user_store.save_user(cur_user)
+
+        return self.ask_price_min()
+
+    def new_search_old_data(self, callback: telebot.types.CallbackQuery) -> List[Reply]:
+        """
+        Ловит коллбэк с идентификационным номером поиска, создает новый поиск с параметрами
+        предыдущего, сохраняет его и спрашивает у пользователя через Inline клавиатуру следующую
+        команду
+        """
+        search_id = re.search(r'ch(\d+)', callback.data)[1]
+        cur_user = user_store.find_user(callback.message.chat.id)
+        old_search = [search for search in cur_user.searches if search.search_id == search_id][0]
+        new_search = old_search.update_search()
+        cur_user.add_search(new_search)
+        user_store.save_user(cur_user)
+        return [Reply('Выберите дальнейшее действие', main_keyboard.option_choice_keyboard())]
+
+    def ask_price_min(self) -> List[Reply]:
+        """Спрашивает у пользователя минимальную цену отеля за ночь и отправляет ее в process_min"""
+        return [Reply('Введите цифрами минимальную цену отеля в рублях за ночь. Пример: 5000',
+                      next_step='process_min')]
+
+    def process_min(self, message: telebot.types.Message) -> List[Reply]:
+        """
+        Проверяет минимальную цену отеля за ночь и если формат int, сохраняет ее
+        в состояние чата и спрашивает максимальную цену. Иначе снова спрашивает минимальную.
+        """
+        try:
+            new_min = int(message.text)
+
+        except (TypeError, ValueError):
+            return [Reply('Неверный формат цены')] + self.ask_price_min()
+
+        self.cache.set(message.chat.id, {'min': new_min})
+
+        return self.ask_price_max()
+
+    def ask_price_max(self) -> List[Reply]:
+        """Спрашивает у пользователя максимальную цену отеля за ночь и отправляет ее в proces_max"""
+        return [Reply('Введите цифрами максимальную цену отеля в рублях за ночь. Пример: 10000',
+                      next_step='proces_max')]
+
+    def proces_max(self, message: telebot.types.Message) -> List[Reply]:
+        """
+        Проверяет максимальную цену отеля за ночь и если формат int и значение не меньше чем
+        минимальная цена отеля, сохраняет ее в состояние чата, запускает save_prices и спрашивает
+        минимальное расстояние. Иначе снова спрашивает максимальную цену.
+        """
+        prices = self.cache.get(message.chat.id)
+        if prices is None:
+            return self.state_expired()
+
+        try:
+            new_max = int(message.text)
+
+        except (TypeError, ValueError):
+            return [Reply('Неверный формат цены')] + self.ask_price_max()
+
+        if new_max < prices['min']:
+            return [Reply('Максимальная цена не может быть меньше минимальной')] + self.ask_price_max()
+
+        prices['max'] = new_max
+
+        self.save_prices(message.chat.id)
+
+        return self.ask_min_distance()
+
+    def ask_min_distance(self) -> List[Reply]:
+        """
+        Спрашивает у пользователя минимальное расстояние отеля от центра города и отправляет
+        его в обработку в proces_min_distance.
+        """
+        return [Reply('Введите цифрами минимальное расстояние удаленности'
+                      ' отеля от центра города в километрах. Пример: 3.5', next_step='proces_min_distance')]
+
+    def proces_min_distance(self, message: telebot.types.Message) -> List[Reply]:
+        """
+        Проверяет минимальное расстояние от отеля и если формат float, сохраняет
+        данные в состояние чата и спрашивает максимальное расстояние. Иначе снова спрашивает минимальное.
+        """
+        try:
+            new_min_distance = float(message.text)
+
+        except (TypeError, ValueError):
+            return [Reply('Неверный формат расстояния')] + self.ask_min_distance()
+
+        self.cache.set(message.chat.id, {'min_distance': new_min_distance})
+
+        return self.ask_max_distance()
+
+    def ask_max_distance(self) -> List[Reply]:
+        """
+        Спрашивает у пользователя максимальное расстояние от отеля и отправляет его на
+        обработку в proces_max_distance
+        """
+        return [Reply('Введите цифрами максимальное расстояние удаленности'
+                      ' отеля от центра города в километрах. Пример: 4.5', next_step='proces_max_distance')]
+
+    def check_max_distance(self, message: telebot.types.Message) -> Tuple[List[Reply], bool]:
+        """
+        Проверяет максимальное расстояние отеля от центра (шаг proces_max_distance) и если формат float
+        и значение не меньше чем минимальное расстояние, сохраняет его в состояние чата.
+        Возвращает сообщения для пользователя и флаг, можно ли начинать поиск.
+        """
+        distance = self.cache.get(message.chat.id)
+        if distance is None:
+            return self.state_expired(), False
+
+        try:
+            new_max_distance = float(message.text)
+
+        except (TypeError, ValueError):
+            return [Reply('Неверный формат расстояния')] + self.ask_max_distance(), False
+
+        if new_max_distance < distance['min_distance']:
+            return [Reply('Максимальное расстояние удаленности отеля от центра '
+                          'не может быть меньше минимального')] + self.ask_max_distance(), False
+
+        distance['max_distance'] = new_max_distance
+
+        return [Reply('Начинаю поиск!'), Reply('⏳')], True
+
+    def start_best_deal_search(self, user_id: int) -> Tuple['User', 'Search']:
+        """Сохраняет в поиск диапазон расстояний из состояния чата и возвращает пользователя и поиск"""
+        cur_user = user_store.find_user(user_id)
+        cur_search = cur_user.searches.pop()
+        cur_search.distance_range = self.cache.pop(user_id)
+        return cur_user, cur_search
+
+    def finish_best_deal_search(self, cur_user: 'User', updated_search: Union['Search', str]) -> List[Reply]:
+        """
+        Сохраняет настраиваемый поиск, если он удался. Иначе возвращает текст ошибки с начальным меню.
+        """
+        if isinstance(updated_search, str):
+            user_store.save_user(cur_user)
+            return [Reply(updated_search, main_keyboard.initial_keyboard())]
+
+        cur_user.add_search(updated_search)
+        user_store.save_user(cur_user)
+        return []
+
+    def save_city(self, call: str, chat_id: int) -> None:
+        """
+        Проверяет совпадения переменной call в списке в состоянии чата, находит выбранный пользователем
+        город и сохраняет его в поиск пользователя. Здесь же сохраняет время начала поиска.
+        :param call: коллбэк с индексом города.
+        :param chat_id: идентификационный номер чата, используемый для нахождения пользователя.
+        """
+        state = self.cache.get(chat_id)
+        for i_name, i_call in state[1].items():
+
+            if call == i_call:
+                result = i_name
+                break
+
+        for results in state:
+            for i_result in results:
+                if result in i_result:
+                    destination = user.intern_destination(result, i_result[result])
+
+                    cur_user = user_store.find_user(chat_id)
+                    cur_search = user.Search()
+                    cur_search.time_of_search = datetime.utcnow().strftime("%m/%d/%Y, %H:%M:%S")
+                    cur_search.search_id_auto_setter()
+                    cur_search.destination = destination
+                    cur_user.add_search(cur_search)
+                    user_store.save_user(cur_user)
+                    self.cache.pop(chat_id)
+                    return
+
+    def save_date(self, chat_id: int) -> None:
+        """
+        Сохраняет даты заезда и выезда из отеля в класс Search и удаляет данные
+        из состояния чата.
+        :param chat_id: идентификационный номер чата, используемый для нахождения пользователя.
+        """
+        check_in_date, check_out_date = self.cache.pop(chat_id)
+
+        cur_user = user_store.find_user(chat_id)
+        cur_search = cur_user.searches.pop()
+
+        cur_search.check_in = check_in_date
+
+        cur_search.check_out = check_out_date
+
+        cur_user.add_search(cur_search)
+        user_store.save_user(cur_user)
+
+    def save_prices(self, user_id: int) -> None:
+        """Сохраняет данные о диапазоне цен пользователя."""
+        cur_user = user_store.find_user(user_id)
+        cur_search = cur_user.searches.pop()
+        cur_search.price_range = self.cache.pop(user_id)
+        cur_user.add_search(cur_search)
+        user_store.save_user(cur_user)
+
+    def store_people(self, chat_id: int) -> None:
+        """
+        Сохраняет данные о проживающих из состояния чата в класс Search.
+        :param chat_id: идентификационный номер чата, используемый для нахождения пользователя.
+        """
+        rooms = self.cache.pop(chat_id)
+        for i_room in rooms:
+            if len(i_room['children']) == 0:
+                i_room.pop('children')
+
+        cur_user = user_store.find_user(chat_id)
+        cur_search = cur_user.searches.pop()
+
+        cur_search.people = rooms
+        cur_user.add_search(cur_search)
+        user_store.save_user(cur_user)
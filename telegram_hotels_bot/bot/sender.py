@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set
+from telegram_hotels_bot import config
+from telegram_hotels_bot.utils import ttl_cache
+
+"""
+Файл с ограничением частоты отправки сообщений в телеграмм. Лимиты телеграмма (не больше ~30 сообщений
+в секунду всего, ~1 сообщения в секунду в один чат и 20 сообщений в минуту в группу) учитываются
+корзинами токенов (token bucket), а ответ 429 с retry_after приостанавливает отправку в чат.
+"""
+
+
+class TokenBucket:
+    """
+    Класс TokenBucket. Корзина токенов: токены пополняются со скоростью rate в секунду до capacity,
+    каждая отправка забирает cost токенов. Не потокобезопасен (используется под блокировкой RateLimits).
+    Arguments:
+        self._rate (float): скорость пополнения токенов в секунду.
+        self._capacity (float): максимальное количество токенов (допустимый всплеск отправок).
+        self._tokens (float): текущее количество токенов.
+        self._updated (float): время последнего пополнения (time.monotonic).
+        self._paused_until (float): время, до которого отправка запрещена (после ответа 429).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        """Пополняет токены за время, прошедшее с последнего пополнения"""
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Возвращает, сколько секунд нужно подождать, чтобы забрать cost токенов (0 - можно сейчас)"""
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        cost = min(cost, self._capacity)
+        if self._tokens >= cost:
+            return 0.0
+        return (cost - self._tokens) / self._rate
+
+    def consume(self, cost: float) -> None:
+        """Забирает cost токенов"""
+        self._tokens -= min(cost, self._capacity)
+
+    def pause(self, until: float) -> None:
+        """Запрещает отправку до времени until (time.monotonic)"""
+        self._paused_until = max(self._paused_until, until)
+
+
+class RateLimits:
+    """
+    Класс RateLimits. Общая корзина токенов для всех отправок и корзины каждого чата
+    (у групповых чатов, идентификационный номер которых отрицательный, свои лимиты).
+    Arguments:
+        self._global (TokenBucket): корзина для всех отправок бота.
+        self._chats (TTLCache): корзины чатов. Корзина, которой давно не пользовались, полная,
+        поэтому ее можно удалить из кэша и при следующей отправке создать заново.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(config.send_global_rate, config.send_global_burst)
+        self._chats = ttl_cache.TTLCache(maxsize=config.chat_state_max_chats, ttl=config.send_bucket_ttl, sliding=True)
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        """Возвращает корзину чата, создавая ее при необходимости"""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(config.send_group_rate, config.send_group_burst)
+            else:
+                bucket = TokenBucket(config.send_chat_rate, config.send_chat_burst)
+            self._chats.set(chat_id, bucket)
+        return bucket
+
+    def try_acquire(self, chat_id: Hashable, cost: int = 1) -> float:
+        """
+        Забирает токены для отправки в чат, если лимиты это позволяют, и возвращает 0.
+        Иначе ничего не забирает и возвращает, сколько секунд нужно подождать.
+        """
+        now = time.monotonic()
+        with self._lock:
+            chat_bucket = self._chat_bucket(chat_id)
+            wait = max(chat_bucket.wait_time(cost, now), self._global.wait_time(cost, now))
+            if wait <= 0:
+                chat_bucket.consume(cost)
+                self._global.consume(cost)
+            return wait
+
+    async def acquire(self, chat_id: Hashable, cost: int = 1) -> None:
+        """Асинхронно дожидается, когда лимиты позволят отправить сообщение в чат, и забирает токены"""
+        while True:
+            wait = self.try_acquire(chat_id, cost)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, chat_id: Hashable, seconds: float) -> None:
+        """Приостанавливает отправку в чат на seconds секунд"""
+        with self._lock:
+            self._chat_bucket(chat_id).pause(time.monotonic() + seconds)
+
+
+def get_retry_after(exc: Exception) -> Optional[float]:
+    """Возвращает retry_after из ответа телеграмма 429 Too Many Requests или None для других ошибок"""
+    if getattr(exc, 'error_code', None) != 429:
+        return None
+
+    result_json = getattr(exc, 'result_json', None) or {}
+    return float((result_json.get('parameters') or {}).get('retry_after', 1))
+
+
+class _Send:
+    """Отложенный вызов метода бота и Future с его результатом"""
+
+    __slots__ = ('func', 'args', 'kwargs', 'cost', 'attempt', 'future')
+
+    def __init__(self, func: Callable, args: tuple, kwargs: Dict[str, Any], cost: int):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost
+        self.attempt = 0
+        self.future: Future = Future()
+
+
+class RateLimitedSender:
+    """
+    Класс RateLimitedSender. Очередь отправок, которые выполняются в отдельных потоках так быстро,
+    как позволяют лимиты телеграмма. Потоки-обработчики обновлений ставят отправки в очередь и ждут
+    выполнения, только если им нужен результат отправки (send_and_wait). Отправки одного чата выполняются
+    строго по очереди.
+    Arguments:
+        self.limits (RateLimits): лимиты отправки.
+        self._workers (int): количество потоков отправки.
+        self._pending (Dict[Hashable, Deque[_Send]]): очереди отправок по чатам.
+        self._busy (Set[Hashable]): чаты, отправка в которые выполняется сейчас.
+    """
+
+    def __init__(self, limits: RateLimits, workers: int):
+        self.limits = limits
+        self._workers = workers
+        self._pending: Dict[Hashable, Deque[_Send]] = {}
+        self._busy: Set[Hashable] = set()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def queue_depth(self) -> int:
+        """Геттер для количества отправок в очереди"""
+        with self._cond:
+            return sum(len(chat_sends) for chat_sends in self._pending.values())
+
+    def send(self, chat_id: Hashable, func: Callable, *args, cost: int = 1, **kwargs) -> Future:
+        """
+        Ставит в очередь чата вызов func(*args, **kwargs).
+        :param cost: сколько сообщений отправляет вызов (для группы фото - количество фото).
+        :return: Future с результатом вызова.
+        """
+        i_send = _Send(func, args, kwargs, cost)
+        self._start()
+        with self._cond:
+            self._pending.setdefault(chat_id, deque()).append(i_send)
+            self._cond.notify()
+        return i_send.future
+
+    def send_and_wait(self, chat_id: Hashable, func: Callable, *args, cost: int = 1, **kwargs) -> Any:
+        """
+        Ставит в очередь чата вызов func(*args, **kwargs) и дожидается его выполнения (после уже
+        поставленных в очередь отправок чата и с учетом лимитов). Возвращает результат вызова, например
+        отправленное сообщение для register_next_step_handler. Не вызывается из потоков отправки.
+        """
+        return self.send(chat_id, func, *args, cost=cost, **kwargs).result()
+
+    def stop(self) -> None:
+        """Дожидается выполнения всех отправок и останавливает потоки отправки"""
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+            threads, self._threads = self._threads, []
+            self._cond.notify_all()
+
+        for thread in threads:
+            thread.join()
+
+    def _start(self) -> None:
+        """Запускает потоки отправки (если они еще не запущены)"""
+        with self._cond:
+            if self._threads:
+                return
+            for index in range(self._workers):
+                thread = threading.Thread(target=self._work, name=f'sender-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next(self) -> Optional[tuple]:
+        """
+        Ждет, пока лимиты позволят выполнить отправку одного из чатов, и возвращает чат и отправку.
+        Возвращает None, если потоки отправки останавливаются.
+        """
+        with self._cond:
+            while True:
+                if not self._threads and not self._pending:
+                    return None
+
+                min_wait = None
+                for chat_id, chat_sends in self._pending.items():
+                    if chat_id in self._busy:
+                        continue
+
+                    wait = self.limits.try_acquire(chat_id, chat_sends[0].cost)
+                    if wait <= 0:
+                        self._busy.add(chat_id)
+                        # чат переносится в конец, чтобы чаты обслуживались по очереди
+                        self._pending[chat_id] = self._pending.pop(chat_id)
+                        return chat_id, chat_sends.popleft()
+
+                    min_wait = wait if min_wait is None else min(min_wait, wait)
+
+                self._cond.wait(timeout=min_wait)
+
+    def _work(self) -> None:
+        """Выполняет отправки из очереди"""
+        while True:
+            task = self._next()
+            if task is None:
+                return
+
+            chat_id, i_send = task
+            try:
+                i_send.future.set_result(i_send.func(*i_send.args, **i_send.kwargs))
+
+            except Exception as exc:
+                retry_after = get_retry_after(exc)
+                i_send.attempt += 1
+                log_fields = {'chat_id': chat_id, 'attempt': i_send.attempt}
+                if retry_after is not None and i_send.attempt < config.send_max_attempts:
+                    logging.warning(f'chat {chat_id}: too many requests, retry after {retry_after} s', extra=log_fields)
+                    self.limits.pause(chat_id, retry_after)
+                    with self._cond:
+                        self._pending[chat_id].appendleft(i_send)
+                else:
+                    logging.error(exc, extra=log_fields)
+                    i_send.future.set_exception(exc)
+
+            with self._cond:
+                self._busy.discard(chat_id)
+                if not self._pending[chat_id]:
+                    del self._pending[chat_id]
+                self._cond.notify_all()
+
+
+async def send_async(limits: RateLimits, chat_id: Hashable, func: Callable[..., Awaitable],
+                     *args, cost: int = 1, **kwargs) -> Any:
+    """
+    Асинхронно отправляет сообщение, дождавшись, когда это позволят лимиты телеграмма.
+    При ответе 429 ждет retry_after и повторяет отправку (не больше config.send_max_attempts раз).
+    """
+    for attempt in range(config.send_max_attempts):
+        await limits.acquire(chat_id, cost)
+        try:
+            return await func(*args, **kwargs)
+
+        except Exception as exc:
+            retry_after = get_retry_after(exc)
+            if retry_after is None or attempt + 1 == config.send_max_attempts:
+                raise
+            logging.warning(f'chat {chat_id}: too many requests, retry after {retry_after} s',
+                            extra={'chat_id': chat_id, 'attempt': attempt + 1})
+            limits.pause(chat_id, retry_after)
@@ -0,0 +1,139 @@
+import hmac
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import telebot
+from telebot import TeleBot
+
+"""
+Файл с HTTP-сервером для получения обновлений телеграмма через webhook. Полученные обновления
+складываются в ограниченную очередь и передаются тем же обработчикам бота, что и при long polling.
+
+Для локальной проверки можно отправить записанное обновление на сервер:
+    curl -X POST -H 'X-Telegram-Bot-Api-Secret-Token: <секрет>' --data @update.json http://localhost:8443/telegram
+"""
+
+_STOP = object()
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов к webhook. Проверяет путь и секретный токен и ставит обновление в очередь."""
+
+    def do_POST(self) -> None:
+        webhook: 'WebhookServer' = self.server.webhook
+
+        if self.path != webhook.path:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        secret = self.headers.get(SECRET_HEADER, '')
+        if webhook.secret_token and not hmac.compare_digest(secret, webhook.secret_token):
+            self.send_response(403)
+            self.end_headers()
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            update = telebot.types.Update.de_json(self.rfile.read(length).decode('utf-8'))
+            if update is None:
+                raise ValueError('empty update')
+
+        except (ValueError, UnicodeDecodeError, KeyError, TypeError) as exc:
+            logging.error(exc)
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        if not webhook.put(update):
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        """Отключает запись каждого запроса в stderr"""
+
+
+class WebhookServer:
+    """
+    Класс WebhookServer. HTTP-сервер, принимающий обновления телеграмма, и поток, передающий их боту.
+    Arguments:
+        self.path (str): путь, на который телеграмм отправляет обновления.
+        self.secret_token (str): секретный токен, который телеграмм передает в заголовке запроса.
+        self._bot (TeleBot): бот, обработчикам которого передаются обновления.
+        self._updates (queue.Queue): ограниченная очередь полученных обновлений.
+        self._accepting (bool): флаг. Если False, то новые обновления не принимаются (сервер останавливается).
+    """
+
+    def __init__(self, bot: TeleBot, host: str, port: int, path: str, secret_token: str, max_queue: int):
+        self.path = path
+        self.secret_token = secret_token
+        self._bot = bot
+        self._updates: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._accepting = True
+        self._server = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+        self._server.webhook = self
+        self._server_thread: Optional[threading.Thread] = None
+        self._consumer_thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Геттер для порта, на котором работает сервер"""
+        return self._server.server_address[1]
+
+    @property
+    def queue_depth(self) -> int:
+        """Геттер для количества обновлений в очереди"""
+        return self._updates.qsize()
+
+    def put(self, update: telebot.types.Update) -> bool:
+        """Ставит обновление в очередь. Возвращает False, если очередь заполнена или сервер останавливается"""
+        if not self._accepting:
+            return False
+        try:
+            self._updates.put_nowait(update)
+        except queue.Full:
+            return False
+        return True
+
+    def start(self) -> None:
+        """Запускает HTTP-сервер и поток, передающий обновления боту"""
+        self._consumer_thread = threading.Thread(target=self._consume, name='webhook-consumer', daemon=True)
+        self._consumer_thread.start()
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name='webhook-server', daemon=True)
+        self._server_thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает прием обновлений, дожидается передачи боту всех обновлений из очереди,
+        а если у бота есть ChatDispatcher - то и их обработки.
+        """
+        self._accepting = False
+        self._server.shutdown()
+        self._server.server_close()
+
+        self._updates.put(_STOP)
+        if self._consumer_thread is not None:
+            self._consumer_thread.join()
+
+        dispatcher = getattr(self._bot, 'dispatcher', None)
+        if dispatcher is not None:
+            dispatcher.stop()
+
+    def _consume(self) -> None:
+        """Передает обновления из очереди боту"""
+        while True:
+            update = self._updates.get()
+            if update is _STOP:
+                return
+            try:
+                self._bot.process_new_updates([update])
+            except Exception as exc:
+                logging.error(exc)
@@ -6,6 +6,89 @@ TOKEN = ''
 api_key_for_currency = ''
 rapidAPI_key = ''
 
+users_db_path = 'history.sqlite3'
+legacy_history_path = 'history.pickle'
+history_size = 5
+
+bot_workers = 8
+async_runtime = False
+
+webhook_url = ''
+webhook_host = '0.0.0.0'
+webhook_port = 8443
+webhook_path = '/telegram'
+webhook_secret = ''
+webhook_queue_size = 1000
+
+calendar_max_days = 365
+
+chat_state_ttl = 60 * 60
+chat_state_max_chats = 10000
+
+send_workers = 4
+send_global_rate = 30
+send_global_burst = 30
+send_chat_rate = 1
+send_chat_burst = 3
+send_group_rate = 20 / 60
+send_group_burst = 3
+send_bucket_ttl = 10 * 60
+send_max_attempts = 3
+
+greetings_cache_path = 'greetings_synonyms.json'
+greetings_refresh_interval = 7 * 24 * 60 * 60
+
+detail_workers = 8
+list_page_workers = 4
+
+best_deal_ranking = 'distance'
+ranking_price_weight = 1.0
+ranking_distance_weight = 1.0
+
+hotels_api_host = 'hotels4.p.rapidapi.com'
+hotels_api_url = f'https://{hotels_api_host}'
+currency_api_url = 'https://api.apilayer.com'
+http_pool_size = 16
+http_connect_timeout = 5
+http_read_timeout = 30
+async_http_concurrency = 64
+
+retry_max_attempts = 4
+retry_base_delay = 0.5
+retry_max_delay = 8
+retry_max_retry_after = 60
+breaker_failure_threshold = 5
+breaker_reset_timeout = 30
+request_coalescing = True
+
+list_cache_ttl = 10 * 60
+detail_cache_ttl = 24 * 60 * 60
+response_cache_size = 500
+response_cache_dir = None
+response_cache_disk_size = 5000
+
+city_cache_size = 5000
+city_cache_ttl = 24 * 60 * 60
+city_name_index = True
+city_name_index_size = 20000
+
+cities_cache_path = 'cities_pool.json'
+cities_refresh_interval = 24 * 60 * 60
+cities_refresh_pages = 3
+
+currency_rate_cache_path = 'currency_rate.json'
+currency_rate_refresh_interval = 60 * 60
+
+log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api_requests', 'logg_requests.log')
+log_level = 'INFO'
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+log_queue_size = 10000
+
+metrics_host = '127.0.0.1'
+metrics_port = 9108
+metrics_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
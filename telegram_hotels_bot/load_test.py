@@ -0,0 +1,8 @@
+import config
+from telegram_hotels_bot.benchmarks import load_test
+import sys
+
+
+"""Файл load_test. Служит для запуска нагрузочного теста бота с виртуальными пользователями (benchmarks/load_test.py)"""
+if __name__ == '__main__':
+    sys.exit(load_test.main())
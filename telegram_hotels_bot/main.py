@@ -1,5 +1,6 @@
 import config
 from telegram_hotels_bot.bot import my_bot
+from telegram_hotels_bot.utils import logs
 import telebot
 from telebot import apihelper
 import sys
@@ -9,8 +10,13 @@ import sys
 if __name__ == '__main__':
     try:
         if config.check_config():
+            logs.setup_logging()
             print('Bot is now active')
-            bot = my_bot.MyBot()
+            if config.async_runtime:
+                from telegram_hotels_bot.bot import async_my_bot
+                bot = async_my_bot.AsyncMyBot()
+            else:
+                bot = my_bot.MyBot()
             bot.start()
         else:
             raise Exception('Bad config data')
@@ -1,9 +1,69 @@
-import pickle
-from typing import List, Optional, Dict
-from datetime import datetime
+from typing import Any, Deque, Iterable, List, Optional, Dict, Tuple
+from collections import deque
+from datetime import datetime, date
+from telegram_hotels_bot import config
 from telegram_hotels_bot.api_requests.api_requests import get_converted_price
-import re
-"""Файл с классами User, Search и Hotel"""
+import json
+import pickle
+import sys
+import weakref
+"""
+Файл с классами User, Search, Hotel и Destination. Классы хранят данные в __slots__, а поиски
+сохраняются в версионированном формате JSON (dumps_search/loads_search). Объекты, сохраненные
+pickle старыми версиями классов (со словарем __dict__), загружаются через __setstate__.
+"""
+
+SERIALIZATION_VERSION = 1
+
+
+class Destination:
+    """
+    Класс Destination. Город, в котором производится поиск. Одинаковые города хранятся в одном
+    объекте (см. intern_destination), поэтому поиски одного города не дублируют его данные.
+    Arguments:
+        self.name (str): полное название города.
+        self.region_id (str): идентификационный номер региона в Hotels Api.
+        self.latitude (float): широта.
+        self.longitude (float): долгота.
+    """
+
+    __slots__ = ('name', 'region_id', 'latitude', 'longitude', '__weakref__')
+
+    def __init__(self, name: str, region_id: str, latitude: Optional[float], longitude: Optional[float]):
+        self.name = name
+        self.region_id = region_id
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def info(self) -> Dict[str, Any]:
+        """Возвращает информацию о городе в формате запросов к Hotels Api"""
+        return {'coordinates': {'latitude': self.latitude, 'longitude': self.longitude},
+                'regionId': self.region_id}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'region_id': self.region_id,
+                'latitude': self.latitude, 'longitude': self.longitude}
+
+
+_destinations: 'weakref.WeakValueDictionary[tuple, Destination]' = weakref.WeakValueDictionary()
+
+
+def intern_destination(name: str, info: Dict[str, Any]) -> Destination:
+    """
+    Возвращает объект Destination для города с названием name и информацией info
+    (в формате location_search). Для одинаковых городов возвращается один и тот же объект.
+    """
+    coordinates = info.get('coordinates') or {}
+    region_id = info.get('regionId')
+    key = (name, region_id, coordinates.get('latitude'), coordinates.get('longitude'))
+
+    destination = _destinations.get(key)
+    if destination is None:
+        destination = Destination(sys.intern(name), region_id, coordinates.get('latitude'),
+                                  coordinates.get('longitude'))
+        _destinations[key] = destination
+
+    return destination
 
 
 class User:
@@ -14,15 +74,19 @@ class User:
         self._firstname (str): имя пользователя.
         self._lastname (str): фамилия пользователя.
         self._username (str): никнейм пользователя.
-        self._searches (List[Search]): поиски пользователя.
+        self._searches (Deque[Search]): поиски пользователя: не больше config.history_size последних поисков
+        с результатами и текущий поиск (последний в очереди), у которого результатов может не быть.
     """
+
+    __slots__ = ('_user_id', '_firstname', '_lastname', '_username', '_searches')
+
     def __init__(self, user_id: Optional[int] = None, firstname: Optional[str] = None,
                  lastname: Optional[str] = None, username: Optional[str] = None):
         self._user_id = user_id
         self._firstname = firstname
         self._lastname = lastname
         self._username = username
-        self._searches = []
+        self._searches: Deque['Search'] = deque(maxlen=config.history_size + 1)
 
     def __str__(self):
         return 'user_id: {user_id}\nfirstname: {firstname}\n' \
@@ -34,6 +98,17 @@ class User:
                 searches=self.searches
                 )
 
+    def __getstate__(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Восстанавливает пользователя из pickle (в том числе сохраненного старой версией класса)"""
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        self.__init__(state.get('_user_id'), state.get('_firstname'), state.get('_lastname'),
+                      state.get('_username'))
+        self.searches = state.get('_searches') or []
+
     @property
     def user_id(self) -> int:
         """Геттер для идентификационного номера пользователя"""
@@ -55,10 +130,15 @@ class User:
         return self._username
 
     @property
-    def searches(self) -> List['Search']:
-        """Геттер для списка поисков пользователя"""
+    def searches(self) -> Deque['Search']:
+        """Геттер для очереди поисков пользователя"""
         return self._searches
 
+    @property
+    def history(self) -> List['Search']:
+        """Геттер для истории поиска: последние config.history_size поисков с результатами"""
+        return [i_search for i_search in self._searches if len(i_search.results) > 0][-config.history_size:]
+
     @user_id.setter
     def user_id(self, new_id: int) -> None:
         """Сеттер для идентификационного номера пользователя """
@@ -80,46 +160,68 @@ class User:
         self._username = new_username
 
     @searches.setter
-    def searches(self, new_searches: List['Search']) -> None:
-        self._searches = new_searches
+    def searches(self, new_searches: Iterable['Search']) -> None:
+        """
+        Сеттер для поисков пользователя. Поиски без результатов, кроме последнего (текущего),
+        отбрасываются, из остальных сохраняются только последние.
+        """
+        new_searches = list(new_searches)
+        kept_searches = [i_search for i_search in new_searches[:-1] if len(i_search.results) > 0]
+        self._searches = deque(kept_searches + new_searches[-1:], maxlen=config.history_size + 1)
+
+    def add_search(self, new_search: 'Search') -> None:
+        """
+        Добавляет поиск в конец очереди. Если последний поиск остался без результатов (был прерван
+        или ничего не нашел), то новый поиск заменяет его, а самый старый поиск вытесняется из очереди
+        при переполнении.
+        """
+        if len(self._searches) > 0 and len(self._searches[-1].results) == 0:
+            self._searches.pop()
+        self._searches.append(new_search)
 
     def clean_searches(self) -> None:
         """Удаляет поиски"""
-        self._searches = []
+        self._searches = deque(maxlen=config.history_size + 1)
 
 
 class Search:
     """
     Класс Search. Хранит переменные для создания запросов к Hotels Api.
     Arguments:
-        destination_name (str): полное название города, в котором производится поиск.
-        destination_info (Dict): информация о расположении города.
+        destination (Destination): город, в котором производится поиск.
         time_of_search (str): время поиска.
-        check_in (Dict): дата заезда в отель.
-        check_out (Dict): дата последнего дня в отеле.
+        check_in (date): дата заезда в отель.
+        check_out (date): дата последнего дня в отеле.
         people (List): данные о проживающих.
         max_items (int): количество загружаемых результатов запроса.
         type_of_search (str): тип выбранной команды.
+        summary (str): текст поиска для истории. Формируется один раз, когда поиск завершен
+        (render_summary), и сбрасывается при изменении результатов.
     """
 
-    def __init__(self, destination_name=None, destination_info=None, time_of_search=None, check_in=None,
+    __slots__ = ('_destination', '_time_of_search', '_check_in', '_check_out', '_people', '_max_items',
+                 '_type_of_search', '_price_range', '_distance_range', '_photos_amnt', '_results',
+                 '_favorite_hotel', '_search_id', '_summary')
+
+    def __init__(self, destination=None, time_of_search=None, check_in=None,
                  check_out=None, people=None, max_items=None, type_of_search=None, price_range=None,
                  distance_range=None, photos_amnt=None):
 
-        self._destination_name = destination_name
-        self._destination_info = destination_info
+        self._destination: Optional[Destination] = destination
         self._time_of_search = time_of_search
-        self._check_in = check_in
-        self._check_out = check_out
+        self._check_in: Optional[date] = check_in
+        self._check_out: Optional[date] = check_out
         self._people = people
         self._max_items = max_items
-        self._type_of_search = type_of_search
+        self._type_of_search = None
+        self.type_of_search = type_of_search
         self._price_range = price_range
         self._distance_range = distance_range
         self._photos_amnt = photos_amnt
         self._results: List['Hotel'] = []
         self._favorite_hotel: Optional['Hotel'] = None
         self._search_id = None
+        self._summary: Optional[str] = None
 
     def __str__(self):
         if len(self.results) > 0:
@@ -130,36 +232,114 @@ class Search:
 
         return '\nНомер поиска: {search_id}\nВремя поиска (UTC): {time_of_search}\n' \
                'Место поиска: {destination_name}\n' \
-               'Даты заезда: {check_in_d}/{check_in_m}/{check_in_y}\n' \
-               'Дата выезда: {check_out_d}/{check_out_m}/{check_out_y}\n' \
+               'Даты заезда: {check_in.day}/{check_in.month}/{check_in.year}\n' \
+               'Дата выезда: {check_out.day}/{check_out.month}/{check_out.year}\n' \
                'Тип поиска: {type_of_search}\n' \
                'Найденные отели:\n{results}'.format(
                 search_id=self._search_id,
                 destination_name=self.destination_name,
-                check_in_d=self.check_in['day'],
-                check_in_m=self.check_in['month'],
-                check_in_y=self.check_in['year'],
-                check_out_d=self.check_out['day'],
-                check_out_m=self.check_out['month'],
-                check_out_y=self.check_out['year'],
+                check_in=self.check_in,
+                check_out=self.check_out,
                 time_of_search=self.time_of_search,
                 results=results,
                 type_of_search=self.type_of_search
                 )
 
+    def __getstate__(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """
+        Восстанавливает поиск из pickle. Поиски, сохраненные старой версией класса, хранят город в
+        _destination_name и _destination_info, а даты - в словарях с ключами day, month и year.
+        """
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+
+        if 'version' in state:
+            self._load(state)
+            return
+
+        self.__init__()
+        for slot in self.__slots__:
+            if slot in state:
+                setattr(self, slot, state[slot])
+
+        if state.get('_destination_name') is not None:
+            self._destination = intern_destination(state['_destination_name'], state.get('_destination_info') or {})
+        self._check_in = _legacy_date(state.get('_check_in'))
+        self._check_out = _legacy_date(state.get('_check_out'))
+        self.type_of_search = self._type_of_search
+        self._results = list(self._results or [])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Возвращает данные поиска в версионированном формате для сохранения в JSON"""
+        return {
+            'version': SERIALIZATION_VERSION,
+            'search_id': self._search_id,
+            'time_of_search': self._time_of_search,
+            'destination': self._destination.to_dict() if self._destination is not None else None,
+            'check_in': self._check_in.isoformat() if self._check_in is not None else None,
+            'check_out': self._check_out.isoformat() if self._check_out is not None else None,
+            'people': self._people,
+            'max_items': self._max_items,
+            'type_of_search': self._type_of_search,
+            'price_range': self._price_range,
+            'distance_range': self._distance_range,
+            'photos_amnt': self._photos_amnt,
+            'results': [i_hotel.to_list() for i_hotel in self._results],
+            'favorite_hotel': self._favorite_hotel.to_list() if self._favorite_hotel is not None else None,
+            'summary': self._summary,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Search':
+        """Создает поиск из данных, сохраненных методом to_dict"""
+        new_search = cls.__new__(cls)
+        new_search._load(data)
+        return new_search
+
+    def _load(self, data: Dict[str, Any]) -> None:
+        """Заполняет поиск данными, сохраненными методом to_dict"""
+        if data['version'] > SERIALIZATION_VERSION:
+            raise ValueError(f'unsupported search format version {data["version"]}')
+
+        destination = data.get('destination')
+        if destination is not None:
+            destination = intern_destination(destination['name'], {
+                'regionId': destination['region_id'],
+                'coordinates': {'latitude': destination['latitude'], 'longitude': destination['longitude']}
+            })
+
+        self.__init__(destination=destination, time_of_search=data.get('time_of_search'),
+                      check_in=_iso_date(data.get('check_in')), check_out=_iso_date(data.get('check_out')),
+                      people=data.get('people'), max_items=data.get('max_items'),
+                      type_of_search=data.get('type_of_search'), price_range=data.get('price_range'),
+                      distance_range=data.get('distance_range'), photos_amnt=data.get('photos_amnt'))
+        self._search_id = data.get('search_id')
+        self._results = [Hotel.from_list(i_hotel) for i_hotel in data.get('results') or []]
+        favorite_hotel = data.get('favorite_hotel')
+        self._favorite_hotel = Hotel.from_list(favorite_hotel) if favorite_hotel is not None else None
+        self._summary = data.get('summary')
+
     @property
-    def destination_name(self) -> str:
+    def destination(self) -> Optional[Destination]:
+        """Геттер для города, в котором производится поиск."""
+        return self._destination
+
+    @property
+    def destination_name(self) -> Optional[str]:
         """Геттер для полного названия города, в котором производится поиск."""
-        return self._destination_name
+        return self._destination.name if self._destination is not None else None
 
     @property
     def search_id(self):
         return self._search_id
 
     @property
-    def destination_info(self) -> Dict[str, Dict[str, float]]:
-        """Геттер для информации о городе, в котором производится поиск."""
-        return self._destination_info
+    def destination_info(self) -> Optional[Dict[str, Any]]:
+        """Геттер для информации о городе в формате запросов к Hotels Api."""
+        return self._destination.info() if self._destination is not None else None
 
     @property
     def time_of_search(self) -> str:
@@ -167,12 +347,12 @@ class Search:
         return self._time_of_search
 
     @property
-    def check_in(self) -> Dict[str, int]:
+    def check_in(self) -> date:
         """Геттер для даты заезда в отель"""
         return self._check_in
 
     @property
-    def check_out(self) -> Dict[str, int]:
+    def check_out(self) -> date:
         """Геттер для даты последнего дня в отеле"""
         return self._check_out
 
@@ -216,15 +396,27 @@ class Search:
         """Геттер для количества фото"""
         return self._photos_amnt
 
-    @destination_name.setter
-    def destination_name(self, new_destination: str) -> None:
-        """Сеттер для полного названия города, в котором производится поиск."""
-        self._destination_name = new_destination
-
-    @destination_info.setter
-    def destination_info(self, new_destination_info: Dict[str, Dict[str, float]]) -> None:
-        """Сеттер для информации о городе, в котором производится поиск."""
-        self._destination_info = new_destination_info
+    @property
+    def summary(self) -> str:
+        """
+        Геттер для текста поиска в истории. Если текст еще не сформирован (поиски, сохраненные
+        старыми версиями), то формирует его.
+        """
+        if self._summary is None:
+            self.render_summary()
+        return self._summary
+
+    def render_summary(self) -> None:
+        """
+        Формирует текст поиска для истории. Вызывается, когда поиск завершен: цены отелей
+        переводятся в рубли здесь, а не при каждом показе истории.
+        """
+        self._summary = str(self)
+
+    @destination.setter
+    def destination(self, new_destination: Destination) -> None:
+        """Сеттер для города, в котором производится поиск."""
+        self._destination = new_destination
 
     @time_of_search.setter
     def time_of_search(self, new_time_of_search: str) -> None:
@@ -238,12 +430,12 @@ class Search:
         self._search_id = new_id
 
     @check_in.setter
-    def check_in(self, new_check_in: Dict[str, int]) -> None:
+    def check_in(self, new_check_in: date) -> None:
         """Сеттер для даты заезда в отель"""
         self._check_in = new_check_in
 
     @check_out.setter
-    def check_out(self, new_check_out: Dict[str, int]) -> None:
+    def check_out(self, new_check_out: date) -> None:
         """Сеттер для даты последнего дня в отеле."""
         self._check_out = new_check_out
 
@@ -259,8 +451,8 @@ class Search:
 
     @type_of_search.setter
     def type_of_search(self, new_type: str) -> None:
-        """Сеттер для типа команды."""
-        self._type_of_search = new_type
+        """Сеттер для типа команды (названия команд хранятся в одном экземпляре строки)."""
+        self._type_of_search = sys.intern(new_type) if new_type is not None else None
 
     @price_range.setter
     def price_range(self, new_range: Dict[str, int]) -> None:
@@ -274,8 +466,9 @@ class Search:
 
     @results.setter
     def results(self, new_results: List['Hotel']) -> None:
-        """Сеттер для результатов поиска"""
+        """Сеттер для результатов поиска. Сбрасывает сформированный текст поиска"""
         self._results = new_results
+        self._summary = None
 
     @favorite_hotel.setter
     def favorite_hotel(self, new_hotel: 'Hotel') -> None:
@@ -288,8 +481,7 @@ class Search:
         self._photos_amnt = new_photos_amnt
 
     def update_search(self):
-        new_search = Search(destination_name=self.destination_name,
-                            destination_info=self.destination_info,
+        new_search = Search(destination=self.destination,
                             check_in=self.check_in,
                             check_out=self.check_out,
                             people=self.people,
@@ -310,13 +502,16 @@ class Hotel:
         price_per_night (float): цена отеля за ночь.
         distance_from_destination (float): расстояние до центра.
     """
-    def __init__(self, name=None, hotel_id=None, price_per_night=None, distance_from_destination=None): #total_price=None):
+
+    __slots__ = ('_name', '_hotel_id', '_price_per_night', '_distance_from_destination', '_address', '_photos_url')
+
+    def __init__(self, name=None, hotel_id=None, price_per_night=None, distance_from_destination=None):
         self._name = name
         self._hotel_id = hotel_id
         self._price_per_night = price_per_night
         self._distance_from_destination = distance_from_destination
         self._address: Optional[str] = None
-        self._photos_url: Optional[List[Dict[str, str]]] = None
+        self._photos_url: Tuple[str, ...] = ()
 
     def __str__(self):
 
@@ -335,6 +530,34 @@ class Hotel:
 
         return result_text
 
+    def __getstate__(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Восстанавливает отель из pickle (в том числе сохраненного старой версией класса)"""
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        self.__init__(state.get('_name'), state.get('_hotel_id'), state.get('_price_per_night'),
+                      state.get('_distance_from_destination'))
+        self._address = state.get('_address')
+        self.photos_url = state.get('_photos_url')
+
+    def to_list(self) -> List[Any]:
+        """
+        Возвращает данные отеля для сохранения в истории поиска. Ссылки на фото нужны только для отправки
+        результатов и не сохраняются.
+        """
+        return [self._hotel_id, self._name, self._price_per_night, self._distance_from_destination, self._address]
+
+    @classmethod
+    def from_list(cls, data: List[Any]) -> 'Hotel':
+        """Создает отель из данных, сохраненных методом to_list"""
+        hotel_id, name, price_per_night, distance_from_destination, address = data
+        new_hotel = cls(name=name, hotel_id=hotel_id, price_per_night=price_per_night,
+                        distance_from_destination=distance_from_destination)
+        new_hotel._address = address
+        return new_hotel
+
     @property
     def name(self) -> str:
         """Геттер для названия отеля."""
@@ -356,8 +579,8 @@ class Hotel:
         return self._address
 
     @property
-    def photos_url(self) -> List[Dict[str, str]]:
-        """Геттер для списка словарей со ссылками фото."""
+    def photos_url(self) -> Tuple[str, ...]:
+        """Геттер для ссылок на фото."""
         return self._photos_url
 
     @property
@@ -387,9 +610,9 @@ class Hotel:
         self._address = new_address
 
     @photos_url.setter
-    def photos_url(self, new_photos: List[Dict[str, str]]) -> None:
-        """Сеттер для списка словарей со ссылками фото."""
-        self._photos_url = new_photos
+    def photos_url(self, new_photos: Optional[List[str]]) -> None:
+        """Сеттер для ссылок на фото."""
+        self._photos_url = tuple(new_photos or ())
 
     @distance_from_destination.setter
     def distance_from_destination(self, new_distance: float) -> None:
@@ -397,6 +620,30 @@ class Hotel:
         self._distance_from_destination = new_distance
 
 
+def _iso_date(value: Optional[str]) -> Optional[date]:
+    """Преобразует дату в формате ISO (YYYY-MM-DD) в date"""
+    return date.fromisoformat(value) if value is not None else None
+
+
+def _legacy_date(value: Any) -> Optional[date]:
+    """Преобразует дату старого формата (словарь с ключами day, month и year) в date"""
+    if isinstance(value, dict):
+        return date(value['year'], value['month'], value['day'])
+    return value
+
+
+def dumps_search(cur_search: 'Search') -> bytes:
+    """Сериализует поиск в JSON (формат версии SERIALIZATION_VERSION)"""
+    return json.dumps(cur_search.to_dict(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_search(data: bytes) -> 'Search':
+    """Загружает поиск, сохраненный dumps_search или (в старых версиях) pickle"""
+    if data[:1] == b'{':
+        return Search.from_dict(json.loads(data.decode('utf-8')))
+    return pickle.loads(data)
+
+
 def hotels_from_dict(hotels_dict: Dict[str, int]) -> List['Hotel']:
     """
     Формирует список с объектами класса Hotel из словаря с именем и идентификационным
@@ -409,26 +656,3 @@ def hotels_from_dict(hotels_dict: Dict[str, int]) -> List['Hotel']:
         hotels.append(new_hotel)
 
     return hotels
-
-
-def find_user(user_id: int) -> 'User':
-    """Находит текущего пользователя по его идентификационному номеру."""
-    with open('history.pickle', 'rb') as history:
-        users = pickle.load(history)
-
-    return users.get(user_id, None)
-
-
-def save_users(user: 'User') -> None:
-    """Сохраняет данные текущего пользователя в формате pickle."""
-    with open('history.pickle', 'rb') as history:
-        users = pickle.load(history)
-
-    for user_id, i_user in users.items():
-        if user_id == user.user_id:
-            users[user_id] = user
-
-    with open('history.pickle', 'wb') as history:
-        pickle.dump(users, history)
-
-
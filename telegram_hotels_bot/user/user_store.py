@@ -0,0 +1,170 @@
+import os
+import pickle
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+from telegram_hotels_bot.user import user
+from telegram_hotels_bot import config
+from telegram_hotels_bot.utils import metrics
+
+"""
+Файл с хранилищем пользователей. Каждая операция читает и записывает только строки одного
+пользователя, а не весь файл истории целиком.
+"""
+
+
+class UserStore(ABC):
+    """
+    Базовый класс хранилища пользователей. Определяет интерфейс, который должны реализовать
+    конкретные хранилища.
+    """
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional['user.User']:
+        """Возвращает пользователя по его идентификационному номеру или None."""
+
+    @abstractmethod
+    def save_user(self, cur_user: 'user.User') -> None:
+        """Сохраняет данные пользователя и его поиски."""
+
+    def close(self) -> None:
+        """Закрывает соединения с хранилищем."""
+
+
+class SQLiteUserStore(UserStore):
+    """
+    Хранилище пользователей в базе SQLite (режим WAL). Поиски хранятся в формате user.dumps_search,
+    строки, записанные старыми версиями в pickle, по-прежнему читаются.
+    Arguments:
+        self._path (str): путь к файлу базы данных.
+        self._local (threading.local): соединения с базой, отдельные для каждого потока.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        self._create_tables()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Возвращает соединение с базой для текущего потока, при необходимости создает его."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        return connection
+
+    def _create_tables(self) -> None:
+        """Создает таблицы users и searches, если их еще нет."""
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS users ('
+                'user_id INTEGER PRIMARY KEY, '
+                'firstname TEXT, '
+                'lastname TEXT, '
+                'username TEXT)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS searches ('
+                'user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE, '
+                'position INTEGER NOT NULL, '
+                'search_id TEXT, '
+                'data BLOB NOT NULL, '
+                'PRIMARY KEY (user_id, position)) WITHOUT ROWID'
+            )
+
+    def get_user(self, user_id: int) -> Optional['user.User']:
+        connection = self._connection()
+        row = connection.execute('SELECT firstname, lastname, username FROM users WHERE user_id = ?',
+                                 (user_id,)).fetchone()
+        if row is None:
+            return None
+
+        firstname, lastname, username = row
+        cur_user = user.User(user_id=user_id, firstname=firstname, lastname=lastname, username=username)
+        rows = connection.execute('SELECT data FROM searches WHERE user_id = ? ORDER BY position',
+                                  (user_id,))
+        cur_user.searches = [user.loads_search(data) for data, in rows]
+        return cur_user
+
+    def save_user(self, cur_user: 'user.User') -> None:
+        searches = [(cur_user.user_id, position, i_search.search_id, user.dumps_search(i_search))
+                    for position, i_search in enumerate(cur_user.searches)]
+
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT INTO users (user_id, firstname, lastname, username) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET firstname = excluded.firstname, '
+                'lastname = excluded.lastname, username = excluded.username',
+                (cur_user.user_id, cur_user.firstname, cur_user.lastname, cur_user.username)
+            )
+            connection.execute('DELETE FROM searches WHERE user_id = ?', (cur_user.user_id,))
+            connection.executemany(
+                'INSERT INTO searches (user_id, position, search_id, data) VALUES (?, ?, ?, ?)', searches
+            )
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def migrate_from_pickle(pickle_path: str, store: 'UserStore') -> int:
+    """
+    Переносит пользователей из старого файла history.pickle в хранилище и переименовывает
+    файл, чтобы миграция не выполнялась повторно. Возвращает количество перенесенных пользователей.
+    """
+    with open(pickle_path, 'rb') as history:
+        all_users = pickle.load(history)
+
+    for i_user in all_users.values():
+        store.save_user(i_user)
+
+    os.replace(pickle_path, f'{pickle_path}.migrated')
+    return len(all_users)
+
+
+_store: Optional['UserStore'] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> 'UserStore':
+    """
+    Возвращает текущее хранилище пользователей. При первом обращении создает SQLiteUserStore
+    и переносит в него данные из history.pickle, если такой файл остался.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = SQLiteUserStore(config.users_db_path)
+                if os.path.isfile(config.legacy_history_path):
+                    with metrics.STORE_DURATION.time(operation='migrate_pickle'):
+                        migrate_from_pickle(config.legacy_history_path, store)
+                _store = store
+    return _store
+
+
+def set_store(store: 'UserStore') -> None:
+    """Заменяет текущее хранилище пользователей (например, на другую реализацию UserStore)."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def find_user(user_id: int) -> Optional['user.User']:
+    """Находит текущего пользователя по его идентификационному номеру."""
+    store = get_store()
+    with metrics.STORE_DURATION.time(operation='get_user'):
+        return store.get_user(user_id)
+
+
+def save_user(cur_user: 'user.User') -> None:
+    """Сохраняет данные текущего пользователя."""
+    store = get_store()
+    with metrics.STORE_DURATION.time(operation='save_user'):
+        store.save_user(cur_user)
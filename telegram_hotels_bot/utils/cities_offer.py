@@ -1,26 +1,61 @@
 import bs4
 import requests
 import random
-import re
-import string
+from typing import Iterable, List, Tuple
+from telegram_hotels_bot import config
+from telegram_hotels_bot.utils import refreshing_cache
 
+"""
+Файл с функцией random_city, которая предлагает пользователю город для примера. Города загружаются
+с unipage.net в фоновом потоке и сохраняются в файл, поэтому запуск бота не ждет ответа сайта.
+"""
 
-page = random.randint(1, 100)
+BUNDLED_CITIES = ('Малага', 'Барселона', 'Мадрид', 'Рим', 'Милан', 'Венеция', 'Париж', 'Ницца', 'Прага',
+                  'Вена', 'Будапешт', 'Берлин', 'Мюнхен', 'Амстердам', 'Лиссабон', 'Порту', 'Афины',
+                  'Стамбул', 'Дубай', 'Лондон', 'Эдинбург', 'Дублин', 'Копенгаген', 'Стокгольм', 'Хельсинки')
 
-url = f'https://www.unipage.net/ru/cities?page={page}&per-page=100'
 
-response = requests.get(url)
+def fetch_cities(page: int) -> List[str]:
+    """Загружает список городов с одной страницы unipage.net"""
+    url = f'https://www.unipage.net/ru/cities?page={page}&per-page=100'
 
-data = response.text
+    response = requests.get(url, timeout=10)
 
-soup = bs4.BeautifulSoup(data, 'lxml')
+    soup = bs4.BeautifulSoup(response.text, 'lxml')
 
-divs = soup.find_all('div', {'class': 'generated-card-header__row'})
+    divs = soup.find_all('div', {'class': 'generated-card-header__row'})
 
-foreign_cities = [div.text.split(', ')[1] for div in divs]
+    return [div.text.split(', ')[1] for div in divs if ', ' in div.text]
 
 
-def random_city():
-    if len(foreign_cities) > 0:
-        return random.choice(foreign_cities)
-    return 'Малага'
+def fetch_city_pool() -> List[str]:
+    """Загружает города с нескольких случайных страниц unipage.net"""
+    cities = set()
+    for page in random.sample(range(1, 101), config.cities_refresh_pages):
+        cities.update(fetch_cities(page))
+
+    if len(cities) == 0:
+        raise ValueError('no cities found')
+
+    return sorted(cities)
+
+
+def parse_cities(cities: Iterable[str]) -> Tuple[str, ...]:
+    """Проверяет сохраненный список городов: пустой список считается поврежденным"""
+    cities = tuple(cities)
+    if len(cities) == 0:
+        raise ValueError('no cities found')
+    return cities
+
+
+_cities = refreshing_cache.RefreshingFileCache(config.cities_cache_path, 'cities', config.cities_refresh_interval,
+                                               fetch=fetch_city_pool, parse=parse_cities,
+                                               default=list(BUNDLED_CITIES), thread_name='cities')
+
+
+def random_city() -> str:
+    """
+    Возвращает случайный город. При первом вызове берет города из файла кэша (или встроенного списка),
+    а если они устарели, то обновляет их в фоновом потоке.
+    """
+    return random.choice(_cities.get())
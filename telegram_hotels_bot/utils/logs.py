@@ -0,0 +1,189 @@
+import atexit
+import contextvars
+import copy
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional
+from telegram_hotels_bot import config
+from telegram_hotels_bot.utils import metrics
+
+"""
+Файл с настройкой логов бота. Записи всех логгеров передаются через ограниченную очередь
+в отдельный поток (QueueHandler и QueueListener), который пишет их в файл в формате JSON
+(одна запись в строке) и ротирует файл по размеру. Потоки обработчиков только кладут запись
+в очередь: если очередь заполнена, запись отбрасывается, а не задерживает ответ пользователю.
+
+К записям добавляются поля контекста (chat_id, search_id, endpoint, status, duration, attempt): заданные
+в bind для текущего обработчика или переданные в extra при записи.
+"""
+
+CONTEXT_FIELDS = ('chat_id', 'search_id', 'endpoint', 'status', 'duration', 'attempt')
+
+_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+
+
+@contextmanager
+def bind(**fields) -> Iterator[None]:
+    """Добавляет поля fields ко всем записям логов внутри блока with (в текущем потоке или задаче asyncio)"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def in_context(function: Callable) -> Callable:
+    """
+    Возвращает функцию, которая выполняет function с полями логов текущего потока. Используется
+    для задач, которые передаются в ThreadPoolExecutor.
+    """
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def chat_id_of(update_content: Any) -> Optional[int]:
+    """Возвращает идентификационный номер чата сообщения или коллбэка"""
+    message = getattr(update_content, 'message', None) or update_content
+    chat = getattr(message, 'chat', None)
+    return None if chat is None else chat.id
+
+
+def bind_handlers(bot) -> None:
+    """
+    Оборачивает асинхронные обработчики сообщений и коллбэков бота (AsyncTeleBot), чтобы записи логов
+    внутри них содержали chat_id. Обработчики DispatchingTeleBot получают chat_id в ChatDispatcher.
+    """
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            function = handler['function']
+
+            @functools.wraps(function)
+            async def wrapper(update_content, *args, _function=function, **kwargs):
+                with bind(chat_id=chat_id_of(update_content)):
+                    return await _function(update_content, *args, **kwargs)
+
+            handler['function'] = wrapper
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи поля контекста, заданные в bind"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in _context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как объект JSON в одну строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Класс NonBlockingQueueHandler. QueueHandler, который не ждет места в ограниченной очереди:
+    если очередь заполнена, запись отбрасывается и учитывается в метрике LOG_RECORDS_DROPPED.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Подставляет аргументы в сообщение и форматирует исключение, чтобы запись можно было
+        передать в другой поток. Поля контекста сохраняются для JsonFormatter.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """QueueListener, который при остановке ждет места в очереди для сигнала остановки"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+_listener: Optional['DrainingQueueListener'] = None
+_queue_handler: Optional['NonBlockingQueueHandler'] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(path: Optional[str] = None) -> None:
+    """
+    Направляет записи корневого логгера через очередь в файл path (по умолчанию config.log_path)
+    в формате JSON с ротацией по размеру (config.log_max_bytes, config.log_backup_count).
+    Повторный вызов ничего не меняет.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        path = os.path.abspath(path or config.log_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=config.log_max_bytes,
+                                                            backupCount=config.log_backup_count,
+                                                            encoding='utf-8', delay=True)
+        file_handler.setFormatter(JsonFormatter())
+
+        records: queue.Queue = queue.Queue(maxsize=config.log_queue_size)
+        _queue_handler = NonBlockingQueueHandler(records)
+        _queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.setLevel(config.log_level)
+        root.addHandler(_queue_handler)
+
+        _listener = DrainingQueueListener(records, file_handler)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Дописывает в файл записи, оставшиеся в очереди, и останавливает поток записи"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            return
+
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
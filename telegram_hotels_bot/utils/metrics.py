@@ -0,0 +1,376 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from telegram_hotels_bot import config
+
+"""
+Файл с метриками бота: время работы обработчиков, запросов к API и хранилища пользователей,
+попадания в кэши. Метрики отдаются в текстовом формате Prometheus HTTP-сервером MetricsServer:
+    curl http://127.0.0.1:9108/metrics
+"""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def escape_label(value: str) -> str:
+    """Экранирует значение метки для текстового формата Prometheus"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Формирует метки сэмпла: {name="value",...} или пустую строку"""
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def format_value(value: float) -> str:
+    """Формирует значение сэмпла (целые числа без дробной части)"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """
+    Базовый класс метрики с метками.
+    Arguments:
+        self.name (str): название метрики.
+        self.documentation (str): описание метрики (строка HELP).
+        self.labelnames (Tuple[str, ...]): названия меток.
+    """
+
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, object]) -> LabelValues:
+        """Возвращает значения меток в порядке labelnames"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: expected labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Возвращает строки метрики в текстовом формате Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Возвращает строки значений метрики (без HELP и TYPE)"""
+
+
+class Counter(Metric):
+    """Класс Counter. Счетчик, значение которого только растет"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """Увеличивает счетчик с метками labels на amount"""
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """Задает значение счетчика, который ведется в другом месте (см. Registry.on_collect)"""
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels) -> float:
+        """Возвращает значение счетчика с метками labels"""
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0.0)]
+        return [f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}' for key, value in values]
+
+
+class Gauge(Counter):
+    """Класс Gauge. Текущее значение (например, длина очереди)"""
+
+    type_name = 'gauge'
+
+
+class Histogram(Metric):
+    """
+    Класс Histogram. Распределение значений (времени выполнения) по корзинам.
+    Arguments:
+        self.buckets (Tuple[float, ...]): верхние границы корзин по возрастанию.
+        self._values (Dict[LabelValues, list]): количество значений в каждой корзине, их сумма и количество.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Optional[Sequence[float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets or config.metrics_buckets))
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Добавляет значение value в распределение с метками labels"""
+        key = self._label_values(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Измеряет время выполнения блока with и добавляет его в распределение"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        """Возвращает количество значений с метками labels"""
+        with self._lock:
+            entry = self._values.get(self._label_values(labels))
+        return 0 if entry is None else entry[2]
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+
+        lines = []
+        bucket_labels = self.labelnames + ('le',)
+        for key, (bucket_counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(bucket_labels, key + (format_value(bound),))} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(bucket_labels, key + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    """
+    Класс Registry. Набор метрик, которые отдает MetricsServer.
+    Arguments:
+        self._metrics (Dict[str, Metric]): метрики по названиям.
+        self._collectors (List[Callable[[], None]]): функции, обновляющие метрики перед выводом.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Добавляет метрику. Метрика с тем же названием заменяется"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def on_collect(self, collector: Callable[[], None]) -> None:
+        """Добавляет функцию, которая вызывается перед каждым выводом метрик"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as exc:
+                logging.error(exc)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_DURATION = REGISTRY.register(Histogram(
+    'hotels_bot_handler_duration_seconds', 'Time spent in bot update handlers.', ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'hotels_bot_handler_errors_total', 'Bot update handlers that raised an exception.', ('handler',)))
+UPSTREAM_DURATION = REGISTRY.register(Histogram(
+    'hotels_bot_upstream_request_duration_seconds',
+    'Time of API calls including retries, by final status and number of retries.',
+    ('endpoint', 'status', 'retries')))
+UPSTREAM_EVENTS = REGISTRY.register(Counter(
+    'hotels_bot_upstream_events_total', 'API request attempts, retries, failures and circuit breaker events.',
+    ('endpoint', 'event')))
+UPSTREAM_COALESCED = REGISTRY.register(Counter(
+    'hotels_bot_upstream_coalesced_total', 'API calls that shared the result of an identical in-flight call.',
+    ('endpoint',)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'hotels_bot_cache_requests_total', 'Cache lookups by cache and result (hit or miss).', ('cache', 'result')))
+STORE_DURATION = REGISTRY.register(Histogram(
+    'hotels_bot_store_duration_seconds', 'Time of user store reads and writes.', ('operation',)))
+DISPATCHER_QUEUE = REGISTRY.register(Gauge(
+    'hotels_bot_update_queue_depth', 'Updates waiting to be handled.'))
+SENDER_QUEUE = REGISTRY.register(Gauge(
+    'hotels_bot_send_queue_depth', 'Messages waiting to be sent to Telegram.'))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    'hotels_bot_log_records_dropped_total', 'Log records dropped because the log queue was full.'))
+
+
+def count_cache(cache: str, hit: bool) -> None:
+    """Отмечает попадание (hit) или промах в кэш cache"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def observe_upstream(endpoint: str, status: str, retries: int, duration: float) -> None:
+    """Добавляет время запроса к эндпоинту API с итоговым статусом status и количеством повторов retries"""
+    UPSTREAM_DURATION.observe(duration, endpoint=endpoint, status=status, retries=retries)
+
+
+def timed_handler(name: str, function: Callable) -> Callable:
+    """
+    Оборачивает обработчик бота, чтобы измерять время его работы (HANDLER_DURATION)
+    и считать исключения (HANDLER_ERRORS). Поддерживает и асинхронные обработчики.
+    """
+    if getattr(function, '__metrics_name__', None) is not None:
+        return function
+
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name)
+                raise
+            finally:
+                HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name)
+                raise
+            finally:
+                HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+
+    wrapper.__metrics_name__ = name
+    return wrapper
+
+
+def instrument_handlers(bot) -> None:
+    """
+    Оборачивает timed_handler все обработчики сообщений и коллбэков, зарегистрированные в боте
+    (TeleBot или AsyncTeleBot). Метка handler - имя функции обработчика.
+    """
+    for handlers in (bot.message_handlers, bot.callback_query_handlers):
+        for handler in handlers:
+            function = handler['function']
+            handler['function'] = timed_handler(function.__name__, function)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов к MetricsServer. Отдает метрики по пути /metrics"""
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        data = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        """Отключает запись каждого запроса в stderr"""
+
+
+class MetricsServer:
+    """
+    Класс MetricsServer. HTTP-сервер, отдающий метрики registry в текстовом формате Prometheus.
+    Arguments:
+        self._server (ThreadingHTTPServer): HTTP-сервер.
+        self._thread (Optional[threading.Thread]): поток, в котором работает сервер.
+    """
+
+    def __init__(self, host: str, port: int, registry: 'Registry' = REGISTRY):
+        self._server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Геттер для порта, на котором работает сервер"""
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        """Запускает сервер в отдельном потоке"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает сервер"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_server() -> Optional['MetricsServer']:
+    """
+    Запускает MetricsServer на config.metrics_host:config.metrics_port. Возвращает None, если
+    метрики отключены (metrics_port равен None) или порт занят.
+    """
+    if config.metrics_port is None:
+        return None
+
+    try:
+        server = MetricsServer(config.metrics_host, config.metrics_port)
+    except OSError as exc:
+        logging.error(f'metrics server: {exc}')
+        return None
+
+    server.start()
+    return server
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Optional
+from telegram_hotels_bot.utils import metrics
+
+"""
+Файл с кэшем значения, которое загружается по сети и сохраняется в файл (курс валют, города для примера,
+синонимы приветствия). Устаревшее значение обновляется в фоновом потоке, не задерживая обработку сообщений.
+"""
+
+RETRY_AFTER_ERROR = 10 * 60
+
+
+class RefreshingFileCache:
+    """
+    Класс RefreshingFileCache. Хранит значение, загружаемое функцией fetch, и обновляет его не чаще, чем раз
+    в refresh_interval секунд. Последнее загруженное значение сохраняется в файл (через временный файл
+    и os.replace, поэтому файл никогда не бывает записан наполовину), чтобы использоваться после
+    перезапуска бота, и остается в силе, если загрузить новое не удалось. Устаревшее значение обновляется
+    в фоновом потоке, а до его обновления возвращается прежнее. Ждать загрузки приходится, только пока
+    значения нет ни в памяти, ни в файле и не задано значение default.
+    Arguments:
+        self._path (str): путь к файлу с сохраненным значением.
+        self._field (str): ключ значения в файле.
+        self._refresh_interval (float): интервал обновления значения в секундах.
+        self._fetch (Callable[[], Any]): загружает значение в формате файла. None или исключение - неудача,
+        следующая попытка будет через retry_after_error секунд.
+        self._parse (Callable[[Any], Any]): превращает значение из файла в значение, которое возвращает get.
+        ValueError, KeyError или TypeError означают, что значение повреждено.
+        self._default (Any): значение в формате файла, которое используется, пока значение не загружено.
+        self._retry_after_error (float): через сколько секунд повторить загрузку после неудачи.
+        self._cache_name (Optional[str]): название кэша в метриках попаданий (metrics.count_cache).
+        self._thread_name (str): название потока фонового обновления.
+        self._value (Any): текущее значение или None, если его еще нет.
+        self._fetched_at (float): время загрузки текущего значения.
+        self._refreshing (bool): запущено ли фоновое обновление.
+    """
+
+    def __init__(self, path: str, field: str, refresh_interval: float, fetch: Callable[[], Any],
+                 parse: Callable[[Any], Any] = lambda raw: raw, default: Any = None,
+                 retry_after_error: float = RETRY_AFTER_ERROR, cache_name: Optional[str] = None,
+                 thread_name: str = 'cache-refresh'):
+        self._path = path
+        self._field = field
+        self._refresh_interval = refresh_interval
+        self._fetch = fetch
+        self._parse = parse
+        self._default = default
+        self._retry_after_error = retry_after_error
+        self._cache_name = cache_name
+        self._thread_name = thread_name
+        self._value: Any = None
+        self._fetched_at = 0.0
+        self._loaded = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def get(self) -> Any:
+        """Возвращает значение, при необходимости обновляя его"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+            is_fresh = self._is_fresh()
+            if self._cache_name is not None:
+                metrics.count_cache(self._cache_name, hit=is_fresh)
+            if is_fresh:
+                return self._value
+
+            if self._value is not None:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, name=self._thread_name, daemon=True).start()
+                return self._value
+
+        with self._fetch_lock:
+            with self._lock:
+                if self._is_fresh():
+                    return self._value
+            self._update()
+
+        with self._lock:
+            return self._value
+
+    def _is_fresh(self) -> bool:
+        """Проверяет, не пора ли обновить значение (вызывается под self._lock)"""
+        return time.time() - self._fetched_at <= self._refresh_interval
+
+    def _refresh(self) -> None:
+        """Обновляет значение в фоновом потоке"""
+        try:
+            with self._fetch_lock:
+                self._update()
+
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _update(self) -> None:
+        """Загружает значение без блокировки self._lock и сохраняет его (вызывается под self._fetch_lock)"""
+        try:
+            raw = self._fetch()
+            value = None if raw is None else self._parse(raw)
+
+        except Exception as exc:
+            logging.error(f'{self._path}: {exc!r}')
+            value = None
+
+        with self._lock:
+            if value is None:
+                self._fetched_at = time.time() - self._refresh_interval + self._retry_after_error
+                return
+
+            self._value = value
+            self._fetched_at = time.time()
+            fetched_at = self._fetched_at
+
+        self._save(raw, fetched_at)
+
+    def _load(self) -> None:
+        """Читает сохраненное значение из файла, а если его нет или оно повреждено, берет default"""
+        self._loaded = True
+        try:
+            with open(self._path, 'r', encoding='utf-8') as cache_file:
+                saved = json.load(cache_file)
+            self._value = self._parse(saved[self._field])
+            self._fetched_at = float(saved['fetched_at'])
+            return
+
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        if self._default is not None:
+            self._value = self._parse(self._default)
+            self._fetched_at = 0.0
+
+    def _save(self, raw: Any, fetched_at: float) -> None:
+        """Сохраняет значение в файл через временный файл в той же папке"""
+        directory, name = os.path.split(os.path.abspath(self._path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{name}.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as cache_file:
+                    json.dump({self._field: raw, 'fetched_at': fetched_at}, cache_file, ensure_ascii=False)
+                os.replace(tmp_path, self._path)
+
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        except OSError as exc:
+            logging.error(exc)
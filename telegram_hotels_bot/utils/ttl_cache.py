@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+"""Файл с потокобезопасным LRU-кэшем, записи которого устаревают по истечении времени жизни (TTL)."""
+
+
+class TTLCache:
+    """
+    Класс TTLCache. Хранит ограниченное количество записей, вытесняя давно не использованные (LRU),
+    и удаляет записи, время жизни которых истекло.
+    Arguments:
+        self._maxsize (int): максимальное количество записей.
+        self._ttl (float): время жизни записи в секундах.
+        self._sliding (bool): если True, то время жизни записи отсчитывается заново при каждом обращении к ней.
+        self._data (OrderedDict): записи в порядке от давно использованных к недавно использованным.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, sliding: bool = False):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._sliding = sliding
+        self._data: 'OrderedDict[Hashable, list]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Возвращает значение по ключу или default, если записи нет или она устарела."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            if entry[0] <= now:
+                del self._data[key]
+                return default
+
+            if self._sliding:
+                entry[0] = now + self._ttl
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохраняет значение по ключу. Если записей больше maxsize, вытесняет самые старые."""
+        now = time.monotonic()
+        expires_at = now + (self._ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = [expires_at, value]
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Удаляет запись и возвращает ее значение или default."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        """Удаляет все записи."""
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self, now: float) -> None:
+        """Удаляет лишние записи с начала очереди, а также устаревшие, если TTL скользящий."""
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+        if self._sliding:
+            while self._data:
+                key, entry = next(iter(self._data.items()))
+                if entry[0] > now:
+                    break
+                del self._data[key]